@@ -1,30 +1,176 @@
 from datetime import datetime, date, timedelta
-import re
-from flask import Flask, flash, redirect, render_template, request, Response, url_for
-from sqlalchemy import func, or_
-
+import io
+import click
+from flask import Flask, flash, jsonify, redirect, render_template, request, Response, stream_with_context, url_for
+from sqlalchemy import select
+
+from .api import init_api
+from .archive import AppointmentArchiver, ArchiveService
+from .branches import BranchDashboardService, init_branches
+from .client_import import EMAIL_RE, ClientImportService, parse_age
 from .config import Config
-from .db import init_engine, get_session, close_session
-from .models import Base, Client, Plan, Subscription, Appointment, AppointmentStatus, PlanDayRule
-from .services import (EmailService, PlanPolicyService, ReturnEstimatorService,
-                       SettingsService, seed_defaults)
-
-EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
-
-
-def create_app():
+from . import db
+from .db import branch_urls, close_session, commit_session, get_session, session_scope
+from .instrumentation import init_query_stats, install_query_counter
+from .metrics import init_metrics
+from . import occupancy
+from .migrations import ensure_current, init_db
+from .outbox import OutboxSender, OutboxWorker
+from .search import ClientSearch
+from .table_versions import conditional
+from .templating import compile_templates, init_templates, render_page
+from .models import Client, Plan, Subscription, Appointment, AppointmentStatus, PlanDayRule
+from .occupancy import OccupancyService
+from .reports import init_reports
+from .services import (AgendaService, BookingService, CsvExportService, DashboardCache, DashboardService, EmailService,
+                       ReturnEstimatorService, SettingsCache, SettingsService, ShopHours, SlotFinderService)
+from .visit_stats import VisitStatsService
+
+
+def stop_email_workers(app):
+    """Para e espera as threads de e-mail do app (testes e desligamento ordenado)."""
+    for worker in app.extensions.get('email_workers', []):
+        worker.stop()
+
+
+def create_app(config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    init_templates(app)
 
-    engine = init_engine(app.config['DATABASE_URL'])
-    Base.metadata.create_all(engine)
-
-    with app.app_context():
-        session = get_session()
-        seed_defaults(session)
-        close_session()
+    for branch in db.init_branches(branch_urls(app.config), app.config, app.config['DEFAULT_BRANCH']).values():
+        install_query_counter(branch.engine)
+        ensure_current(branch.engine, app.config['DB_AUTO_INIT'])
+        SettingsCache.for_engine(branch.engine).ttl = app.config['SETTINGS_CACHE_TTL']
+        DashboardCache.for_engine(branch.engine).ttl = app.config['DASHBOARD_CACHE_TTL']
 
     app.teardown_appcontext(close_session)
+    init_branches(app)
+    init_query_stats(app)
+    init_metrics(app)
+    init_api(app)
+    init_reports(app)
+    # after_request roda na ordem inversa do registro: registrado por último, o commit vem antes dos outros
+    app.after_request(commit_session)
+
+    def outbox_sender(branch):
+        return OutboxSender(branch.SessionLocal, EmailService.mode, app.config['SMTP_HOST'], app.config['SMTP_PORT'],
+                            batch_size=app.config['EMAIL_BATCH_SIZE'], max_attempts=app.config['EMAIL_MAX_ATTEMPTS'],
+                            retry_base_seconds=app.config['EMAIL_RETRY_BASE_SECONDS'])
+
+    # em testes, nada de threads presas a bancos temporários (TESTING desliga; pare com stop_email_workers)
+    if app.config['EMAIL_WORKER'] == 'thread' and not app.testing:
+        # Sobe na primeira requisição, assim comandos de CLI não disputam o outbox; um por filial
+        email_workers = app.extensions['email_workers'] = [
+            OutboxWorker(outbox_sender(branch), app.config['EMAIL_POLL_INTERVAL']) for branch in db.BRANCHES.values()]
+
+        @app.before_request
+        def start_email_workers():
+            for worker in email_workers:
+                worker.ensure_started()
+
+    def branch_option(command):
+        return click.option('--branch', 'branch_name', type=click.Choice(list(db.BRANCHES)),
+                            help='Só esta filial (padrão: todas).')(command)
+
+    def selected_branches(name):
+        return [db.BRANCHES[name]] if name else list(db.BRANCHES.values())
+
+    def echo(branch, message, **kwargs):
+        click.echo(f'[{branch.name}] {message}' if len(db.BRANCHES) > 1 else message, **kwargs)
+
+    @app.cli.command('send-emails')
+    @click.option('--once', is_flag=True, help='Drena a fila uma vez e sai.')
+    @branch_option
+    def send_emails(once, branch_name):
+        """Envia os e-mails pendentes do outbox (use EMAIL_WORKER=off nos workers web)."""
+        branches = selected_branches(branch_name)
+        if once:
+            for branch in branches:
+                echo(branch, f'{outbox_sender(branch).drain()} e-mails enviados.')
+            return
+        workers = [OutboxWorker(outbox_sender(branch), app.config['EMAIL_POLL_INTERVAL']) for branch in branches]
+        for worker in workers[1:]:
+            worker.start()
+        workers[0].run()
+
+    @app.cli.command('init-db')
+    @branch_option
+    def init_db_command(branch_name):
+        """Cria o schema e aplica migrações e seeds pendentes (rode no deploy, antes dos workers)."""
+        for branch in selected_branches(branch_name):
+            applied = init_db(branch.engine)
+            echo(branch, f'Migrações aplicadas: {applied}.' if applied else 'Banco já está atualizado.')
+
+    @app.cli.command('compile-templates')
+    def compile_templates_command():
+        """Preenche o cache de bytecode dos templates (rode no deploy; workers novos não compilam)."""
+        if not app.config['TEMPLATE_BYTECODE_CACHE']:
+            raise click.ClickException('TEMPLATE_BYTECODE_CACHE está desligado.')
+        click.echo(f'{compile_templates(app)} templates compilados.')
+
+    @app.cli.command('rebuild-visit-stats')
+    @branch_option
+    def rebuild_visit_stats(branch_name):
+        """Recalcula do zero o resumo de visitas por cliente e confere o resultado."""
+        for branch in selected_branches(branch_name):
+            with session_scope(branch.name) as session:
+                stats = VisitStatsService(session)
+                stats.rebuild()
+                problems = stats.verify()
+            for problem in problems:
+                echo(branch, f'Divergência: {problem}', err=True)
+            echo(branch, 'Resumo de visitas reconstruído.' if not problems else f'{len(problems)} divergências.')
+
+    @app.cli.command('archive-appointments')
+    @click.option('--horizon-days', type=int, default=lambda: app.config['ARCHIVE_HORIZON_DAYS'], show_default=True)
+    @click.option('--batch-size', type=int, default=lambda: app.config['ARCHIVE_BATCH_SIZE'], show_default=True)
+    @click.option('--max-batches', type=int, help='Para depois de N lotes (a próxima execução continua).')
+    @branch_option
+    def archive_appointments(horizon_days, batch_size, max_batches, branch_name):
+        """Move para o arquivo os agendamentos encerrados mais antigos que o horizonte."""
+        for branch in selected_branches(branch_name):
+            report = AppointmentArchiver(branch.engine, horizon_days, batch_size).run(max_batches=max_batches)
+            echo(branch, f'{report.moved} agendamentos arquivados em {report.batches} lotes '
+                         f'(antes de {report.cutoff:%Y-%m-%d}).')
+
+    @app.cli.command('backfill-occupancy')
+    @click.option('--days', default=31, show_default=True, help='Dias materializados por transação.')
+    @branch_option
+    def backfill_occupancy(days, branch_name):
+        """Materializa a ocupação diária para trás até o agendamento mais antigo (pode ser interrompido)."""
+        for branch in selected_branches(branch_name):
+            covered = None
+            while True:
+                step = occupancy.backfill(branch.engine, days)
+                if step is None:
+                    break
+                covered = step
+                echo(branch, f'Ocupação materializada desde {covered:%Y-%m-%d}.')
+            echo(branch, 'Ocupação materializada por completo.' if covered else 'Nada a materializar.')
+
+    @app.cli.command('import-clients')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--chunk-size', default=ClientImportService.CHUNK_SIZE, show_default=True)
+    @click.option('--report', 'report_path', type=click.Path(dir_okay=False), help='CSV com as linhas recusadas.')
+    @click.option('--branch', 'branch_name', type=click.Choice(list(db.BRANCHES)), default=db.DEFAULT_BRANCH,
+                  show_default=True, help='Filial que recebe os clientes.')
+    def import_clients(path, chunk_size, report_path, branch_name):
+        """Importa clientes de um CSV (nome,email,telefone,idade,observacoes)."""
+        session = db.BRANCHES[branch_name].SessionLocal()
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as stream:
+                report = ClientImportService(session, chunk_size).import_csv(stream)
+        except ValueError as ex:
+            raise click.ClickException(str(ex))
+        finally:
+            session.close()
+        if report_path:
+            with open(report_path, 'w', newline='', encoding='utf-8') as out:
+                report.write_rejected(out)
+        click.echo(f'{report.imported} clientes importados, {len(report.rejected)} recusados.')
 
     @app.context_processor
     def inject_now():
@@ -32,32 +178,40 @@ def create_app():
 
     @app.route('/')
     def dashboard():
-        session = get_session()
-        today = date.today()
-        total_clients = session.query(func.count(Client.id)).scalar() or 0
-        today_count = session.query(func.count(Appointment.id)).filter(
-            Appointment.appointment_date_time >= datetime.combine(today, datetime.min.time()),
-            Appointment.appointment_date_time <= datetime.combine(today, datetime.max.time())
-        ).scalar() or 0
-        next7 = session.query(func.count(Appointment.id)).filter(
-            Appointment.appointment_date_time >= datetime.combine(today, datetime.min.time()),
-            Appointment.appointment_date_time <= datetime.combine(today + timedelta(days=7), datetime.max.time())
-        ).scalar() or 0
-        active_subs = session.query(func.count(Subscription.id)).filter_by(active=True).scalar() or 0
-        inactive_plans = session.query(func.count(Plan.id)).filter_by(active=False).scalar() or 0
-        return render_template('dashboard.html', total_clients=total_clients, today_count=today_count,
-                               next7=next7, without_plan=max(total_clients - active_subs, 0), inactive_plans=inactive_plans)
+        snapshot = DashboardService(get_session()).snapshot()
+        return render_template('dashboard.html', total_clients=snapshot.total_clients, today_count=snapshot.today_count,
+                               next7=snapshot.next7, without_plan=snapshot.without_plan,
+                               inactive_plans=snapshot.inactive_plans)
+
+    @app.route('/branches')
+    def branches_dashboard():
+        service = BranchDashboardService(db.BRANCHES, app.extensions['branch_pool'])
+        snapshots = service.snapshots()
+        return render_template('branches.html', snapshots=snapshots, totals=service.totals(snapshots))
 
     @app.route('/clients')
+    @conditional('clients')
     def clients_list():
         session = get_session()
         q = request.args.get('q', '').strip()
-        query = session.query(Client)
+        stmt = select(Client.id, Client.full_name, Client.email, Client.phone)
+        limit = app.config['CLIENT_SEARCH_LIMIT']
+        truncated = False
         if q:
-            like = f'%{q}%'
-            query = query.filter(or_(Client.full_name.ilike(like), Client.email.ilike(like)))
-        clients = query.order_by(Client.full_name).all()
-        return render_template('clients/list.html', clients=clients, q=q)
+            # um a mais só para saber se a busca foi cortada
+            ids = [row.id for row in ClientSearch(session).search(q, limit + 1)]
+            truncated = len(ids) > limit
+            stmt = stmt.where(Client.id.in_(ids[:limit]))
+        # linhas lidas em lotes enquanto a página é enviada
+        clients = session.execute(stmt.order_by(Client.full_name).execution_options(yield_per=app.config['STREAM_BATCH_SIZE']))
+        return render_page('clients/list.html', clients=clients, q=q, truncated=truncated, limit=limit)
+
+    @app.route('/api/clients/autocomplete')
+    def clients_autocomplete():
+        q = request.args.get('q', '').strip()
+        limit = min(request.args.get('limit', app.config['AUTOCOMPLETE_LIMIT'], type=int), app.config['AUTOCOMPLETE_MAX'])
+        rows = ClientSearch(get_session()).search(q, max(limit, 1))
+        return jsonify([{'id': r.id, 'full_name': r.full_name, 'email': r.email} for r in rows])
 
     @app.route('/clients/new', methods=['GET', 'POST'])
     @app.route('/clients/<int:client_id>/edit', methods=['GET', 'POST'])
@@ -78,15 +232,11 @@ def create_app():
                 flash('E-mail inválido.', 'error')
                 return render_template('clients/form.html', client=client)
 
-            age = None
-            if age_text:
-                try:
-                    age = int(age_text)
-                    if age < 0:
-                        raise ValueError
-                except ValueError:
-                    flash('Idade deve ser um número positivo.', 'error')
-                    return render_template('clients/form.html', client=client)
+            try:
+                age = parse_age(age_text)
+            except ValueError:
+                flash('Idade deve ser um número positivo.', 'error')
+                return render_template('clients/form.html', client=client)
 
             duplicate = session.query(Client).filter(Client.email == email)
             if client.id:
@@ -105,13 +255,53 @@ def create_app():
             session.add(client)
             session.flush()
             if is_new:
-                EmailService(session, app.config['SMTP_HOST'], app.config['SMTP_PORT']).send_welcome(client.email, client.full_name)
-                flash('Cliente criado e e-mail de boas-vindas processado.', 'success')
+                EmailService(session).send_welcome(client.email, client.full_name)
+                flash('Cliente criado e e-mail de boas-vindas enfileirado.', 'success')
             else:
                 flash('Cliente atualizado.', 'success')
             return redirect(url_for('clients_list'))
         return render_template('clients/form.html', client=client)
 
+    @app.route('/api/clients/<int:client_id>/free-slots')
+    def clients_free_slots(client_id):
+        session = get_session()
+        client = session.get(Client, client_id)
+        if not client:
+            return jsonify({'error': 'Cliente não encontrado.'}), 404
+        try:
+            start = date.fromisoformat(request.args.get('start') or date.today().isoformat())
+            end = date.fromisoformat(request.args['end']) if request.args.get('end') else start + timedelta(days=30)
+        except ValueError:
+            return jsonify({'error': 'Parâmetros start/end inválidos. Use YYYY-MM-DD.'}), 400
+        if end < start or (end - start).days > SlotFinderService.MAX_DAYS:
+            return jsonify({'error': f'Período deve ter até {SlotFinderService.MAX_DAYS} dias.'}), 400
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        slots = SlotFinderService(session).next_slots(client, start, end, limit)
+        return jsonify([{'start': s.start.isoformat(timespec='minutes'), 'free_chairs': s.free_chairs} for s in slots])
+
+    @app.route('/clients/import', methods=['GET', 'POST'])
+    def clients_import():
+        if request.method == 'GET':
+            return render_template('clients/import.html', report=None)
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Selecione um arquivo CSV.', 'error')
+            return render_template('clients/import.html', report=None)
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        try:
+            report = ClientImportService(get_session(), app.config['IMPORT_CHUNK_SIZE']).import_csv(stream)
+        except (ValueError, UnicodeDecodeError) as ex:
+            flash(f'Arquivo inválido: {ex}', 'error')
+            return render_template('clients/import.html', report=None)
+        if request.form.get('rejected_csv') and report.rejected:
+            out = io.StringIO()
+            report.write_rejected(out)
+            return Response(out.getvalue(), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename=clientes-recusados.csv'})
+        flash(f'{report.imported} clientes importados, {len(report.rejected)} recusados.',
+              'success' if report.imported else 'error')
+        return render_template('clients/import.html', report=report, shown=report.rejected[:200])
+
     @app.post('/clients/<int:client_id>/delete')
     def clients_delete(client_id):
         session = get_session()
@@ -127,12 +317,25 @@ def create_app():
         client = session.get(Client, client_id)
         if not client:
             return redirect(url_for('clients_list'))
-        appointments = session.query(Appointment).filter_by(client_id=client.id).order_by(Appointment.appointment_date_time.desc()).all()
         estimate = ReturnEstimatorService(session).estimate_for(client)
         plans = session.query(Plan).order_by(Plan.name).all()
         active_sub = session.query(Subscription).filter_by(client_id=client.id, active=True).first()
-        return render_template('clients/details.html', client=client, appointments=appointments,
-                               estimate=estimate, plans=plans, active_sub=active_sub)
+        archive = ArchiveService(session)
+        archived_summary = archive.summary(client.id)
+        # o arquivo só é lido quando o histórico completo é pedido, uma página por vez
+        archived, archived_next = None, None
+        if archived_summary and request.args.get('archived'):
+            try:
+                archived, archived_next = archive.history(client.id, request.args.get('before'))
+            except ValueError:
+                return redirect(url_for('clients_details', client_id=client.id, archived=1))
+        appointments = session.execute(
+            select(Appointment.appointment_date_time, Appointment.service, Appointment.status)
+            .where(Appointment.client_id == client.id).order_by(Appointment.appointment_date_time.desc())
+            .execution_options(yield_per=app.config['STREAM_BATCH_SIZE']))
+        return render_page('clients/details.html', client=client, appointments=appointments,
+                           estimate=estimate, plans=plans, active_sub=active_sub,
+                           archived_summary=archived_summary, archived=archived, archived_next=archived_next)
 
     @app.post('/clients/<int:client_id>/subscription')
     def subscription_activate(client_id):
@@ -166,6 +369,7 @@ def create_app():
         return redirect(url_for('clients_details', client_id=client_id))
 
     @app.route('/plans')
+    @conditional('plans')
     def plans_list():
         plans = get_session().query(Plan).order_by(Plan.name).all()
         return render_template('plans/list.html', plans=plans)
@@ -218,9 +422,30 @@ def create_app():
         return redirect(url_for('plans_list'))
 
     @app.route('/appointments')
+    @conditional('appointments', 'clients', daily=True)
     def appointments_list():
-        appointments = get_session().query(Appointment).order_by(Appointment.appointment_date_time.desc()).all()
-        return render_template('appointments/list.html', appointments=appointments)
+        session = get_session()
+        filters = {
+            'start': request.args.get('start', '').strip(),
+            'end': request.args.get('end', '').strip(),
+            'status': request.args.get('status', '').strip(),
+        }
+        cursor = request.args.get('after') or None
+        try:
+            start = datetime.fromisoformat(filters['start'] + 'T00:00:00') if filters['start'] else None
+            end = datetime.fromisoformat(filters['end'] + 'T23:59:59') if filters['end'] else None
+            status = AppointmentStatus(filters['status']) if filters['status'] else None
+            if cursor:
+                AgendaService.decode_cursor(cursor)
+        except ValueError:
+            flash('Filtros inválidos. Use datas YYYY-MM-DD e um status válido.', 'error')
+            start = end = status = cursor = None
+            filters = {'start': '', 'end': '', 'status': ''}
+        page = AgendaService(session).page(start=start, end=end, status=status, cursor=cursor,
+                                           limit=app.config['AGENDA_PAGE_SIZE'])
+        return render_page('appointments/list.html', appointments=page.items,
+                           next_cursor=page.next_cursor, filters=filters, paged=bool(cursor),
+                           query_args={k: v for k, v in filters.items() if v})
 
     @app.route('/appointments/new', methods=['GET', 'POST'])
     @app.route('/appointments/<int:appointment_id>/edit', methods=['GET', 'POST'])
@@ -252,19 +477,50 @@ def create_app():
                 flash('Cliente não encontrado.', 'error')
                 return render_template('appointments/form.html', appointment=appointment, clients=clients)
 
-            # Regras obrigatórias no ato da criação do agendamento
-            if appointment.id is None:
-                try:
-                    PlanPolicyService(session).validate_appointment(client, appointment.appointment_date_time)
-                except ValueError as ex:
-                    flash(str(ex), 'error')
-                    return render_template('appointments/form.html', appointment=appointment, clients=clients)
+            # Regras do plano no ato da criação; na edição, só a vaga semanal e a cadeira do novo horário
+            try:
+                if appointment.id is None:
+                    BookingService(session).book(client, appointment)
+                else:
+                    BookingService(session).reschedule(appointment)
+            except ValueError as ex:
+                session.rollback()
+                flash(str(ex), 'error')
+                return render_template('appointments/form.html', appointment=appointment, clients=clients)
 
             session.add(appointment)
             flash('Agendamento salvo.', 'success')
             return redirect(url_for('appointments_list'))
         return render_template('appointments/form.html', appointment=appointment, clients=clients)
 
+    @app.route('/appointments/recurring', methods=['GET', 'POST'])
+    def appointments_recurring():
+        session = get_session()
+        clients = session.query(Client).order_by(Client.full_name).all()
+        form = request.form
+        if request.method == 'POST':
+            try:
+                client = session.get(Client, int(form['client_id']))
+                first = datetime.fromisoformat(form['first_date_time'])
+                every_days = int(form.get('every_days') or 7)
+                until = date.fromisoformat(form['until']) if form.get('until') else first.date() + timedelta(days=182)
+                series = BookingService.recurrence(first, every_days, until)
+            except (KeyError, ValueError):
+                flash('Cliente, data inicial, intervalo e data final inválidos.', 'error')
+                return render_template('appointments/recurring.html', clients=clients, form=form)
+            service = form.get('service', '').strip()
+            if not client or not service:
+                flash('Cliente e serviço são obrigatórios.', 'error')
+                return render_template('appointments/recurring.html', clients=clients, form=form)
+
+            results = BookingService(session).book_many(client, series, service)
+            created = sum(1 for r in results if r.ok)
+            flash(f'{created} agendamentos criados, {len(results) - created} recusados.', 'success' if created else 'error')
+            for rejected in [r for r in results if not r.ok][:10]:
+                flash(f"{rejected.when.strftime('%d/%m/%Y %H:%M')}: {rejected.error}", 'error')
+            return redirect(url_for('appointments_list'))
+        return render_template('appointments/recurring.html', clients=clients, form=form)
+
     @app.post('/appointments/<int:appointment_id>/delete')
     def appointments_delete(appointment_id):
         session = get_session()
@@ -275,21 +531,15 @@ def create_app():
         return redirect(url_for('appointments_list'))
 
     @app.route('/export/clients.csv')
+    @conditional('clients')
     def export_clients():
-        session = get_session()
-        clients = session.query(Client).all()
-
-        def esc(v):
-            return (v or '').replace('"', "'")
-
-        lines = ['id,nome,email,telefone,idade,observacoes']
-        for c in clients:
-            lines.append(f'{c.id},"{esc(c.full_name)}","{esc(c.email)}","{esc(c.phone)}",{c.age or ""},"{esc(c.notes)}"')
-        return Response('\n'.join(lines), mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=clientes.csv'})
+        rows = CsvExportService(get_session(), app.config['EXPORT_BATCH_SIZE']).export_clients()
+        return Response(stream_with_context(rows), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=clientes.csv'})
 
     @app.route('/export/appointments.csv')
+    @conditional('appointments', 'clients', daily=True)
     def export_appointments():
-        session = get_session()
         start_text = request.args.get('start')
         end_text = request.args.get('end')
         if not start_text or not end_text:
@@ -302,24 +552,76 @@ def create_app():
         except ValueError:
             return Response('Parâmetros start/end inválidos. Use YYYY-MM-DD.', status=400)
 
-        rows = session.query(Appointment).filter(
-            Appointment.appointment_date_time >= start,
-            Appointment.appointment_date_time <= end
-        ).order_by(Appointment.appointment_date_time).all()
-        lines = ['id,cliente,dataHora,servico,status']
-        for a in rows:
-            lines.append(f'{a.id},"{a.client.full_name}",{a.appointment_date_time.isoformat()},"{a.service}",{a.status.value}')
-        return Response('\n'.join(lines), mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=agenda.csv'})
+        rows = CsvExportService(get_session(), app.config['EXPORT_BATCH_SIZE']).export_appointments(start, end)
+        return Response(stream_with_context(rows), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=agenda.csv'})
+
+    def occupancy_range():
+        today = date.today()
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else today + timedelta(days=30)
+        start = (date.fromisoformat(request.args['start']) if request.args.get('start')
+                 else end - timedelta(days=OccupancyService.MAX_DAYS - 2))
+        if start > end or (end - start).days >= OccupancyService.MAX_DAYS:
+            raise ValueError(f'Período deve ter até {OccupancyService.MAX_DAYS} dias.')
+        return start, end
+
+    @app.route('/occupancy')
+    @conditional('appointments', daily=True)
+    def occupancy_heatmap():
+        status = request.args.get('status', '').strip()
+        try:
+            start, end = occupancy_range()
+            statuses = {AppointmentStatus(status)} if status else None
+        except ValueError:
+            flash(f'Filtros inválidos. Use datas YYYY-MM-DD, até {OccupancyService.MAX_DAYS} dias.', 'error')
+            return redirect(url_for('occupancy_heatmap'))
+        heatmap = OccupancyService(get_session()).heatmap(start, end, statuses)
+        return render_template('occupancy.html', heatmap=heatmap, status=status)
+
+    @app.route('/api/occupancy')
+    @conditional('appointments', daily=True)
+    def occupancy_api():
+        by = request.args.get('by', 'day')
+        try:
+            start, end = occupancy_range()
+            if by not in ('day', 'hour'):
+                raise ValueError(by)
+        except ValueError:
+            return jsonify({'error': f'Parâmetros inválidos: start/end YYYY-MM-DD (até {OccupancyService.MAX_DAYS} '
+                                     f'dias) e by=day|hour.'}), 400
+        svc = OccupancyService(get_session())
+        if by == 'hour':
+            data = [{'day': day.isoformat(), 'hour': hour, 'status': status.value, 'count': count}
+                    for day, hour, status, count in svc.by_hour(start, end)]
+        else:
+            data = [{'day': day.isoformat(), 'status': status.value, 'count': count}
+                    for day, status, count in svc.by_day(start, end)]
+        return jsonify({'start': start.isoformat(), 'end': end.isoformat(), 'by': by, 'data': data})
 
     @app.route('/settings', methods=['GET', 'POST'])
     def settings():
         session = get_session()
         svc = SettingsService(session)
         if request.method == 'POST':
+            shop = {
+                SettingsService.SHOP_CHAIRS: request.form.get('shop_chairs', '2').strip(),
+                SettingsService.SHOP_OPENS_AT: request.form.get('shop_opens_at', '09:00').strip(),
+                SettingsService.SHOP_CLOSES_AT: request.form.get('shop_closes_at', '19:00').strip(),
+                SettingsService.SHOP_CLOSED_WEEKDAYS: ','.join(request.form.getlist('shop_closed_weekdays')),
+            }
+            try:
+                hours = ShopHours.load(shop.get)
+                if hours.chairs < 1 or hours.closes_at <= hours.opens_at:
+                    raise ValueError
+            except ValueError:
+                flash('Horário de funcionamento ou número de cadeiras inválido.', 'error')
+                return redirect(url_for('settings'))
             svc.set(SettingsService.EMAIL_MODE, request.form.get('email_mode', 'TEST'))
             svc.set(SettingsService.EMAIL_FROM, request.form.get('email_from', 'no-reply@barbearia.local'))
             svc.set(SettingsService.EST_TARGET_CM, request.form.get('target_cm', '1.2'))
             svc.set(SettingsService.EST_BASE_RATE, request.form.get('base_rate', '0.04'))
+            for key, value in shop.items():
+                svc.set(key, value)
             flash('Configurações atualizadas.', 'success')
             return redirect(url_for('settings'))
         data = {
@@ -327,6 +629,7 @@ def create_app():
             'email_from': svc.get(SettingsService.EMAIL_FROM, 'no-reply@barbearia.local'),
             'target_cm': svc.get(SettingsService.EST_TARGET_CM, '1.2'),
             'base_rate': svc.get(SettingsService.EST_BASE_RATE, '0.04'),
+            'shop': ShopHours.load(svc.get),
         }
         return render_template('settings/form.html', data=data)
 
@@ -0,0 +1,233 @@
+"""API JSON somente leitura (/api/v1): Core select() em tuplas, sem hidratar objetos do ORM nem identity map."""
+from __future__ import annotations
+import base64
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, date
+import json
+from typing import Callable, Optional
+
+from flask import Response, current_app, request
+from sqlalchemy import String, select, tuple_, type_coerce
+
+from .db import get_session
+from .models import Appointment, AppointmentStatus, Client, Plan, PlanDayRule, Subscription
+from .table_versions import conditional
+
+_CLIENTS = Client.__table__.c
+_PLANS = Plan.__table__.c
+_SUBSCRIPTIONS = Subscription.__table__.c
+_APPOINTMENTS = Appointment.__table__.c
+
+
+class ApiError(ValueError):
+    pass
+
+
+class Field:
+    __slots__ = ('column', 'convert', 'join')
+
+    def __init__(self, column, convert: Optional[Callable] = None, join=None):
+        self.column = column
+        self.convert = convert      # só para tipos que o json não serializa (datas, decimais)
+        self.join = join            # (tabela, chave, chave estrangeira) quando o campo vem de outra tabela
+
+
+@dataclass
+class Resource:
+    name: str
+    table: object
+    fields: dict
+    default_fields: tuple
+    order: tuple                    # chave do cursor: nomes de campos, do mais para o menos significativo
+    filters: dict = field(default_factory=dict)
+    depends: tuple = ()             # tabelas cujas versões formam o ETag
+
+    def __post_init__(self):
+        self.depends = self.depends or (self.table.name,)
+
+
+@dataclass
+class ApiPage:
+    names: tuple
+    fields: list
+    rows: list                      # Row do Core: tuplas com acesso por atributo
+    next_cursor: Optional[str]
+
+    def to_json(self) -> str:
+        return json.dumps({'data': serialize(self.names, self.fields, self.rows), 'next_cursor': self.next_cursor},
+                          ensure_ascii=False, separators=(',', ':'))
+
+
+def serialize(names, fields, rows) -> list:
+    """Tuplas -> dicts; colunas extras no fim da linha (chave do cursor) ficam de fora pelo zip."""
+    out = [dict(zip(names, row)) for row in rows]
+    # conversão coluna a coluna: um laço curto por campo em vez de reconstruir cada linha
+    for name, f in zip(names, fields):
+        if f.convert:
+            convert = f.convert
+            for item in out:
+                value = item[name]
+                if value is not None:
+                    item[name] = convert(value)
+    return out
+
+
+def _iso(value) -> str:
+    return value.isoformat()
+
+
+def _raw(column):
+    # enums chegam como o texto gravado (nome == valor), sem passar pelo Enum do Python
+    return type_coerce(column, String)
+
+
+def _parse_bool(raw: str) -> bool:
+    if raw.lower() in ('1', 'true'):
+        return True
+    if raw.lower() in ('0', 'false'):
+        return False
+    raise ValueError(raw)
+
+
+def _equals(column, parse=str):
+    return lambda raw: column == parse(raw)
+
+
+def _day_start(raw: str) -> datetime:
+    return datetime.combine(date.fromisoformat(raw), datetime.min.time())
+
+
+_CLIENT_JOIN = (Client.__table__, _CLIENTS.id)
+_PLAN_JOIN = (Plan.__table__, _PLANS.id)
+
+RESOURCES = {r.name: r for r in (
+    Resource(
+        'clients', Client.__table__,
+        fields={'id': Field(_CLIENTS.id), 'full_name': Field(_CLIENTS.full_name), 'email': Field(_CLIENTS.email),
+                'phone': Field(_CLIENTS.phone), 'age': Field(_CLIENTS.age), 'notes': Field(_CLIENTS.notes)},
+        default_fields=('id', 'full_name', 'email', 'phone', 'age'),
+        order=('id',),
+        filters={'email': _equals(_CLIENTS.email, lambda raw: raw.strip().lower()),
+                 'age_min': lambda raw: _CLIENTS.age >= int(raw),
+                 'age_max': lambda raw: _CLIENTS.age <= int(raw)},
+    ),
+    Resource(
+        'plans', Plan.__table__,
+        fields={'id': Field(_PLANS.id), 'name': Field(_PLANS.name), 'price': Field(_PLANS.price, str),
+                'day_rule': Field(_raw(_PLANS.day_rule)),
+                'min_days_between_appointments': Field(_PLANS.min_days_between_appointments),
+                'weekly_limit': Field(_PLANS.weekly_limit), 'active': Field(_PLANS.active)},
+        default_fields=('id', 'name', 'price', 'day_rule', 'min_days_between_appointments', 'weekly_limit', 'active'),
+        order=('id',),
+        filters={'active': _equals(_PLANS.active, _parse_bool), 'day_rule': _equals(_PLANS.day_rule, PlanDayRule)},
+    ),
+    Resource(
+        'subscriptions', Subscription.__table__,
+        fields={'id': Field(_SUBSCRIPTIONS.id), 'client_id': Field(_SUBSCRIPTIONS.client_id),
+                'plan_id': Field(_SUBSCRIPTIONS.plan_id), 'start_date': Field(_SUBSCRIPTIONS.start_date, _iso),
+                'active': Field(_SUBSCRIPTIONS.active),
+                'client_name': Field(_CLIENTS.full_name, join=(*_CLIENT_JOIN, _SUBSCRIPTIONS.client_id)),
+                'plan_name': Field(_PLANS.name, join=(*_PLAN_JOIN, _SUBSCRIPTIONS.plan_id))},
+        default_fields=('id', 'client_id', 'plan_id', 'start_date', 'active'),
+        order=('id',),
+        filters={'client_id': _equals(_SUBSCRIPTIONS.client_id, int), 'plan_id': _equals(_SUBSCRIPTIONS.plan_id, int),
+                 'active': _equals(_SUBSCRIPTIONS.active, _parse_bool)},
+        depends=('subscriptions', 'clients', 'plans'),
+    ),
+    Resource(
+        'appointments', Appointment.__table__,
+        fields={'id': Field(_APPOINTMENTS.id), 'client_id': Field(_APPOINTMENTS.client_id),
+                'appointment_date_time': Field(_APPOINTMENTS.appointment_date_time, _iso),
+                'service': Field(_APPOINTMENTS.service), 'status': Field(_raw(_APPOINTMENTS.status)),
+                'client_name': Field(_CLIENTS.full_name, join=(*_CLIENT_JOIN, _APPOINTMENTS.client_id))},
+        default_fields=('id', 'client_id', 'appointment_date_time', 'service', 'status'),
+        order=('appointment_date_time', 'id'),
+        filters={'client_id': _equals(_APPOINTMENTS.client_id, int),
+                 'status': _equals(_APPOINTMENTS.status, lambda raw: AppointmentStatus(raw.upper())),
+                 'start': lambda raw: _APPOINTMENTS.appointment_date_time >= _day_start(raw),
+                 'end': lambda raw: _APPOINTMENTS.appointment_date_time < _day_start(raw) + timedelta(days=1)},
+        depends=('appointments', 'clients'),
+    ),
+)}
+
+
+class ReadApi:
+    PAGE_SIZE = 100
+
+    def __init__(self, session):
+        self.session = session
+
+    def page(self, resource: Resource, fields=None, filters=None, cursor: Optional[str] = None,
+             limit: int = PAGE_SIZE) -> ApiPage:
+        names = tuple(fields or resource.default_fields)
+        unknown = [name for name in names if name not in resource.fields]
+        if unknown:
+            raise ApiError(f"Campos desconhecidos: {', '.join(unknown)}.")
+        selected = [resource.fields[name] for name in names]
+        order = [resource.fields[name].column for name in resource.order]
+        # a chave do cursor vai no fim da linha mesmo quando não foi pedida
+        stmt = select(*(f.column for f in selected), *order).select_from(resource.table)
+        joined = set()
+        for f in selected:
+            if f.join and f.join[0] not in joined:
+                table, key, foreign_key = f.join
+                stmt = stmt.join(table, key == foreign_key)
+                joined.add(table)
+
+        for name, raw in (filters or {}).items():
+            build = resource.filters.get(name)
+            if build is None:
+                raise ApiError(f'Filtro desconhecido: {name}.')
+            try:
+                stmt = stmt.where(build(raw))
+            except ValueError:
+                raise ApiError(f'Valor inválido para {name}: {raw}.')
+        if cursor:
+            stmt = stmt.where(tuple_(*order) > tuple_(*self.decode_cursor(resource, cursor)))
+        stmt = stmt.order_by(*order).limit(limit + 1)
+
+        rows = self.session.connection().execute(stmt).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(rows[-1][-len(order):])
+        return ApiPage(names, selected, rows, next_cursor)
+
+    @staticmethod
+    def encode_cursor(key) -> str:
+        values = [v.isoformat() if isinstance(v, datetime) else v for v in key]
+        return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(resource: Resource, cursor: str) -> list:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if len(values) != len(resource.order):
+                raise ValueError(cursor)
+            return [datetime.fromisoformat(v) if resource.fields[name].convert is _iso else int(v)
+                    for name, v in zip(resource.order, values)]
+        except (ValueError, TypeError):
+            raise ApiError('Cursor inválido.')
+
+
+def init_api(app):
+    for resource in RESOURCES.values():
+        view = conditional(*resource.depends)(_list_view(resource))
+        app.add_url_rule(f'/api/v1/{resource.name}', f'api_{resource.name}', view)
+
+
+def _list_view(resource: Resource):
+    def view():
+        args = request.args
+        fields = [name.strip() for name in args['fields'].split(',') if name.strip()] if args.get('fields') else None
+        filters = {name: value for name, value in args.items() if name not in ('fields', 'cursor', 'limit')}
+        limit = args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+        try:
+            page = ReadApi(get_session()).page(resource, fields, filters, args.get('cursor'), limit)
+        except ApiError as ex:
+            return Response(json.dumps({'error': str(ex)}, ensure_ascii=False), status=400,
+                            mimetype='application/json')
+        return Response(page.to_json(), mimetype='application/json')
+    view.__name__ = f'api_{resource.name}'
+    return view
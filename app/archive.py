@@ -0,0 +1,115 @@
+"""Arquivamento de agendamentos encerrados: appointments fica só com o histórico recente e a agenda futura."""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import logging
+from typing import Optional
+
+from sqlalchemy import delete, insert, select, tuple_
+
+from . import table_versions, visit_stats
+from .models import Appointment, AppointmentStatus, ArchivedAppointment, ClientArchiveStats
+from .visit_stats import VisitState
+
+logger = logging.getLogger(__name__)
+
+CLOSED = (AppointmentStatus.DONE, AppointmentStatus.CANCELED, AppointmentStatus.NO_SHOW)
+
+_LIVE = Appointment.__table__
+_ARCHIVED = ArchivedAppointment.__table__
+
+
+@dataclass
+class ArchiveReport:
+    cutoff: datetime
+    moved: int = 0
+    batches: int = 0
+
+
+class AppointmentArchiver:
+    """Move em lotes, cada um na sua transação, os agendamentos encerrados anteriores ao horizonte.
+
+    Um lote copia as linhas para appointments_archive, soma-as em client_archive_stats e as apaga
+    de appointments; se o processo cair, o lote em andamento é desfeito e a próxima execução segue
+    de onde parou. client_visit_stats não muda: continua contando o histórico inteiro.
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self, engine, horizon_days: int, batch_size: int = BATCH_SIZE):
+        self.engine = engine
+        self.horizon_days = horizon_days
+        self.batch_size = batch_size
+
+    def run(self, now: Optional[datetime] = None, max_batches: Optional[int] = None) -> ArchiveReport:
+        report = ArchiveReport(cutoff=(now or datetime.now()) - timedelta(days=self.horizon_days))
+        after = None
+        while max_batches is None or report.batches < max_batches:
+            moved, after = self.archive_batch(report.cutoff, after)
+            if not moved:
+                break
+            report.moved += moved
+            report.batches += 1
+            logger.info('Arquivamento: lote %d, %d agendamentos até %s', report.batches, moved, after[0])
+        return report
+
+    def archive_batch(self, cutoff: datetime, after=None):
+        """Arquiva até batch_size linhas após a chave after; devolve (quantidade, última chave)."""
+        with self.engine.begin() as conn:
+            if conn.dialect.name == 'sqlite':
+                # trava de escrita desde a leitura: nenhuma edição entra entre copiar e apagar
+                conn.exec_driver_sql('BEGIN IMMEDIATE')
+            stmt = (select(_LIVE.c.id, _LIVE.c.client_id, _LIVE.c.appointment_date_time, _LIVE.c.service,
+                           _LIVE.c.status)
+                    .where(_LIVE.c.appointment_date_time < cutoff, _LIVE.c.status.in_(CLOSED)))
+            if after:
+                # agendamentos antigos ainda SCHEDULED ficam para trás sem serem relidos a cada lote
+                stmt = stmt.where(tuple_(_LIVE.c.appointment_date_time, _LIVE.c.id) > tuple_(*after))
+            rows = conn.execute(stmt.order_by(_LIVE.c.appointment_date_time, _LIVE.c.id).limit(self.batch_size)
+                                .with_for_update(skip_locked=True)).all()
+            if not rows:
+                return 0, after
+            now = datetime.utcnow()
+            conn.execute(insert(_ARCHIVED), [{'id': r.id, 'client_id': r.client_id,
+                                              'appointment_date_time': r.appointment_date_time,
+                                              'service': r.service, 'status': r.status, 'archived_at': now}
+                                             for r in rows])
+            visit_stats.add_archived(conn, (VisitState(r.client_id, r.appointment_date_time, r.status) for r in rows))
+            ids = [r.id for r in rows]
+            for i in range(0, len(ids), 500):
+                conn.execute(delete(_LIVE).where(_LIVE.c.id.in_(ids[i:i + 500])))
+        with self.engine.begin() as conn:
+            table_versions.bump(conn, [_LIVE.name, _ARCHIVED.name])
+        return len(rows), (rows[-1].appointment_date_time, rows[-1].id)
+
+
+class ArchiveService:
+    """Leitura do arquivo, só quando pedida (histórico completo do cliente)."""
+    PAGE_SIZE = 100
+
+    def __init__(self, session):
+        self.session = session
+
+    def summary(self, client_id: int) -> Optional[ClientArchiveStats]:
+        return self.session.get(ClientArchiveStats, client_id)
+
+    def history(self, client_id: int, before: Optional[str] = None, limit: int = PAGE_SIZE) -> tuple:
+        """Uma página do histórico, do mais recente ao mais antigo, e o cursor da seguinte (ou None).
+
+        Cursor por chave (data, id), como na API v1: cada página é uma busca no índice do cliente.
+        """
+        a = ArchivedAppointment
+        stmt = select(a).where(a.client_id == client_id)
+        if before:
+            stmt = stmt.where(tuple_(a.appointment_date_time, a.id) < tuple_(*self.decode_cursor(before)))
+        rows = list(self.session.execute(
+            stmt.order_by(a.appointment_date_time.desc(), a.id.desc()).limit(limit + 1)).scalars())
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, f'{rows[-1].appointment_date_time.isoformat()}_{rows[-1].id}'
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        """'2022-03-01T10:00:00_42' -> (datetime, id); ValueError se malformado."""
+        when, _, appointment_id = cursor.rpartition('_')
+        return datetime.fromisoformat(when), int(appointment_id)
@@ -0,0 +1,114 @@
+"""Filiais em bancos separados: a requisição escolhe o banco pelo prefixo /branches/<filial> ou por X-Branch.
+
+Cada filial tem engine, pool e arquivo próprios (ver db.init_branches), então a escrita numa não espera
+a trava da outra. Sem BRANCH_DATABASES há uma filial só e as URLs continuam as de sempre.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from datetime import date
+import logging
+from typing import Optional
+
+from flask import abort, g, request
+
+from . import db
+from .services import DashboardService, DashboardSnapshot
+
+logger = logging.getLogger(__name__)
+
+BRANCH_HEADER = 'X-Branch'
+PREFIX = '/branches/'
+ENVIRON_KEY = 'barbershop.branch'
+BASE_KEY = 'barbershop.base'
+
+
+class BranchPrefixMiddleware:
+    """Tira /branches/<filial> do caminho e o passa ao SCRIPT_NAME: url_for gera links que ficam na filial."""
+
+    def __init__(self, wsgi_app, names):
+        self.wsgi_app = wsgi_app
+        self.names = frozenset(names)
+
+    def __call__(self, environ, start_response):
+        script_name = environ.get('SCRIPT_NAME', '')
+        environ[BASE_KEY] = script_name
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(PREFIX):
+            name, _, rest = path[len(PREFIX):].partition('/')
+            if name in self.names:
+                environ[ENVIRON_KEY] = name
+                environ['SCRIPT_NAME'] = script_name + PREFIX + name
+                environ['PATH_INFO'] = '/' + rest
+        return self.wsgi_app(environ, start_response)
+
+
+def resolve_branch():
+    name = request.environ.get(ENVIRON_KEY) or request.headers.get(BRANCH_HEADER)
+    if name and name not in db.BRANCHES:
+        abort(404, description=f'Filial desconhecida: {name}.')
+    g.branch = name or db.DEFAULT_BRANCH
+
+
+def branch_url(name: Optional[str] = None, path: str = '/') -> str:
+    """URL de path na filial name, a partir de qualquer página; sem name, fora das filiais."""
+    base = request.environ.get(BASE_KEY, request.script_root)
+    return base + PREFIX + name + path if name else base + path
+
+
+@dataclass
+class BranchSnapshot:
+    name: str
+    snapshot: Optional[DashboardSnapshot]   # None: banco da filial indisponível
+
+
+class BranchDashboardService:
+    """Dashboard de todas as filiais: um snapshot por banco, consultados em paralelo no pool de threads."""
+
+    def __init__(self, branches: dict, executor: ThreadPoolExecutor):
+        self.branches = branches
+        self.executor = executor
+
+    def snapshots(self, today: Optional[date] = None) -> list:
+        futures = [(name, self.executor.submit(self._snapshot, branch, today))
+                   for name, branch in self.branches.items()]
+        results = []
+        for name, future in futures:
+            try:
+                results.append(BranchSnapshot(name, future.result()))
+            except Exception:
+                logger.exception('Falha ao ler o dashboard da filial %s.', name)
+                results.append(BranchSnapshot(name, None))
+        return results
+
+    @staticmethod
+    def totals(snapshots) -> DashboardSnapshot:
+        available = [s.snapshot for s in snapshots if s.snapshot is not None]
+        return DashboardSnapshot(*(sum(getattr(s, f.name) for s in available) for f in fields(DashboardSnapshot)))
+
+    @staticmethod
+    def _snapshot(branch: db.Branch, today: Optional[date]) -> DashboardSnapshot:
+        session = branch.ReadOnlySessionLocal()
+        try:
+            return DashboardService(session).snapshot(today)
+        finally:
+            session.close()
+
+
+def init_branches(app):
+    names = list(db.BRANCHES)
+    app.wsgi_app = BranchPrefixMiddleware(app.wsgi_app, names)
+    # antes dos outros before_request: qualquer get_session já sai no banco certo
+    app.before_request_funcs.setdefault(None, []).insert(0, resolve_branch)
+    app.extensions['branch_pool'] = ThreadPoolExecutor(
+        max_workers=max(1, min(app.config['BRANCH_POOL_SIZE'], len(names))), thread_name_prefix='branch')
+
+    if len(names) > 1:
+        @app.after_request
+        def vary_on_branch(response):
+            response.vary.add(BRANCH_HEADER)
+            return response
+
+    @app.context_processor
+    def inject_branch():
+        return {'branch': g.get('branch'), 'branches': names, 'branch_url': branch_url}
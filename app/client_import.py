@@ -0,0 +1,170 @@
+from __future__ import annotations
+import csv
+from dataclasses import dataclass, field
+from itertools import islice
+import logging
+import re
+from typing import Iterable, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from .models import Client
+from . import search, table_versions
+from .services import EmailService, mark_dashboard_dirty
+
+logger = logging.getLogger(__name__)
+
+_CLIENTS = Client.__table__
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# cabeçalhos aceitos: os do export de clientes e os nomes das colunas
+COLUMNS = {
+    'nome': 'full_name', 'full_name': 'full_name',
+    'email': 'email',
+    'telefone': 'phone', 'phone': 'phone',
+    'idade': 'age', 'age': 'age',
+    'observacoes': 'notes', 'notes': 'notes',
+}
+
+
+def parse_age(text: str) -> Optional[int]:
+    """'' -> None; inteiro não negativo; senão ValueError."""
+    if not text:
+        return None
+    age = int(text)
+    if age < 0:
+        raise ValueError(text)
+    return age
+
+
+@dataclass
+class RejectedRow:
+    line: int
+    email: str
+    reason: str
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    rejected: list = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return self.imported + len(self.rejected)
+
+    def write_rejected(self, out):
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(['linha', 'email', 'motivo'])
+        writer.writerows((r.line, r.email, r.reason) for r in self.rejected)
+
+
+class ClientImportService:
+    """Importa clientes de um CSV em lotes: valida, deduplica por e-mail e grava com executemany.
+
+    Cada lote é commitado separadamente, então o arquivo nunca fica inteiro em memória nem numa
+    transação só. Boas-vindas vão para o outbox, não são enviadas durante a importação.
+    """
+    CHUNK_SIZE = 1000
+
+    def __init__(self, session, chunk_size: int = CHUNK_SIZE):
+        self.session = session
+        self.chunk_size = chunk_size
+
+    def import_csv(self, stream) -> ImportReport:
+        reader = csv.DictReader(stream)
+        columns = {name: COLUMNS.get(name.strip().lower()) for name in reader.fieldnames or []}
+        missing = {'full_name', 'email', 'phone'} - set(columns.values())
+        if missing:
+            raise ValueError('CSV sem as colunas obrigatórias: nome, email e telefone.')
+        lines = ({columns[k]: (v or '').strip() for k, v in row.items() if columns.get(k)}
+                 for row in reader)
+        # linha 1 é o cabeçalho
+        return self.import_rows(enumerate(lines, start=2))
+
+    def import_rows(self, numbered_rows: Iterable) -> ImportReport:
+        report = ImportReport()
+        rows = iter(numbered_rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            report.imported += self._import_chunk(chunk, report.rejected)
+            self.session.commit()
+        logger.info('Importação de clientes: %s gravados, %s recusados.', report.imported, len(report.rejected))
+        return report
+
+    def _import_chunk(self, chunk, rejected) -> int:
+        valid = {}
+        for line, raw in chunk:
+            row, error = self._validate(raw)
+            if error:
+                rejected.append(RejectedRow(line, raw.get('email', ''), error))
+            elif row['email'] in valid:
+                rejected.append(RejectedRow(line, row['email'], 'E-mail repetido no arquivo.'))
+            else:
+                valid[row['email']] = (line, row)
+        if not valid:
+            return 0
+
+        # uma consulta por lote para todos os e-mails já cadastrados
+        existing = set(self.session.execute(select(Client.email).where(Client.email.in_(list(valid)))).scalars())
+        for email in existing:
+            line, _ = valid.pop(email)
+            rejected.append(RejectedRow(line, email, 'Já existe cliente com este e-mail.'))
+        if not valid:
+            return 0
+
+        conn = self.session.connection()
+        created = self._insert(conn, [row for _, row in valid.values()])
+        # cadastrados por outra requisição entre a consulta acima e o insert
+        inserted = {r.email for r in created}
+        for email, (line, _) in valid.items():
+            if email not in inserted:
+                rejected.append(RejectedRow(line, email, 'Já existe cliente com este e-mail.'))
+        if not created:
+            return 0
+        # insert em lote não passa pelos hooks de flush: índice de busca e dashboard à mão
+        search.index_clients(conn, [r._asdict() for r in created])
+        mark_dashboard_dirty(self.session)
+        table_versions.mark_changed(self.session, 'clients')
+        EmailService(self.session).send_welcome_many((r.email, r.full_name) for r in created)
+        return len(created)
+
+    def _insert(self, conn, rows) -> list:
+        """Grava as linhas e devolve as criadas; e-mail já cadastrado fica de fora, sem erro."""
+        columns = (_CLIENTS.c.id, _CLIENTS.c.full_name, _CLIENTS.c.email)
+        if conn.dialect.name in ('sqlite', 'postgresql'):
+            if conn.dialect.name == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            # Core direto na tabela: um executemany de verdade (o bulk do ORM quebra o lote por colunas nulas)
+            stmt = dialect_insert(_CLIENTS).on_conflict_do_nothing(index_elements=['email']).returning(*columns)
+            return conn.execute(stmt, rows).all()
+        created = []
+        for row in rows:
+            try:
+                with self.session.begin_nested():
+                    created.append(conn.execute(insert(_CLIENTS).returning(*columns), row).one())
+            except IntegrityError:
+                pass
+        return created
+
+    @staticmethod
+    def _validate(raw: dict):
+        full_name = raw.get('full_name', '')
+        email = raw.get('email', '').lower()
+        phone = raw.get('phone', '')
+        if not full_name or not email or not phone:
+            return None, 'Nome, email e telefone são obrigatórios.'
+        if not EMAIL_RE.match(email):
+            return None, 'E-mail inválido.'
+        try:
+            age = parse_age(raw.get('age', ''))
+        except ValueError:
+            return None, 'Idade deve ser um número positivo.'
+        return {'full_name': full_name, 'email': email, 'phone': phone, 'age': age,
+                'notes': raw.get('notes', '')}, None
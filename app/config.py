@@ -5,7 +5,57 @@ BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'barbershop-secret')
     DATABASE_URL = os.getenv('DATABASE_URL', f"sqlite:///{os.path.join(BASE_DIR, 'data', 'barbershop.db')}")
+    # filiais, cada uma no seu banco: "centro=sqlite:///data/centro.db,norte=sqlite:///data/norte.db";
+    # vazio = uma filial só (DEFAULT_BRANCH) em DATABASE_URL
+    BRANCH_DATABASES = os.getenv('BRANCH_DATABASES', '')
+    DEFAULT_BRANCH = os.getenv('DEFAULT_BRANCH', 'main')
+    BRANCH_POOL_SIZE = int(os.getenv('BRANCH_POOL_SIZE', '8'))
     EMAIL_MODE = os.getenv('EMAIL_MODE', 'TEST')
     EMAIL_FROM = os.getenv('EMAIL_FROM', 'no-reply@barbearia.local')
     SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
     SMTP_PORT = int(os.getenv('SMTP_PORT', '1025'))
+    AGENDA_PAGE_SIZE = int(os.getenv('AGENDA_PAGE_SIZE', '50'))
+    QUERY_STATS = os.getenv('QUERY_STATS', '1') == '1'
+    QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', '25'))
+    QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', '0') == '1'
+    QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', '5'))
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+    # listas grandes (clientes, histórico) são enviadas enquanto renderizam, lendo STREAM_BATCH_SIZE linhas por vez
+    STREAM_TEMPLATES = os.getenv('STREAM_TEMPLATES', '1') == '1'
+    STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '500'))
+    # bytecode dos templates em disco, reaproveitado por workers novos; sem diretório, o temporário do sistema
+    TEMPLATE_BYTECODE_CACHE = os.getenv('TEMPLATE_BYTECODE_CACHE', '1') == '1'
+    TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR', '')
+    SETTINGS_CACHE_TTL = float(os.getenv('SETTINGS_CACHE_TTL', '30'))
+    EMAIL_WORKER = os.getenv('EMAIL_WORKER', 'thread')
+    EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '50'))
+    EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '5'))
+    EMAIL_RETRY_BASE_SECONDS = int(os.getenv('EMAIL_RETRY_BASE_SECONDS', '30'))
+    EMAIL_POLL_INTERVAL = float(os.getenv('EMAIL_POLL_INTERVAL', '2'))
+    DASHBOARD_CACHE_TTL = float(os.getenv('DASHBOARD_CACHE_TTL', '10'))
+    CLIENT_SEARCH_LIMIT = int(os.getenv('CLIENT_SEARCH_LIMIT', '100'))
+    AUTOCOMPLETE_LIMIT = int(os.getenv('AUTOCOMPLETE_LIMIT', '10'))
+    AUTOCOMPLETE_MAX = int(os.getenv('AUTOCOMPLETE_MAX', '50'))
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    METRICS = os.getenv('METRICS', '1') == '1'
+    SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', '500'))
+    # com vários workers, prefira DB_AUTO_INIT=0 e 'flask init-db' no deploy
+    DB_AUTO_INIT = os.getenv('DB_AUTO_INIT', '1') == '1'
+    IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+    API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '100'))
+    API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '1000'))
+    # agendamentos encerrados mais antigos que isso vão para appointments_archive (flask archive-appointments)
+    ARCHIVE_HORIZON_DAYS = int(os.getenv('ARCHIVE_HORIZON_DAYS', '365'))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '1000'))
+    # relatórios gerenciais: processos do pool, linhas por lote lido e quando um job parado é refeito
+    REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', '2'))
+    REPORT_BATCH_SIZE = int(os.getenv('REPORT_BATCH_SIZE', '5000'))
+    REPORT_JOB_TIMEOUT = int(os.getenv('REPORT_JOB_TIMEOUT', '600'))
@@ -1,19 +1,130 @@
 from contextlib import contextmanager
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from flask import g
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+from flask import g, has_app_context, has_request_context, request
 
+from .metrics import TimedQueuePool
+
+# fábricas da filial padrão (CLI e código fora de requisição)
 SessionLocal = None
+ReadOnlySessionLocal = None
+BRANCHES = {}
+DEFAULT_BRANCH = None
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReadOnlySessionError(RuntimeError):
+    pass
+
+
+class ReadOnlySession(Session):
+    """Sessão das requisições de leitura: nunca faz flush nem commit."""
+
+    def flush(self, objects=None):
+        if self.new or self.dirty or self.deleted:
+            raise ReadOnlySessionError('Escrita em sessão somente leitura (requisição GET).')
+
+    def commit(self):
+        raise ReadOnlySessionError('Commit em sessão somente leitura (requisição GET).')
+
+
+def engine_options(database_url, config=None):
+    config = config or {}
+    url = make_url(database_url)
+    options = {'future': True, 'pool_pre_ping': config.get('DB_POOL_PRE_PING', False)}
+    if config.get('DB_POOL_RECYCLE'):
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+    # SQLite em memória usa um pool de conexão única; dimensionamento não se aplica
+    if url.get_backend_name() != 'sqlite' or (url.database and url.database != ':memory:'):
+        options['poolclass'] = TimedQueuePool
+        for key, option in (('DB_POOL_SIZE', 'pool_size'), ('DB_MAX_OVERFLOW', 'max_overflow'),
+                            ('DB_POOL_TIMEOUT', 'pool_timeout')):
+            if config.get(key) is not None:
+                options[option] = config[key]
+    return options
+
+
+def install_sqlite_pragmas(engine, config):
+    pragmas = [
+        ('journal_mode', config.get('SQLITE_JOURNAL_MODE')),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS')),
+        ('mmap_size', config.get('SQLITE_MMAP_SIZE')),
+        ('busy_timeout', config.get('SQLITE_BUSY_TIMEOUT_MS')),
+    ]
+    pragmas = [(name, value) for name, value in pragmas if value not in (None, '')]
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+@dataclass
+class Branch:
+    """Uma filial: banco próprio, com engine, pool e trava de escrita independentes das demais."""
+    name: str
+    engine: Engine
+    SessionLocal: sessionmaker
+    ReadOnlySessionLocal: sessionmaker
+
+
+def branch_urls(config) -> dict:
+    """Mapa filial -> URL do banco a partir de BRANCH_DATABASES ("centro=sqlite:///...,norte=...").
+
+    Sem filiais configuradas, uma só (DEFAULT_BRANCH) em DATABASE_URL.
+    """
+    value = config.get('BRANCH_DATABASES') or {}
+    if isinstance(value, str):
+        pairs = [item.split('=', 1) for item in value.split(',') if item.strip()]
+        if any(len(pair) != 2 or not pair[0].strip() for pair in pairs):
+            raise ValueError('BRANCH_DATABASES deve ter o formato filial=url,filial=url.')
+        value = {name.strip(): url.strip() for name, url in pairs}
+    return dict(value) or {config.get('DEFAULT_BRANCH') or 'main': config['DATABASE_URL']}
+
+
+def create_branch(name, database_url, config=None) -> Branch:
+    config = config or {}
+    engine = create_engine(database_url, **engine_options(database_url, config))
+    read_bind = engine
+    if engine.dialect.name == 'sqlite':
+        install_sqlite_pragmas(engine, config)
+    elif engine.dialect.name == 'postgresql':
+        read_bind = engine.execution_options(postgresql_readonly=True)
+    return Branch(name, engine,
+                  sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True),
+                  sessionmaker(bind=read_bind, class_=ReadOnlySession, autoflush=False, future=True))
+
+
+def init_branches(urls: dict, config=None, default=None) -> dict:
+    global SessionLocal, ReadOnlySessionLocal, BRANCHES, DEFAULT_BRANCH
+    BRANCHES = {name: create_branch(name, url, config) for name, url in urls.items()}
+    DEFAULT_BRANCH = default if default in BRANCHES else next(iter(BRANCHES))
+    SessionLocal = BRANCHES[DEFAULT_BRANCH].SessionLocal
+    ReadOnlySessionLocal = BRANCHES[DEFAULT_BRANCH].ReadOnlySessionLocal
+    return BRANCHES
+
+
+def init_engine(database_url, config=None):
+    config = config or {}
+    init_branches({config.get('DEFAULT_BRANCH') or 'main': database_url}, config)
+    return BRANCHES[DEFAULT_BRANCH].engine
+
+
+def current_branch() -> Branch:
+    """Filial da requisição (g.branch, ver branches.resolve_branch) ou a padrão."""
+    name = g.get('branch') if has_app_context() else None
+    return BRANCHES[name or DEFAULT_BRANCH]
 
-def init_engine(database_url):
-    global SessionLocal
-    engine = create_engine(database_url, future=True)
-    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
-    return engine
 
 @contextmanager
-def session_scope():
-    session = SessionLocal()
+def session_scope(branch: Optional[str] = None):
+    session = BRANCHES[branch or DEFAULT_BRANCH].SessionLocal()
     try:
         yield session
         session.commit()
@@ -25,14 +136,29 @@ def session_scope():
 
 def get_session():
     if 'db_session' not in g:
-        g.db_session = SessionLocal()
+        branch = current_branch()
+        if has_request_context() and request.method in READ_ONLY_METHODS:
+            g.db_session = branch.ReadOnlySessionLocal()
+        else:
+            g.db_session = branch.SessionLocal()
     return g.db_session
 
+def commit_session(response):
+    """Grava a sessão de escrita antes dos demais after_request: métricas e X-DB-Queries já contam o flush do commit.
+
+    Falha no commit vira erro da requisição (e rollback no teardown), não uma resposta de sucesso.
+    """
+    session = g.get('db_session')
+    if session is not None and not isinstance(session, ReadOnlySession) and response.status_code < 500:
+        session.commit()
+    return response
+
 def close_session(e=None):
     session = g.pop('db_session', None)
     if session is not None:
-        if e is None:
-            session.commit()
-        else:
-            session.rollback()
+        if not isinstance(session, ReadOnlySession):
+            if e is None:
+                session.commit()
+            else:
+                session.rollback()
         session.close()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+from collections import Counter
+from dataclasses import dataclass, field
+import logging
+import re
+from time import perf_counter
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_WS_RE = re.compile(r'\s+')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|:\w+|\$\d+")
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0
+    fingerprints: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.duration += elapsed
+        self.fingerprints[fingerprint(statement)] += 1
+
+    @property
+    def repeated(self) -> int:
+        return sum(n - 1 for n in self.fingerprints.values())
+
+    def hot_spots(self, threshold: int):
+        return [(fp, n) for fp, n in self.fingerprints.most_common() if n >= threshold]
+
+
+def fingerprint(statement: str) -> str:
+    text = _WS_RE.sub(' ', statement).strip()
+    text = _LITERAL_RE.sub('?', text)
+    return _IN_LIST_RE.sub('(?)', text)
+
+
+def query_budget(limit: int):
+    """Define um orçamento de queries próprio para a rota decorada."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def install_query_counter(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_start'].pop()
+        stats = g.get('query_stats') if has_app_context() else None
+        if stats is not None:
+            stats.record(statement, perf_counter() - started)
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_start'):
+            conn.info['query_start'].pop()
+
+
+def init_query_stats(app):
+    if not app.config['QUERY_STATS']:
+        return
+
+    @app.before_request
+    def _start_query_stats():
+        g.query_stats = QueryStats()
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+        # corpo em streaming ainda não foi gerado: os cabeçalhos cobrem só o que rodou até aqui
+        response.headers['X-DB-Queries'] = str(stats.count)
+        response.headers['X-DB-Time-Ms'] = f'{stats.duration * 1000:.2f}'
+        response.headers['X-DB-Repeated'] = str(stats.repeated)
+        view = current_app.view_functions.get(request.endpoint)
+        check = _StatsCheck(stats, f'{request.method} {request.path}',
+                            getattr(view, 'query_budget', current_app.config['QUERY_BUDGET']),
+                            current_app.config['QUERY_REPEAT_THRESHOLD'], current_app.config['QUERY_BUDGET_STRICT'])
+        if response.is_streamed:
+            # fecha a conta quando o corpo termina de sair; aí não há mais como falhar a rota, só registrar
+            response.call_on_close(lambda: check.run(strict=False))
+        else:
+            check.run()
+        return response
+
+
+@dataclass
+class _StatsCheck:
+    stats: QueryStats
+    route: str
+    budget: int
+    repeat_threshold: int
+    strict: bool
+
+    def run(self, strict=None):
+        stats = self.stats
+        logger.debug('%s queries=%d db_ms=%.2f repeated=%d', self.route, stats.count, stats.duration * 1000,
+                     stats.repeated)
+        for fp, n in stats.hot_spots(self.repeat_threshold):
+            logger.warning('Possível N+1 em %s: %dx %s', self.route, n, fp)
+        if self.budget and stats.count > self.budget:
+            message = f'{self.route} executou {stats.count} queries (orçamento {self.budget}).'
+            if self.strict if strict is None else strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
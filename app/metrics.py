@@ -0,0 +1,188 @@
+from __future__ import annotations
+from bisect import bisect_left
+import logging
+import threading
+from time import perf_counter
+
+from flask import Response, current_app, g, request
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()) -> str:
+        pairs = [*zip(self.labelnames, key), *extra]
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._samples(items))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, items):
+        return [f'{self.name}{self._labels(key)} {_number(value)}' for key, value in items]
+
+
+class Histogram(_Metric):
+    """Buckets cumulativos só na exposição; observe() incrementa um único bucket."""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # contagem por bucket (+Inf no fim), soma, total
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _samples(self, items):
+        lines = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, bucket in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f'{self.name}_bucket{self._labels(key, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{self._labels(key)} {_number(total)}')
+            lines.append(f'{self.name}_count{self._labels(key)} {n}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Métricas do processo (cada worker expõe as suas; o Prometheus agrega por instância)
+REGISTRY = Registry()
+REQUESTS = REGISTRY.counter('barbershop_requests_total', 'Requisições atendidas.', ['endpoint', 'method', 'status'])
+REQUEST_LATENCY = REGISTRY.histogram('barbershop_request_duration_seconds', 'Latência das requisições por endpoint.',
+                                     ['endpoint', 'method'])
+REQUEST_DB_TIME = REGISTRY.histogram('barbershop_request_db_seconds', 'Tempo em queries por requisição.',
+                                     ['endpoint'])
+POOL_WAIT = REGISTRY.histogram('barbershop_db_pool_checkout_seconds', 'Espera para obter conexão do pool.',
+                               buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+EMAIL_SEND = REGISTRY.histogram('barbershop_email_send_seconds', 'Duração do envio de cada e-mail.', ['mode'])
+EMAIL_FAILURES = REGISTRY.counter('barbershop_email_failures_total', 'Envios de e-mail que falharam.', ['mode'])
+CACHE_REQUESTS = REGISTRY.counter('barbershop_cache_requests_total',
+                                  'Consultas aos caches em memória por resultado (hit, revalidated, miss).',
+                                  ['cache', 'result'])
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool que mede a espera no checkout (inclui abrir conexão nova quando o pool está vazio)."""
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(perf_counter() - started)
+
+
+def init_metrics(app):
+    if not app.config['METRICS']:
+        return
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'not_found'
+        method, path = request.method, request.path
+        REQUESTS.inc(endpoint=endpoint, method=method, status=response.status_code)
+        stats = g.get('query_stats')
+        threshold = current_app.config['SLOW_REQUEST_MS']
+
+        def observe():
+            elapsed = perf_counter() - started
+            REQUEST_LATENCY.observe(elapsed, endpoint=endpoint, method=method)
+            if stats is not None:
+                REQUEST_DB_TIME.observe(stats.duration, endpoint=endpoint)
+            if threshold and elapsed * 1000 >= threshold:
+                logger.warning('Requisição lenta: %s %s %.1f ms (db %.1f ms, %s queries)', method, path,
+                               elapsed * 1000, stats.duration * 1000 if stats else 0, stats.count if stats else '?')
+
+        if response.is_streamed:
+            # o corpo (e as queries feitas ao gerá-lo) só termina depois deste hook: mede até o fim do envio
+            response.call_on_close(observe)
+        else:
+            observe()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
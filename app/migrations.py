@@ -0,0 +1,165 @@
+from __future__ import annotations
+from datetime import date
+import logging
+
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from . import occupancy, search, table_versions, visit_stats
+from .models import (AggregateCoverage, Appointment, ArchivedAppointment, Base, ClientArchiveStats, ClientVisitStats,
+                     ClientWeekCount, DailyOccupancy, EmailOutbox, ReportJob, SchemaMigration, SlotCount, TableVersion)
+from .services import seed_defaults
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def _create_indexes(conn, model, *names):
+    for index in model.__table__.indexes:
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+
+@migration(1, 'Índices compostos de appointments')
+def _appointment_indexes(conn):
+    _create_indexes(conn, Appointment, 'ix_appointments_client_status_datetime', 'ix_appointments_datetime_id')
+
+
+@migration(2, 'Resumo de visitas por cliente')
+def _client_visit_stats(conn):
+    ClientVisitStats.__table__.create(conn, checkfirst=True)
+    ClientWeekCount.__table__.create(conn, checkfirst=True)
+    visit_stats.rebuild(conn)
+
+
+@migration(3, 'Outbox de e-mails')
+def _email_outbox(conn):
+    EmailOutbox.__table__.create(conn, checkfirst=True)
+
+
+@migration(4, 'Índice de busca de clientes')
+def _client_search(conn):
+    search.create_search_index(conn)
+    search.rebuild(conn)
+
+
+@migration(5, 'Ocupação de cadeiras por slot')
+def _slot_counts(conn):
+    SlotCount.__table__.create(conn, checkfirst=True)
+    visit_stats.rebuild(conn)
+
+
+@migration(6, 'Planos e configurações padrão')
+def _seed_defaults(conn):
+    # novos seeds entram como novas migrações; assim o boot não precisa conferir cada um
+    with Session(bind=conn) as session:
+        seed_defaults(session)
+        session.flush()
+
+
+@migration(7, 'Versões por tabela para GET condicional')
+def _table_versions(conn):
+    TableVersion.__table__.create(conn, checkfirst=True)
+    table_versions.seed(conn)
+
+
+@migration(8, 'Arquivo de agendamentos encerrados')
+def _appointments_archive(conn):
+    ArchivedAppointment.__table__.create(conn, checkfirst=True)
+    ClientArchiveStats.__table__.create(conn, checkfirst=True)
+
+
+@migration(9, 'Ocupação diária por hora e status')
+def _daily_occupancy(conn):
+    DailyOccupancy.__table__.create(conn, checkfirst=True)
+    AggregateCoverage.__table__.create(conn, checkfirst=True)
+    _create_indexes(conn, ArchivedAppointment, 'ix_appointments_archive_datetime')
+    # só de hoje em diante (agenda futura, pequena); o histórico fica para 'flask backfill-occupancy'
+    occupancy.materialize(conn, date.today())
+
+
+@migration(10, 'Fila de relatórios')
+def _report_jobs(conn):
+    ReportJob.__table__.create(conn, checkfirst=True)
+
+
+@migration(11, 'Versões do arquivo e da ocupação diária')
+def _report_table_versions(conn):
+    table_versions.seed(conn)
+
+
+@migration(12, 'Nomes normalizados para a ordem da busca de clientes')
+def _client_search_names(conn):
+    search.create_search_index(conn)
+    search.rebuild(conn)
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0]
+
+
+def schema_version(engine) -> int:
+    """Maior migração aplicada (0 se o banco ainda não foi inicializado): uma única query."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.max(SchemaMigration.version))).scalar() or 0
+    except DBAPIError:
+        return 0
+
+
+def ensure_current(engine, auto_init: bool) -> list:
+    """Chamada no boot de cada worker: só confere a versão, e inicializa se permitido."""
+    if schema_version(engine) >= latest_version():
+        return []
+    if not auto_init:
+        raise RuntimeError('Banco não inicializado ou desatualizado: rode "flask --app run init-db".')
+    return init_db(engine)
+
+
+def init_db(engine) -> list:
+    """Cria o schema e aplica migrações e seeds pendentes; idempotente e seguro com vários processos."""
+    return _migrate(engine, create_all=True)
+
+
+def migrate(engine) -> list:
+    """Aplica, em ordem, as migrações ainda não registradas."""
+    return _migrate(engine, create_all=False)
+
+
+def _migrate(engine, create_all: bool) -> list:
+    applied = []
+    # Uma transação só, aberta com a trava: workers que sobem juntos esperam o primeiro
+    # terminar e depois não encontram nada pendente
+    with engine.begin() as conn:
+        _lock(conn)
+        if create_all:
+            Base.metadata.create_all(conn)
+        else:
+            SchemaMigration.__table__.create(conn, checkfirst=True)
+        done = set(conn.execute(select(SchemaMigration.version)).scalars())
+        for version, description, fn in MIGRATIONS:
+            if version in done:
+                continue
+            fn(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(version=version, description=description))
+            logger.info('Migração %s aplicada: %s', version, description)
+            applied.append(version)
+    return applied
+
+
+def _lock(conn):
+    if conn.dialect.name == 'sqlite':
+        # o pysqlite só abre transação antes de DML; BEGIN IMMEDIATE já pega a trava de escrita
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+    elif conn.dialect.name == 'postgresql':
+        conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': 0x62617262})
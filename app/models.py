@@ -1,6 +1,6 @@
 from datetime import datetime, date
 from enum import Enum
-from sqlalchemy import (Boolean, Column, Date, DateTime, Enum as SAEnum, ForeignKey,
+from sqlalchemy import (Boolean, Column, Date, DateTime, Enum as SAEnum, ForeignKey, Index,
                         Integer, Numeric, String, Text)
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -16,6 +16,18 @@ class AppointmentStatus(str, Enum):
     CANCELED = 'CANCELED'
     NO_SHOW = 'NO_SHOW'
 
+class OutboxStatus(str, Enum):
+    PENDING = 'PENDING'
+    SENDING = 'SENDING'
+    SENT = 'SENT'
+    FAILED = 'FAILED'
+
+class ReportStatus(str, Enum):
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
 class Client(Base):
     __tablename__ = 'clients'
     id = Column(Integer, primary_key=True)
@@ -56,7 +68,130 @@ class Appointment(Base):
 
     client = relationship('Client')
 
+    __table_args__ = (
+        # validação de plano, estimador e histórico do cliente
+        Index('ix_appointments_client_status_datetime', 'client_id', 'status', 'appointment_date_time'),
+        # agenda paginada, contagens do dashboard e export por período
+        Index('ix_appointments_datetime_id', 'appointment_date_time', 'id'),
+    )
+
+class ArchivedAppointment(Base):
+    """Agendamentos encerrados e antigos, movidos de appointments pelo arquivamento (ver app/archive.py)."""
+    __tablename__ = 'appointments_archive'
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    client_id = Column(Integer, nullable=False)
+    appointment_date_time = Column(DateTime, nullable=False)
+    service = Column(String(255), nullable=False)
+    status = Column(SAEnum(AppointmentStatus), nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_appointments_archive_client_datetime', 'client_id', 'appointment_date_time'),
+        # ocupação por período ainda não materializada
+        Index('ix_appointments_archive_datetime', 'appointment_date_time'),
+    )
+
 class AppSetting(Base):
     __tablename__ = 'app_settings'
     setting_key = Column(String(100), primary_key=True)
     setting_value = Column(String(1000), nullable=False)
+
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+    id = Column(Integer, primary_key=True)
+    to_email = Column(String(255), nullable=False)
+    from_email = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(SAEnum(OutboxStatus), nullable=False, default=OutboxStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = Column(String(40))
+    claimed_at = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+class ClientVisitStats(Base):
+    """Resumo derivado de appointments, mantido a cada flush (ver app/visit_stats.py)."""
+    __tablename__ = 'client_visit_stats'
+    client_id = Column(Integer, primary_key=True)
+    done_count = Column(Integer, nullable=False, default=0)
+    first_done_at = Column(DateTime)
+    last_done_at = Column(DateTime)
+
+    @property
+    def gap_sum_days(self) -> int:
+        # soma dos intervalos entre cortes consecutivos = último - primeiro
+        if not self.first_done_at:
+            return 0
+        return (self.last_done_at.date() - self.first_done_at.date()).days
+
+class ClientArchiveStats(Base):
+    """Resumo por cliente do que já foi arquivado; somado ao histórico vivo em client_visit_stats."""
+    __tablename__ = 'client_archive_stats'
+    client_id = Column(Integer, primary_key=True)
+    done_count = Column(Integer, nullable=False, default=0)
+    canceled_count = Column(Integer, nullable=False, default=0)
+    no_show_count = Column(Integer, nullable=False, default=0)
+    first_done_at = Column(DateTime)
+    last_done_at = Column(DateTime)
+
+    @property
+    def total(self) -> int:
+        return self.done_count + self.canceled_count + self.no_show_count
+
+class ClientWeekCount(Base):
+    __tablename__ = 'client_week_counts'
+    client_id = Column(Integer, primary_key=True)
+    week_start = Column(Date, primary_key=True)
+    scheduled_count = Column(Integer, nullable=False, default=0)
+
+class SlotCount(Base):
+    __tablename__ = 'slot_counts'
+    slot_start = Column(DateTime, primary_key=True)
+    scheduled_count = Column(Integer, nullable=False, default=0)
+
+class DailyOccupancy(Base):
+    """Agendamentos por dia, hora e status (ver app/occupancy.py); appointment_count inclui os arquivados."""
+    __tablename__ = 'daily_occupancy'
+    day = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    status = Column(SAEnum(AppointmentStatus), primary_key=True)
+    appointment_count = Column(Integer, nullable=False, default=0)
+
+class AggregateCoverage(Base):
+    """A partir de que dia um agregado está materializado; antes disso, leitura direto das tabelas base."""
+    __tablename__ = 'aggregate_coverage'
+    name = Column(String(100), primary_key=True)
+    covered_from = Column(Date, nullable=False)
+
+class ReportJob(Base):
+    """Relatório calculado fora da requisição (ver app/reports.py); cache_key inclui as versões das tabelas lidas."""
+    __tablename__ = 'report_jobs'
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    params = Column(Text, nullable=False)       # JSON canônico
+    cache_key = Column(String(64), nullable=False, unique=True)
+    status = Column(SAEnum(ReportStatus), nullable=False, default=ReportStatus.PENDING)
+    result = Column(Text)                       # JSON {"columns": [...], "rows": [...]}
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class TableVersion(Base):
+    __tablename__ = 'table_versions'
+    table_name = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migrations'
+    version = Column(Integer, primary_key=True)
+    description = Column(String(255), nullable=False)
+    applied_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,170 @@
+"""Ocupação por dia e hora: agregado diário mantido a cada escrita e materializado para trás em lotes.
+
+daily_occupancy recebe deltas de todo agendamento gravado (ver visit_stats.apply_changes), mas só é
+confiável a partir de aggregate_coverage.covered_from; dias anteriores são lidos com um GROUP BY direto
+em appointments + appointments_archive até o backfill chegar neles.
+"""
+from __future__ import annotations
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Date, Integer, cast, delete, extract, func, insert, select, union_all, update
+
+from . import table_versions
+from .models import AggregateCoverage, Appointment, ArchivedAppointment, DailyOccupancy
+
+COVERAGE = 'daily_occupancy'
+
+_OCCUPANCY = DailyOccupancy.__table__
+_COVERAGE = AggregateCoverage.__table__
+_LIVE = Appointment.__table__
+_ARCHIVED = ArchivedAppointment.__table__
+
+
+@dataclass
+class Heatmap:
+    start: date
+    end: date
+    weeks: list         # colunas do calendário, segunda a domingo: (dia, total, nível) ou None fora do período
+    hours: list         # (hora, [(total, nível)] de segunda a domingo)
+    by_status: Counter
+    total: int
+
+
+class OccupancyService:
+    MAX_DAYS = 366
+    LEVELS = 4
+
+    def __init__(self, session):
+        self.session = session
+
+    def by_day(self, start: date, end: date) -> list:
+        """Linhas (day, status, count) em ordem de dia."""
+        return self.counts(start, end, ('day',))
+
+    def by_hour(self, start: date, end: date) -> list:
+        """Linhas (day, hour, status, count) em ordem de dia e hora."""
+        return self.counts(start, end, ('day', 'hour'))
+
+    def counts(self, start: date, end: date, dimensions, statuses=None) -> list:
+        """Contagens agrupadas por dimensions (day, hour, weekday) e status, somadas no banco.
+
+        weekday segue o banco: 0 = domingo. Com parte do período fora da cobertura, uma dimensão sem
+        day pode repetir a mesma chave nas duas partes.
+        """
+        covered = covered_from(self.session)
+        rows = []
+        if covered is None or start < covered:
+            last = end if covered is None else min(end, covered - timedelta(days=1))
+            rows.extend(self.session.execute(_grouped(start, last, dimensions, statuses)))
+        if covered is not None and end >= covered:
+            o = _OCCUPANCY.c
+            keys = _keys(dimensions, o.day, o.hour)
+            total = func.sum(o.appointment_count)
+            stmt = select(*keys, o.status, total).where(o.day >= max(start, covered), o.day <= end)
+            if statuses:
+                stmt = stmt.where(o.status.in_(statuses))
+            rows.extend(self.session.execute(stmt.group_by(*keys, o.status).having(total != 0).order_by(*keys)))
+        return rows
+
+    def heatmap(self, start: date, end: date, statuses=None) -> Heatmap:
+        """Calendário de totais por dia e grade dia da semana x hora, agregados no banco."""
+        per_day = Counter()
+        by_status = Counter()
+        for day, status, count in self.counts(start, end, ('day',), statuses):
+            per_day[day] += count
+            by_status[status] += count
+        per_cell = Counter()
+        for weekday, hour, _, count in self.counts(start, end, ('weekday', 'hour'), statuses):
+            per_cell[((weekday + 6) % 7, hour)] += count
+
+        top = max(per_day.values(), default=0)
+        weeks = []
+        day = start - timedelta(days=start.weekday())
+        while day <= end:
+            weeks.append([(d, per_day[d], self._level(per_day[d], top)) if start <= d <= end else None
+                          for d in (day + timedelta(days=i) for i in range(7))])
+            day += timedelta(days=7)
+        top = max(per_cell.values(), default=0)
+        hours = sorted({hour for _, hour in per_cell})
+        grid = [(hour, [(per_cell[(weekday, hour)], self._level(per_cell[(weekday, hour)], top))
+                        for weekday in range(7)])
+                for hour in range(hours[0], hours[-1] + 1)] if hours else []
+        return Heatmap(start, end, weeks, grid, by_status, sum(by_status.values()))
+
+    def _level(self, count: int, top: int) -> int:
+        return -(-count * self.LEVELS // top) if count else 0
+
+
+def covered_from(conn) -> Optional[date]:
+    return conn.execute(select(_COVERAGE.c.covered_from).where(_COVERAGE.c.name == COVERAGE)).scalar()
+
+
+def materialize(conn, start: date, end: Optional[date] = None):
+    """Recalcula os dias [start, end] (sem end: daí em diante) a partir das tabelas base e marca a cobertura."""
+    where = [_OCCUPANCY.c.day >= start] + ([_OCCUPANCY.c.day <= end] if end else [])
+    conn.execute(delete(_OCCUPANCY).where(*where))
+    conn.execute(insert(_OCCUPANCY).from_select(['day', 'hour', 'status', 'appointment_count'],
+                                                _grouped(start, end, ('day', 'hour'))))
+    current = covered_from(conn)
+    if current is None:
+        conn.execute(insert(_COVERAGE).values(name=COVERAGE, covered_from=start))
+    elif start < current:
+        conn.execute(update(_COVERAGE).where(_COVERAGE.c.name == COVERAGE).values(covered_from=start))
+
+
+def backfill(engine, days: int = 31) -> Optional[date]:
+    """Materializa mais `days` dias para trás, numa transação; devolve a nova cobertura ou None se acabou."""
+    with engine.begin() as conn:
+        start = _extend_coverage(conn, days)
+    if start is not None:
+        # relatórios em cache leem daily_occupancy (ver reports.REPORTS)
+        with engine.begin() as conn:
+            table_versions.bump(conn, [_OCCUPANCY.name])
+    return start
+
+
+def _extend_coverage(conn, days: int) -> Optional[date]:
+    if conn.dialect.name == 'sqlite':
+        # trava de escrita antes de ler a base: nenhum delta entra entre o recálculo e a troca
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+    covered = covered_from(conn)
+    if covered is None:
+        materialize(conn, date.today())
+        return date.today()
+    first = conn.execute(select(func.min(union_all(
+        select(func.min(_LIVE.c.appointment_date_time).label('at')),
+        select(func.min(_ARCHIVED.c.appointment_date_time)),
+    ).subquery().c.at))).scalar()
+    if first is None or first.date() >= covered:
+        return None
+    start = max(first.date(), covered - timedelta(days=days))
+    materialize(conn, start, covered - timedelta(days=1))
+    return start
+
+
+def _keys(dimensions, day, hour) -> list:
+    expressions = {
+        'day': lambda: day,
+        'hour': lambda: hour,
+        'weekday': lambda: cast(extract('dow', day), Integer),
+    }
+    return [expressions[name]() for name in dimensions]
+
+
+def _grouped(start: date, end: Optional[date], dimensions, statuses=None):
+    """Um único GROUP BY sobre agendamentos vivos e arquivados no período."""
+    parts = []
+    for table in (_LIVE, _ARCHIVED):
+        at = table.c.appointment_date_time
+        where = [at >= datetime.combine(start, datetime.min.time())]
+        if end:
+            where.append(at < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        if statuses:
+            where.append(table.c.status.in_(statuses))
+        parts.append(select(at.label('at'), table.c.status.label('status')).where(*where))
+    rows = union_all(*parts).subquery()
+    keys = _keys(dimensions, func.date(rows.c.at, type_=Date), cast(extract('hour', rows.c.at), Integer))
+    return select(*keys, rows.c.status, func.count()).group_by(*keys, rows.c.status).order_by(*keys)
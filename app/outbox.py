@@ -0,0 +1,197 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+import atexit
+import logging
+import smtplib
+import threading
+from time import perf_counter
+import uuid
+import weakref
+
+from sqlalchemy import event, or_, select, update
+from sqlalchemy.orm import Session
+
+from .metrics import EMAIL_FAILURES, EMAIL_SEND
+from .models import EmailOutbox, OutboxStatus
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxSender:
+    """Drena email_outbox em lotes reaproveitando uma única conexão SMTP."""
+
+    def __init__(self, session_factory, mode_reader, smtp_host='localhost', smtp_port=1025, batch_size=50,
+                 max_attempts=5, retry_base_seconds=30, lease_seconds=300, smtp_factory=smtplib.SMTP):
+        self.session_factory = session_factory
+        self.mode_reader = mode_reader
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.smtp_factory = smtp_factory
+        self._smtp = None
+
+    def drain(self) -> int:
+        """Envia até esvaziar a fila de mensagens vencidas; devolve quantas foram enviadas."""
+        sent = 0
+        try:
+            while True:
+                batch_sent, claimed = self.send_batch()
+                sent += batch_sent
+                if claimed < self.batch_size:
+                    return sent
+        finally:
+            self.close()
+
+    def send_batch(self):
+        session = self.session_factory()
+        try:
+            messages = self._claim(session)
+            if not messages:
+                return 0, 0
+            mode = self.mode_reader(session)
+            sent = 0
+            for message in messages:
+                started = perf_counter()
+                try:
+                    self._deliver(mode, message)
+                except Exception as ex:
+                    EMAIL_FAILURES.inc(mode=mode)
+                    self._fail(message, ex)
+                else:
+                    EMAIL_SEND.observe(perf_counter() - started, mode=mode)
+                    message.status = OutboxStatus.SENT
+                    message.sent_at = datetime.utcnow()
+                    message.last_error = None
+                    sent += 1
+                message.claim_token = None
+                session.commit()
+            return sent, len(messages)
+        finally:
+            session.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _claim(self, session):
+        # Reserva o lote com um UPDATE condicional: vários workers nunca pegam a mesma mensagem
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        claimable = or_(
+            (EmailOutbox.status == OutboxStatus.PENDING) & (EmailOutbox.next_attempt_at <= now),
+            (EmailOutbox.status == OutboxStatus.SENDING) & (EmailOutbox.claimed_at < now - timedelta(seconds=self.lease_seconds)),
+        )
+        ids = select(EmailOutbox.id).where(claimable).order_by(EmailOutbox.id).limit(self.batch_size)
+        session.execute(
+            update(EmailOutbox).where(EmailOutbox.id.in_(ids.scalar_subquery()), claimable)
+            .values(status=OutboxStatus.SENDING, claim_token=token, claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        return session.query(EmailOutbox).filter_by(claim_token=token).order_by(EmailOutbox.id).all()
+
+    def _deliver(self, mode, message: EmailOutbox):
+        if mode == 'TEST':
+            logger.info('[EMAIL TEST] to=%s subject=%s body=%s', message.to_email, message.subject, message.body)
+            return
+        msg = EmailMessage()
+        msg['From'] = message.from_email
+        msg['To'] = message.to_email
+        msg['Subject'] = message.subject
+        msg.set_content(message.body)
+        try:
+            self._connection().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # conexão reaproveitada caiu (timeout do servidor): reabre uma vez
+            self._smtp = None
+            self._connection().send_message(msg)
+
+    def _connection(self):
+        if self._smtp is None:
+            self._smtp = self.smtp_factory(self.smtp_host, self.smtp_port, timeout=10)
+        return self._smtp
+
+    def _fail(self, message: EmailOutbox, ex: Exception):
+        message.attempts += 1
+        message.last_error = f'{type(ex).__name__}: {ex}'
+        if message.attempts >= self.max_attempts:
+            message.status = OutboxStatus.FAILED
+            logger.error('E-mail %s para %s falhou definitivamente: %s', message.id, message.to_email, ex)
+        else:
+            message.status = OutboxStatus.PENDING
+            delay = self.retry_base_seconds * 2 ** (message.attempts - 1)
+            message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            logger.warning('E-mail %s para %s falhou (tentativa %s): %s', message.id, message.to_email,
+                           message.attempts, ex)
+        if isinstance(ex, (smtplib.SMTPServerDisconnected, OSError)):
+            self._smtp = None
+
+
+class OutboxWorker(threading.Thread):
+    """Thread de fundo que drena o outbox periodicamente ou quando acordada por um commit."""
+    _instances = weakref.WeakSet()
+
+    def __init__(self, sender: OutboxSender, interval: float = 2.0):
+        super().__init__(name='email-outbox', daemon=True)
+        self.sender = sender
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._launched = False
+        OutboxWorker._instances.add(self)
+
+    def ensure_started(self):
+        if self._launched:
+            return
+        with self._start_lock:
+            if not self._launched:
+                self._launched = True
+                self.start()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                self.sender.drain()
+            except Exception:
+                logger.exception('Falha ao drenar o outbox de e-mails.')
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0):
+        """Para a thread e espera ela terminar o lote em andamento."""
+        self._stopping.set()
+        self._wake.set()
+        if self._launched and self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    @classmethod
+    def stop_all(cls, timeout: float = 5.0):
+        for worker in list(cls._instances):
+            worker.stop(timeout)
+
+    @classmethod
+    def wake_all(cls):
+        for worker in list(cls._instances):
+            worker.wake()
+
+
+# sem isso o interpretador pode encerrar com um lote no meio do envio
+atexit.register(OutboxWorker.stop_all)
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_outbox_workers(session):
+    if session.info.pop('outbox_enqueued', False):
+        OutboxWorker.wake_all()
@@ -0,0 +1,378 @@
+"""Relatórios gerenciais calculados fora da requisição, num pool de processos.
+
+Um pedido vira uma linha em report_jobs; a chave do cache junta tipo, parâmetros e as versões das tabelas
+lidas (table_versions). Pedido igual com os dados iguais reaproveita o job (pronto ou em andamento);
+qualquer escrita nessas tabelas muda a chave e o próximo pedido recalcula.
+"""
+from __future__ import annotations
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import csv
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import threading
+from typing import Callable, Optional
+
+from flask import Response, flash, jsonify, redirect, render_template, request, url_for
+from sqlalchemy import and_, delete, func, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db, table_versions
+from .db import get_session
+from .models import (Appointment, AppointmentStatus, ArchivedAppointment, Plan, ReportJob, ReportStatus,
+                     Subscription)
+from .occupancy import OccupancyService
+
+logger = logging.getLogger(__name__)
+
+_JOBS = ReportJob.__table__
+_PLANS = Plan.__table__
+_SUBSCRIPTIONS = Subscription.__table__
+_LIVE = Appointment.__table__
+_ARCHIVED = ArchivedAppointment.__table__
+
+CLOSED = (AppointmentStatus.DONE, AppointmentStatus.CANCELED, AppointmentStatus.NO_SHOW)
+
+
+class ReportError(ValueError):
+    pass
+
+
+@dataclass
+class Report:
+    name: str
+    title: str
+    compute: Callable           # (conexão, parâmetros, tamanho do lote) -> {"columns": [...], "rows": [...]}
+    params: dict                # nome -> (conversor, padrão)
+    depends: tuple              # tabelas cujas versões entram na chave do cache
+
+    def parse(self, raw: dict) -> dict:
+        unknown = sorted(set(raw) - set(self.params))
+        if unknown:
+            raise ReportError(f"Parâmetros desconhecidos: {', '.join(unknown)}.")
+        params = {}
+        for name, (convert, default) in self.params.items():
+            value = raw.get(name)
+            try:
+                params[name] = convert(value) if value not in (None, '') else default()
+            except ValueError:
+                raise ReportError(f'Valor inválido para {name}: {value}.')
+        if 'start' in params and params['start'] > params['end']:
+            raise ReportError('start deve ser anterior a end.')
+        return params
+
+
+def _iso_date(value) -> str:
+    return date.fromisoformat(str(value)).isoformat()
+
+
+def _months(value) -> int:
+    months = int(value)
+    if not 1 <= months <= 24:
+        raise ValueError(value)
+    return months
+
+
+def _year_ago() -> str:
+    return (date.today() - timedelta(days=365)).isoformat()
+
+
+def _today() -> str:
+    return date.today().isoformat()
+
+
+def _percent(part: int, total: int) -> Optional[float]:
+    return round(100 * part / total, 1) if total else None
+
+
+def _money(value: Decimal) -> str:
+    return f'{value:.2f}'
+
+
+def revenue_by_plan(conn, params, batch_size):
+    """Receita recorrente por plano: preço x assinaturas ativas."""
+    subscriptions = func.count(_SUBSCRIPTIONS.c.id)
+    rows = conn.execute(
+        select(_PLANS.c.name, _PLANS.c.price, _PLANS.c.active, subscriptions)
+        .select_from(_PLANS.outerjoin(_SUBSCRIPTIONS, and_(_SUBSCRIPTIONS.c.plan_id == _PLANS.c.id,
+                                                           _SUBSCRIPTIONS.c.active.is_(True))))
+        .group_by(_PLANS.c.id, _PLANS.c.name, _PLANS.c.price, _PLANS.c.active).order_by(_PLANS.c.name))
+    result, total_subscriptions, total = [], 0, Decimal(0)
+    for name, price, active, count in rows:
+        revenue = Decimal(price) * count
+        result.append([name, _money(Decimal(price)), active, count, _money(revenue)])
+        total_subscriptions += count
+        total += revenue
+    result.append(['Total', None, None, total_subscriptions, _money(total)])
+    return {'columns': ['plano', 'preco', 'plano_ativo', 'assinaturas_ativas', 'receita'], 'rows': result}
+
+
+def attendance_rates(conn, params, batch_size):
+    """Cancelamentos e faltas por mês entre os agendamentos encerrados, arquivados inclusive."""
+    start, end = date.fromisoformat(params['start']), date.fromisoformat(params['end'])
+    months = defaultdict(Counter)
+    # reaproveita o agregado diário de ocupação onde ele já está materializado
+    for day, status, count in OccupancyService(conn).counts(start, end, ('day',), CLOSED):
+        months[day.strftime('%Y-%m')][status] += count
+    rows = []
+    for month in sorted(months):
+        counts = months[month]
+        closed = sum(counts.values())
+        done, canceled, no_show = (counts[s] for s in CLOSED)
+        rows.append([month, closed, done, canceled, no_show, _percent(canceled, closed), _percent(no_show, closed)])
+    return {'columns': ['mes', 'encerrados', 'concluidos', 'cancelados', 'faltas', 'taxa_cancelamento',
+                        'taxa_falta'], 'rows': rows}
+
+
+def retention_cohorts(conn, params, batch_size):
+    """Coortes pelo mês de início da assinatura: % de clientes com atendimento concluído em cada mês seguinte."""
+    start, end = date.fromisoformat(params['start']), date.fromisoformat(params['end'])
+    months = params['months']
+    started = _SUBSCRIPTIONS.c.start_date
+    in_range = and_(started >= start, started <= end)
+
+    cohorts = Counter()
+    for batch in conn.execution_options(yield_per=batch_size).execute(select(started).where(in_range)).partitions():
+        cohorts.update((day.year, day.month) for day, in batch)
+
+    retained = defaultdict(set)
+    visits = union_all(*(
+        select(table.c.client_id, table.c.appointment_date_time.label('at'))
+        .where(table.c.status == AppointmentStatus.DONE) for table in (_LIVE, _ARCHIVED))).subquery()
+    stmt = (select(visits.c.client_id, visits.c.at, started)
+            .join(_SUBSCRIPTIONS, _SUBSCRIPTIONS.c.client_id == visits.c.client_id)
+            .where(in_range, visits.c.at >= started))
+    for batch in conn.execution_options(yield_per=batch_size).execute(stmt).partitions():
+        for client_id, at, day in batch:
+            offset = (at.year - day.year) * 12 + at.month - day.month - (at.day < day.day)
+            if offset < months:
+                retained[(day.year, day.month, offset)].add(client_id)
+
+    today = date.today()
+    rows = []
+    for year, month in sorted(cohorts):
+        size = cohorts[(year, month)]
+        cells = []
+        for offset in range(months):
+            elapsed = (today.year - year) * 12 + today.month - month >= offset
+            cells.append(_percent(len(retained[(year, month, offset)]), size) if elapsed else None)
+        rows.append([f'{year:04d}-{month:02d}', size, *cells])
+    return {'columns': ['coorte', 'clientes', *(f'm{i}' for i in range(months))], 'rows': rows}
+
+
+RANGE = {'start': (_iso_date, _year_ago), 'end': (_iso_date, _today)}
+
+REPORTS = {report.name: report for report in (
+    Report('revenue_by_plan', 'Receita por plano', revenue_by_plan, {}, ('plans', 'subscriptions')),
+    Report('attendance_rates', 'Cancelamentos e faltas por mês', attendance_rates, RANGE,
+           ('appointments', 'appointments_archive', 'daily_occupancy')),
+    Report('retention_cohorts', 'Retenção por coorte de assinatura', retention_cohorts,
+           {**RANGE, 'months': (_months, lambda: 6)}, ('appointments', 'appointments_archive', 'subscriptions')),
+)}
+
+
+def job_json(job: ReportJob) -> dict:
+    data = {'id': job.id, 'kind': job.kind, 'params': json.loads(job.params), 'status': job.status.value,
+            'created_at': job.created_at.isoformat(),
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'status_url': url_for('report_status', job_id=job.id)}
+    if job.status == ReportStatus.DONE:
+        data['download_url'] = url_for('report_download', job_id=job.id)
+    if job.status == ReportStatus.FAILED:
+        data['error'] = job.error
+    return data
+
+
+class ReportService:
+    JOB_TIMEOUT = 600
+
+    def __init__(self, session, job_timeout: int = JOB_TIMEOUT):
+        self.session = session
+        self.job_timeout = job_timeout
+
+    def submit(self, kind: str, raw_params: dict):
+        """Devolve (job, precisa_calcular); pedido repetido com os mesmos dados devolve o job existente."""
+        report = REPORTS.get(kind)
+        if report is None:
+            raise ReportError(f'Relatório desconhecido: {kind}.')
+        params = json.dumps(report.parse(raw_params), sort_keys=True)
+        try:
+            job, queue = self._submit(report, params)
+            self.session.commit()
+        except IntegrityError:
+            # o mesmo pedido chegou ao mesmo tempo por outra requisição: usa o job dela
+            self.session.rollback()
+            job, queue = self._submit(report, params)
+            self.session.commit()
+        return job, queue
+
+    def _submit(self, report: Report, params: str):
+        versions = table_versions.current(self.session, report.depends)
+        stamp = '|'.join(f'{t}:{versions.get(t, (0,))[0]}' for t in sorted(report.depends))
+        key = hashlib.sha256(f'{report.name}|{params}|{stamp}'.encode()).hexdigest()
+        job = self.session.execute(select(ReportJob).where(ReportJob.cache_key == key)).scalar()
+        if job is not None and not self._needs_run(job):
+            return job, False
+        if job is None:
+            # resultados de versões anteriores dos dados não servem mais
+            self.session.execute(delete(ReportJob).where(
+                ReportJob.kind == report.name, ReportJob.params == params,
+                ReportJob.status.in_((ReportStatus.DONE, ReportStatus.FAILED))))
+            job = ReportJob(kind=report.name, params=params, cache_key=key)
+            self.session.add(job)
+        else:
+            job.status, job.error, job.result = ReportStatus.PENDING, None, None
+            job.created_at, job.started_at, job.finished_at = datetime.utcnow(), None, None
+        self.session.flush()
+        return job, True
+
+    def _needs_run(self, job: ReportJob) -> bool:
+        if job.status == ReportStatus.FAILED:
+            return True
+        if job.status == ReportStatus.DONE:
+            return False
+        # pendente ou rodando há tempo demais: o processo que o calculava morreu
+        since = job.started_at or job.created_at
+        return datetime.utcnow() - since > timedelta(seconds=self.job_timeout)
+
+    def recent(self, limit: int = 20) -> list:
+        return list(self.session.execute(select(ReportJob).order_by(ReportJob.id.desc()).limit(limit)).scalars())
+
+
+_engines = {}
+
+
+def run_job(database_url: str, job_id: int, options: dict) -> str:
+    """Executa no processo do pool: abre a própria engine e grava o resultado ou o erro no job."""
+    engine = _engines.get(database_url)
+    if engine is None:
+        engine = _engines[database_url] = db.create_branch('reports', database_url, options).engine
+    return execute(engine, job_id, options.get('REPORT_BATCH_SIZE', 5000)).value
+
+
+def execute(engine, job_id: int, batch_size: int = 5000) -> ReportStatus:
+    with engine.begin() as conn:
+        claimed = conn.execute(update(_JOBS).where(_JOBS.c.id == job_id, _JOBS.c.status == ReportStatus.PENDING)
+                               .values(status=ReportStatus.RUNNING, started_at=datetime.utcnow())).rowcount
+    if not claimed:
+        return ReportStatus.RUNNING
+    try:
+        with engine.connect() as conn:
+            job = conn.execute(select(_JOBS.c.kind, _JOBS.c.params).where(_JOBS.c.id == job_id)).one()
+            result = REPORTS[job.kind].compute(conn, json.loads(job.params), batch_size)
+        values = {'status': ReportStatus.DONE, 'result': json.dumps(result, ensure_ascii=False)}
+    except Exception as ex:
+        logger.exception('Falha no relatório %s.', job_id)
+        values = {'status': ReportStatus.FAILED, 'error': str(ex) or type(ex).__name__}
+    with engine.begin() as conn:
+        conn.execute(update(_JOBS).where(_JOBS.c.id == job_id).values(finished_at=datetime.utcnow(), **values))
+    return values['status']
+
+
+class ReportQueue:
+    """Pool de processos do app, criado na primeira submissão.
+
+    spawn em vez de fork: os processos não herdam threads (outbox, pool de filiais) nem conexões abertas.
+    """
+
+    def __init__(self, workers: int, options: dict):
+        self.workers = workers
+        self.options = options
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, database_url: str, job_id: int):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                future = self._executor.submit(run_job, database_url, job_id, self.options)
+            except BrokenProcessPool:
+                # um processo morreu (OOM, kill): recria o pool; o job segue pendente até lá
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                future = self._executor.submit(run_job, database_url, job_id, self.options)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('Processo de relatórios falhou: %s', future.exception())
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+def _to_csv(result: dict) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(result['columns'])
+    writer.writerows(['' if value is None else value for value in row] for row in result['rows'])
+    return out.getvalue()
+
+
+def init_reports(app):
+    options = {key: value for key, value in app.config.items()
+               if key.startswith(('DB_', 'SQLITE_')) or key == 'REPORT_BATCH_SIZE'}
+    queue = app.extensions['report_queue'] = ReportQueue(app.config['REPORT_WORKERS'], options)
+
+    def submit(kind, params):
+        session = get_session()
+        job, run = ReportService(session, app.config['REPORT_JOB_TIMEOUT']).submit(kind, params)
+        if run:
+            url = db.current_branch().engine.url.render_as_string(hide_password=False)
+            queue.submit(url, job.id)
+        return job
+
+    @app.post('/api/reports')
+    def report_submit():
+        body = request.get_json(silent=True) or {}
+        try:
+            job = submit(body.get('kind', ''), body.get('params') or {})
+        except ReportError as ex:
+            return jsonify({'error': str(ex)}), 400
+        status = 200 if job.status == ReportStatus.DONE else 202
+        return jsonify(job_json(job)), status, {'Location': url_for('report_status', job_id=job.id)}
+
+    @app.route('/api/reports/<int:job_id>')
+    def report_status(job_id):
+        job = get_session().get(ReportJob, job_id)
+        if job is None:
+            return jsonify({'error': 'Relatório não encontrado.'}), 404
+        return jsonify(job_json(job))
+
+    @app.route('/api/reports/<int:job_id>/download')
+    def report_download(job_id):
+        job = get_session().get(ReportJob, job_id)
+        if job is None:
+            return jsonify({'error': 'Relatório não encontrado.'}), 404
+        if job.status != ReportStatus.DONE:
+            return jsonify({'error': 'Relatório ainda não está pronto.', **job_json(job)}), 409
+        if request.args.get('format') == 'json':
+            return Response(job.result, mimetype='application/json')
+        return Response(_to_csv(json.loads(job.result)), mimetype='text/csv', headers={
+            'Content-Disposition': f'attachment; filename=relatorio-{job.kind}-{job.id}.csv'})
+
+    @app.route('/reports', methods=['GET', 'POST'])
+    def reports():
+        if request.method == 'POST':
+            form = request.form.to_dict()
+            try:
+                job = submit(form.pop('kind', ''), {k: v for k, v in form.items() if v})
+            except ReportError as ex:
+                flash(str(ex), 'error')
+            else:
+                flash('Relatório pronto.' if job.status == ReportStatus.DONE else 'Relatório na fila.', 'success')
+            return redirect(url_for('reports'))
+        return render_template('reports.html', reports=REPORTS, jobs=ReportService(get_session()).recent(),
+                               ReportStatus=ReportStatus)
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import re
+import unicodedata
+
+from sqlalchemy import bindparam, event, inspect, or_, select, text
+from sqlalchemy.orm import Session
+
+from .models import Base, Client
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(value: str) -> str:
+    """Minúsculas e sem acentos: 'João Conceição' -> 'joao conceicao'."""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(value: str) -> list:
+    return _TOKEN_RE.findall(normalize(value))
+
+
+class _PrefixFirst:
+    """Ordem da busca sem ordenar todos os matches (um prefixo comum casa com dezenas de milhares).
+
+    Primeiro, clientes cujo nome começa pelo termo, em ordem alfabética: uma busca por faixa no índice
+    de client_search_names.name_key, que para no limite. Se faltar, completa com os demais matches do
+    índice de texto (palavra no meio do nome ou no e-mail), pegos sem ORDER BY e ordenados só entre si:
+    não são necessariamente os primeiros do alfabeto.
+    """
+    NAMES_DDL = ['CREATE INDEX IF NOT EXISTS ix_client_search_names_key ON client_search_names (name_key, client_id)']
+
+    def matches(self, conn, tokens, limit) -> list:
+        """Até limit pares (id, nome normalizado) que casam, em qualquer ordem."""
+        raise NotImplementedError
+
+    def search(self, conn, tokens, limit):
+        prefix = ' '.join(tokens)
+        ids = list(conn.execute(text(
+            'SELECT client_id FROM client_search_names WHERE name_key >= :low AND name_key < :high '
+            'ORDER BY name_key, client_id LIMIT :limit'
+        ), {'low': prefix, 'high': prefix[:-1] + chr(ord(prefix[-1]) + 1), 'limit': limit}).scalars())
+        if len(ids) < limit:
+            # os já encontrados podem voltar aqui: pede a mais para ainda sobrarem limit
+            seen = set(ids)
+            rest = sorted((hit for hit in self.matches(conn, tokens, limit + len(ids)) if hit[0] not in seen),
+                          key=lambda hit: (hit[1], hit[0]))
+            ids.extend(client_id for client_id, _ in rest[:limit - len(ids)])
+        if not ids:
+            return []
+        rows = {row.id: row for row in conn.execute(
+            select(Client.id, Client.full_name, Client.email).where(Client.id.in_(ids)))}
+        return [rows[client_id] for client_id in ids if client_id in rows]
+
+    def upsert(self, conn, rows):
+        conn.execute(text(
+            'INSERT INTO client_search_names (client_id, name_key) VALUES (:id, :name_key) '
+            'ON CONFLICT (client_id) DO UPDATE SET name_key = excluded.name_key'
+        ), [{'id': r['id'], 'name_key': ' '.join(tokenize(r['full_name']))} for r in rows])
+
+    def remove(self, conn, ids):
+        for i in range(0, len(ids), 500):
+            conn.execute(text('DELETE FROM client_search_names WHERE client_id IN :ids')
+                         .bindparams(bindparam('ids', expanding=True)), {'ids': list(ids[i:i + 500])})
+
+    def clear(self, conn):
+        conn.execute(text('DELETE FROM client_search_names'))
+
+
+class _SqliteFts(_PrefixFirst):
+    """FTS5 com remove_diacritics e índice de prefixo para autocomplete."""
+    DDL = ["CREATE VIRTUAL TABLE IF NOT EXISTS client_search_fts USING fts5("
+           "full_name, email, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+           'CREATE TABLE IF NOT EXISTS client_search_names (client_id INTEGER PRIMARY KEY, name_key TEXT NOT NULL)',
+           *_PrefixFirst.NAMES_DDL]
+
+    def matches(self, conn, tokens, limit):
+        # full_name da FTS já é o nome normalizado
+        query = ' '.join(f'"{token}"*' for token in tokens)
+        return conn.execute(text('SELECT rowid, full_name FROM client_search_fts WHERE client_search_fts MATCH :query '
+                                 'LIMIT :limit'), {'query': query, 'limit': limit}).all()
+
+    def upsert(self, conn, rows):
+        self.remove(conn, [row['id'] for row in rows])
+        conn.execute(text('INSERT INTO client_search_fts(rowid, full_name, email) VALUES (:id, :full_name, :email)'),
+                     [{'id': r['id'], 'full_name': normalize(r['full_name']), 'email': normalize(r['email'])} for r in rows])
+        super().upsert(conn, rows)
+
+    def remove(self, conn, ids):
+        for i in range(0, len(ids), 500):
+            conn.execute(text('DELETE FROM client_search_fts WHERE rowid IN :ids')
+                         .bindparams(bindparam('ids', expanding=True)), {'ids': list(ids[i:i + 500])})
+        super().remove(conn, ids)
+
+    def clear(self, conn):
+        conn.execute(text('DELETE FROM client_search_fts'))
+        super().clear(conn)
+
+
+class _PostgresTrigram(_PrefixFirst):
+    """Texto normalizado numa tabela lateral com índice GIN de trigramas (pg_trgm)."""
+    DDL = [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE TABLE IF NOT EXISTS client_search_terms (client_id INTEGER PRIMARY KEY, search_text TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS ix_client_search_terms_trgm ON client_search_terms USING gin (search_text gin_trgm_ops)',
+        # COLLATE "C": ordem de bytes, para a busca por faixa de prefixo valer com qualquer locale
+        'CREATE TABLE IF NOT EXISTS client_search_names (client_id INTEGER PRIMARY KEY, name_key TEXT COLLATE "C" NOT NULL)',
+        *_PrefixFirst.NAMES_DDL,
+    ]
+
+    def matches(self, conn, tokens, limit):
+        # ' ' antes do termo ancora o prefixo no início de uma palavra
+        where = ' AND '.join(f't.search_text LIKE :t{i}' for i in range(len(tokens)))
+        params = {f't{i}': f'% {token}%' for i, token in enumerate(tokens)}
+        return conn.execute(text(
+            f'SELECT n.client_id, n.name_key FROM client_search_terms t '
+            f'JOIN client_search_names n ON n.client_id = t.client_id WHERE {where} LIMIT :limit'
+        ), {**params, 'limit': limit}).all()
+
+    def upsert(self, conn, rows):
+        conn.execute(text(
+            'INSERT INTO client_search_terms (client_id, search_text) VALUES (:id, :search_text) '
+            'ON CONFLICT (client_id) DO UPDATE SET search_text = excluded.search_text'
+        ), [{'id': r['id'], 'search_text': ' ' + ' '.join(tokenize(r['full_name']) + tokenize(r['email']))}
+            for r in rows])
+        super().upsert(conn, rows)
+
+    def remove(self, conn, ids):
+        conn.execute(text('DELETE FROM client_search_terms WHERE client_id = ANY(:ids)'), {'ids': list(ids)})
+        super().remove(conn, ids)
+
+    def clear(self, conn):
+        conn.execute(text('DELETE FROM client_search_terms'))
+        super().clear(conn)
+
+
+class _LikeFallback:
+    """Outros bancos: sem índice dedicado, busca direto em clients."""
+    DDL = []
+
+    def search(self, conn, tokens, limit):
+        conditions = [or_(Client.full_name.ilike(f'%{t}%'), Client.email.ilike(f'%{t}%')) for t in tokens]
+        return conn.execute(select(Client.id, Client.full_name, Client.email).where(*conditions)
+                            .order_by(Client.full_name).limit(limit)).all()
+
+    def upsert(self, conn, rows):
+        pass
+
+    def remove(self, conn, ids):
+        pass
+
+    def clear(self, conn):
+        pass
+
+
+_BACKENDS = {'sqlite': _SqliteFts(), 'postgresql': _PostgresTrigram()}
+
+
+def _backend(conn):
+    return _BACKENDS.get(conn.dialect.name, _LikeFallback())
+
+
+class ClientSearch:
+    """Busca de clientes por prefixo de palavra, sem acento, com limite de resultados."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def search(self, q: str, limit: int = 10) -> list:
+        tokens = tokenize(q)
+        if not tokens:
+            return []
+        conn = self.session.connection()
+        return _backend(conn).search(conn, tokens, limit)
+
+    def rebuild(self):
+        rebuild(self.session.connection())
+
+
+def create_search_index(conn):
+    for statement in _backend(conn).DDL:
+        conn.execute(text(statement))
+
+
+def rebuild(conn, batch_size: int = 1000):
+    backend = _backend(conn)
+    backend.clear(conn)
+    result = conn.execute(select(Client.id, Client.full_name, Client.email).execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        backend.upsert(conn, [row._asdict() for row in batch])
+
+
+def index_clients(conn, rows):
+    """Indexa linhas {'id', 'full_name', 'email'} gravadas fora do ORM (ex.: importação em lote)."""
+    if rows:
+        _backend(conn).upsert(conn, rows)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def _create_search_index(target, conn, **kwargs):
+    # só a FTS5 do SQLite acompanha o create_all; o pg_trgm (CREATE EXTENSION pede privilégio) fica na migração 4
+    if conn.dialect.name == 'sqlite':
+        create_search_index(conn)
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_client_search(session, flush_context):
+    changed = [obj for obj in (*session.new, *session.dirty) if isinstance(obj, Client)]
+    removed = [inspect(obj).identity[0] for obj in session.deleted if isinstance(obj, Client)]
+    if not changed and not removed:
+        return
+    conn = session.connection()
+    backend = _backend(conn)
+    if removed:
+        backend.remove(conn, removed)
+    if changed:
+        backend.upsert(conn, [{'id': c.id, 'full_name': c.full_name, 'email': c.email} for c in changed])
@@ -1,14 +1,22 @@
 from __future__ import annotations
+import csv
+from collections import defaultdict
 from dataclasses import dataclass
-from datetime import datetime, timedelta, date
-from email.message import EmailMessage
+from datetime import datetime, time, timedelta, date
+import io
 import logging
-import smtplib
-from typing import Optional
-from sqlalchemy import func
+import threading
+from time import monotonic
+from typing import Iterator, Optional
+import weakref
+from sqlalchemy import Integer, String, case, cast, event, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session, contains_eager
 
-from .models import (AppSetting, Appointment, AppointmentStatus, Client, Plan,
-                     PlanDayRule, Subscription)
+from .metrics import CACHE_REQUESTS
+from .models import (AppSetting, Appointment, AppointmentStatus, Client, ClientVisitStats, EmailOutbox,
+                     Plan, PlanDayRule, Subscription)
+from . import table_versions, visit_stats
+from .visit_stats import SLOT_MINUTES, VisitStatsService, slot_start, week_start
 
 logger = logging.getLogger(__name__)
 
@@ -18,111 +26,463 @@ class EstimateRange:
     max_days: int
     reasoning: str
 
+@dataclass
+class SlotCheck:
+    when: datetime
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+@dataclass
+class AgendaPage:
+    items: list
+    next_cursor: Optional[str]
+
+@dataclass
+class FreeSlot:
+    start: datetime
+    free_chairs: int
+
+@dataclass
+class ShopHours:
+    chairs: int
+    opens_at: time
+    closes_at: time
+    closed_weekdays: frozenset
+
+    @classmethod
+    def load(cls, get) -> 'ShopHours':
+        """get(chave, padrão): SettingsService.get ou o dict de um formulário."""
+        closed = get(SettingsService.SHOP_CLOSED_WEEKDAYS, '6')
+        return cls(
+            chairs=int(get(SettingsService.SHOP_CHAIRS, '2')),
+            opens_at=time.fromisoformat(get(SettingsService.SHOP_OPENS_AT, '09:00')),
+            closes_at=time.fromisoformat(get(SettingsService.SHOP_CLOSES_AT, '19:00')),
+            closed_weekdays=frozenset(int(d) for d in closed.split(',') if d.strip()),
+        )
+
+    def slots(self, day: date) -> list:
+        """Inícios de slot do dia em que um atendimento ainda termina antes de fechar."""
+        if day.weekday() in self.closed_weekdays:
+            return []
+        when = slot_start(datetime.combine(day, self.opens_at))
+        if when.time() < self.opens_at:
+            when += timedelta(minutes=SLOT_MINUTES)
+        last = datetime.combine(day, self.closes_at) - timedelta(minutes=SLOT_MINUTES)
+        slots = []
+        while when <= last:
+            slots.append(when)
+            when += timedelta(minutes=SLOT_MINUTES)
+        return slots
+
+@dataclass
+class DashboardSnapshot:
+    total_clients: int
+    today_count: int
+    next7: int
+    active_subs: int
+    inactive_plans: int
+
+    @property
+    def without_plan(self) -> int:
+        return max(self.total_clients - self.active_subs, 0)
+
+def _base_engine(bind):
+    """Engine por trás de `bind`: execution_options() devolve um OptionEngine (a sessão de leitura
+    no PostgreSQL) que compartilha o pool, e os caches precisam ser os mesmos da sessão de escrita."""
+    while hasattr(bind, '_proxied'):
+        bind = bind._proxied
+    return bind
+
+
+class SettingsCache:
+    """Visão de app_settings compartilhada pelo processo, uma por engine."""
+    _by_engine = weakref.WeakKeyDictionary()
+    _registry_lock = threading.Lock()
+    DEFAULT_TTL = 30.0
+
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self.values = None
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_engine(cls, engine) -> 'SettingsCache':
+        engine = _base_engine(engine)
+        with cls._registry_lock:
+            cache = cls._by_engine.get(engine)
+            if cache is None:
+                cache = cls._by_engine[engine] = cls()
+            return cache
+
+    def snapshot(self, session) -> dict:
+        values = self.values
+        if values is not None and monotonic() - self.checked_at < self.ttl:
+            CACHE_REQUESTS.inc(cache='settings', result='hit')
+            return values
+        with self.lock:
+            # Expirado o TTL, basta conferir a versão no banco; só recarrega se outro processo gravou
+            version = session.execute(
+                select(AppSetting.setting_value).where(AppSetting.setting_key == SettingsService.VERSION)
+            ).scalar()
+            if self.values is None or version != self.version:
+                rows = session.execute(select(AppSetting.setting_key, AppSetting.setting_value)).all()
+                self.values = {key: value for key, value in rows}
+                self.version = version
+                CACHE_REQUESTS.inc(cache='settings', result='miss')
+            else:
+                CACHE_REQUESTS.inc(cache='settings', result='revalidated')
+            self.checked_at = monotonic()
+            return self.values
+
+    def invalidate(self):
+        with self.lock:
+            self.values = None
+
+
 class SettingsService:
     EMAIL_MODE = 'email.mode'
     EMAIL_FROM = 'email.from'
     EST_TARGET_CM = 'estimator.targetCm'
     EST_BASE_RATE = 'estimator.baseRateCmPerDay'
+    SHOP_CHAIRS = 'shop.chairs'
+    SHOP_OPENS_AT = 'shop.opensAt'
+    SHOP_CLOSES_AT = 'shop.closesAt'
+    SHOP_CLOSED_WEEKDAYS = 'shop.closedWeekdays'
+    VERSION = 'settings.version'
 
     def __init__(self, session):
         self.session = session
+        self.cache = SettingsCache.for_engine(session.get_bind())
 
     def ensure_defaults(self):
-        self._set_if_missing(self.EMAIL_MODE, 'TEST')
-        self._set_if_missing(self.EMAIL_FROM, 'no-reply@barbearia.local')
-        self._set_if_missing(self.EST_TARGET_CM, '1.2')
-        self._set_if_missing(self.EST_BASE_RATE, '0.04')
-
-    def _set_if_missing(self, key, value):
-        if not self.session.get(AppSetting, key):
-            self.session.add(AppSetting(setting_key=key, setting_value=value))
+        defaults = {
+            self.VERSION: '0',
+            self.EMAIL_MODE: 'TEST',
+            self.EMAIL_FROM: 'no-reply@barbearia.local',
+            self.EST_TARGET_CM: '1.2',
+            self.EST_BASE_RATE: '0.04',
+        }
+        existing = set(self.session.execute(
+            select(AppSetting.setting_key).where(AppSetting.setting_key.in_(list(defaults)))).scalars())
+        missing = [AppSetting(setting_key=k, setting_value=v) for k, v in defaults.items() if k not in existing]
+        if missing:
+            self.session.add_all(missing)
+            self._invalidate_on_commit()
 
     def get(self, key, default):
-        found = self.session.get(AppSetting, key)
-        return found.setting_value if found else default
+        pending = self.session.info.get('pending_settings')
+        if pending and key in pending:
+            return pending[key]
+        return self.cache.snapshot(self.session).get(key, default)
 
     def set(self, key, value):
         self.session.merge(AppSetting(setting_key=key, setting_value=value))
+        bumped = self.session.execute(
+            update(AppSetting).where(AppSetting.setting_key == self.VERSION)
+            .values(setting_value=cast(cast(AppSetting.setting_value, Integer) + 1, String))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not bumped:
+            self.session.merge(AppSetting(setting_key=self.VERSION, setting_value='1'))
+        self.session.info.setdefault('pending_settings', {})[key] = value
+        self._invalidate_on_commit()
+
+    def _invalidate_on_commit(self):
+        self.session.info['settings_cache'] = self.cache
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_soft_rollback')
+def _finish_settings_write(session, *args):
+    session.info.pop('pending_settings', None)
+    cache = session.info.pop('settings_cache', None)
+    if cache is not None:
+        cache.invalidate()
 
 class EmailService:
-    def __init__(self, session, smtp_host='localhost', smtp_port=1025):
+    def __init__(self, session):
+        self.session = session
         self.settings = SettingsService(session)
-        self.smtp_host = smtp_host
-        self.smtp_port = smtp_port
 
     def send_welcome(self, to_email: str, name: str):
-        mode = self.settings.get(SettingsService.EMAIL_MODE, 'TEST')
-        from_email = self.settings.get(SettingsService.EMAIL_FROM, 'no-reply@barbearia.local')
-        subject = 'Bem-vindo à Barbearia'
-        body = f'Olá {name}, seu cadastro foi concluído com sucesso!\n\nAlerta: não esqueça de agendar seu primeiro corte.'
-        if mode == 'TEST':
-            logger.info('[EMAIL TEST] to=%s subject=%s body=%s', to_email, subject, body)
+        # Só grava no outbox, na mesma transação do cadastro; o envio fica com o OutboxSender
+        self.session.add(EmailOutbox(**self._welcome(to_email, name, self._from_email())))
+        self.session.info['outbox_enqueued'] = True
+        if self.mode(self.session) == 'TEST':
             logger.warning('[ALERTA] Novo cliente cadastrado: %s (%s)', name, to_email)
-            return
-        msg = EmailMessage()
-        msg['From'] = from_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.set_content(body)
-        with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=10) as smtp:
-            smtp.send_message(msg)
+
+    def send_welcome_many(self, recipients) -> int:
+        """Enfileira boas-vindas para vários (email, nome) num único insert em lote."""
+        from_email = self._from_email()
+        rows = [self._welcome(to_email, name, from_email) for to_email, name in recipients]
+        if rows:
+            self.session.connection().execute(insert(EmailOutbox.__table__), rows)
+            self.session.info['outbox_enqueued'] = True
+        return len(rows)
+
+    def _from_email(self) -> str:
+        return self.settings.get(SettingsService.EMAIL_FROM, 'no-reply@barbearia.local')
+
+    @staticmethod
+    def _welcome(to_email: str, name: str, from_email: str) -> dict:
+        body = f'Olá {name}, seu cadastro foi concluído com sucesso!\n\nAlerta: não esqueça de agendar seu primeiro corte.'
+        return {'to_email': to_email, 'from_email': from_email, 'subject': 'Bem-vindo à Barbearia', 'body': body}
+
+    @staticmethod
+    def mode(session) -> str:
+        return SettingsService(session).get(SettingsService.EMAIL_MODE, 'TEST')
 
 class PlanPolicyService:
     def __init__(self, session):
         self.session = session
 
-    def validate_appointment(self, client: Client, when: datetime):
-        sub = self.session.query(Subscription).filter_by(client_id=client.id, active=True).first()
-        if not sub:
-            raise ValueError('Cliente sem plano ativo.')
-        plan = sub.plan
+    def validate_appointment(self, client: Client, when: datetime, plan: Optional[Plan] = None):
+        check = self.validate_many(client, [when], plan)[0]
+        if not check.ok:
+            raise ValueError(check.error)
+
+    def validate_many(self, client: Client, datetimes, plan: Optional[Plan] = None) -> list:
+        """Valida vários horários com o estado do plano carregado uma vez só.
+
+        Horários aceitos antes no mesmo lote contam para o limite semanal dos seguintes. plan, se
+        informado, é o plano ativo já lido pelo chamador.
+        """
+        datetimes = list(datetimes)
+        plan = plan or self.active_plan(client.id)
+        if not plan:
+            return [SlotCheck(when, 'Cliente sem plano ativo.') for when in datetimes]
+
+        stats = VisitStatsService(self.session)
+        weekly = stats.scheduled_by_week(client.id, {week_start(when) for when in datetimes})
+        visits = stats.for_client(client.id)
+        last_done = visits.last_done_at if visits else None
+
+        checks = []
+        for when in datetimes:
+            error = self.violation(plan, when, weekly[week_start(when)], last_done)
+            if error is None:
+                weekly[week_start(when)] += 1
+            checks.append(SlotCheck(when, error))
+        return checks
+
+    def active_plan(self, client_id: int) -> Optional[Plan]:
+        return self.session.execute(
+            select(Plan).join(Subscription, Subscription.plan_id == Plan.id)
+            .where(Subscription.client_id == client_id, Subscription.active.is_(True))
+        ).scalars().first()
+
+    @staticmethod
+    def violation(plan: Plan, when: datetime, scheduled_count: int, last_done: Optional[datetime]) -> Optional[str]:
+        """Regra do plano que `when` fere (mensagem) ou None; não consulta o banco."""
         if plan.day_rule == PlanDayRule.WEEKDAYS_ONLY and when.weekday() >= 5:
-            raise ValueError('Este plano permite somente dias úteis.')
-
-        week_start = when.date() - timedelta(days=when.weekday())
-        week_end = week_start + timedelta(days=6)
-        scheduled_count = self.session.query(func.count(Appointment.id)).filter(
-            Appointment.client_id == client.id,
-            Appointment.status == AppointmentStatus.SCHEDULED,
-            Appointment.appointment_date_time >= datetime.combine(week_start, datetime.min.time()),
-            Appointment.appointment_date_time <= datetime.combine(week_end, datetime.max.time()),
-        ).scalar() or 0
+            return 'Este plano permite somente dias úteis.'
         if scheduled_count >= plan.weekly_limit:
-            raise ValueError('Limite semanal do plano atingido.')
+            return 'Limite semanal do plano atingido.'
+        if last_done and (when.date() - last_done.date()).days < plan.min_days_between_appointments:
+            return 'Intervalo mínimo entre cortes não respeitado.'
+        return None
+
+
+class BookingService:
+    NO_CHAIR = 'Nenhuma cadeira livre neste horário.'
+
+    def __init__(self, session):
+        self.session = session
+
+    def _chairs(self) -> int:
+        return ShopHours.load(SettingsService(self.session).get).chairs
+
+    @staticmethod
+    def recurrence(first: datetime, every_days: int, until: date) -> list:
+        if every_days < 1:
+            raise ValueError('Intervalo deve ser de pelo menos 1 dia.')
+        series = []
+        when = first
+        while when.date() <= until:
+            series.append(when)
+            when += timedelta(days=every_days)
+        return series
 
-        last_done = self.session.query(Appointment).filter_by(
-            client_id=client.id,
-            status=AppointmentStatus.DONE
-        ).order_by(Appointment.appointment_date_time.desc()).first()
-        if last_done:
-            days = (when.date() - last_done.appointment_date_time.date()).days
-            if days < plan.min_days_between_appointments:
-                raise ValueError('Intervalo mínimo entre cortes não respeitado.')
+    def book(self, client: Client, appointment: Appointment):
+        """Valida e adiciona um novo agendamento reservando a vaga semanal e a cadeira de forma atômica."""
+        policy = PlanPolicyService(self.session)
+        when = appointment.appointment_date_time
+        plan = policy.active_plan(client.id)
+        policy.validate_appointment(client, when, plan)
+        if appointment.status in (None, AppointmentStatus.SCHEDULED):
+            conn = self.session.connection()
+            if not visit_stats.reserve_week(conn, client.id, week_start(when), 1, plan.weekly_limit):
+                raise ValueError('Limite semanal do plano atingido.')
+            if not visit_stats.reserve_slot(conn, slot_start(when), 1, self._chairs()):
+                visit_stats.release_week(conn, client.id, week_start(when), 1)
+                raise ValueError(self.NO_CHAIR)
+            appointment._counters_reserved = True
+        self.session.add(appointment)
+
+    def reschedule(self, appointment: Appointment):
+        """Edição de um agendamento já gravado: ao mudar de horário ou de cliente, ou voltar a SCHEDULED,
+        reserva a vaga semanal e a cadeira novas como em book e devolve as antigas."""
+        # sem autoflush: a leitura do estado gravado precisa ver o banco antes desta edição
+        with self.session.no_autoflush:
+            if appointment.status != AppointmentStatus.SCHEDULED:
+                return
+            conn = self.session.connection()
+            before = conn.execute(
+                select(Appointment.client_id, Appointment.appointment_date_time, Appointment.status)
+                .where(Appointment.id == appointment.id)).first()
+            when = appointment.appointment_date_time
+            was_scheduled = before.status == AppointmentStatus.SCHEDULED
+            new_week = not was_scheduled or (before.client_id, week_start(before.appointment_date_time)) != \
+                (appointment.client_id, week_start(when))
+            new_slot = not was_scheduled or slot_start(before.appointment_date_time) != slot_start(when)
+            if not new_week and not new_slot:
+                return
+            if new_week:
+                plan = PlanPolicyService(self.session).active_plan(appointment.client_id)
+                if not plan:
+                    raise ValueError('Cliente sem plano ativo.')
+                if not visit_stats.reserve_week(conn, appointment.client_id, week_start(when), 1, plan.weekly_limit):
+                    raise ValueError('Limite semanal do plano atingido.')
+            if new_slot and not visit_stats.reserve_slot(conn, slot_start(when), 1, self._chairs()):
+                if new_week:
+                    visit_stats.release_week(conn, appointment.client_id, week_start(when), 1)
+                raise ValueError(self.NO_CHAIR)
+            if was_scheduled and new_week:
+                visit_stats.release_week(conn, before.client_id, week_start(before.appointment_date_time), 1)
+            if was_scheduled and new_slot:
+                visit_stats.release_slot(conn, slot_start(before.appointment_date_time), 1)
+        appointment._counters_reserved = True
+
+    def book_many(self, client: Client, datetimes, service: str) -> list:
+        """Valida o lote, reserva as vagas por semana e grava os aceitos num único INSERT em lote."""
+        now = datetime.now()
+        policy = PlanPolicyService(self.session)
+        plan = policy.active_plan(client.id)
+        validated = iter(policy.validate_many(client, [w for w in datetimes if w >= now], plan))
+        results = [next(validated) if when >= now else SlotCheck(when, 'Agendamento SCHEDULED deve ser no presente/futuro.')
+                   for when in datetimes]
+        by_week = defaultdict(list)
+        for check in results:
+            if check.ok:
+                by_week[week_start(check.when)].append(check)
+        if by_week:
+            chairs = self._chairs()
+            conn = self.session.connection()
+            for start, checks in by_week.items():
+                if not visit_stats.reserve_week(conn, client.id, start, len(checks), plan.weekly_limit):
+                    # outra requisição ocupou a vaga entre a validação e a reserva
+                    for check in checks:
+                        check.error = 'Limite semanal do plano atingido.'
+                    continue
+                full = [check for check in checks
+                        if not visit_stats.reserve_slot(conn, slot_start(check.when), 1, chairs)]
+                for check in full:
+                    check.error = self.NO_CHAIR
+                if full:
+                    visit_stats.release_week(conn, client.id, start, len(full))
+        accepted = [check.when for check in results if check.ok]
+        if accepted:
+            self.session.execute(insert(Appointment), [
+                {'client_id': client.id, 'appointment_date_time': when, 'service': service,
+                 'status': AppointmentStatus.SCHEDULED}
+                for when in accepted
+            ])
+            # INSERT em lote não passa pelo flush: o contador semanal já foi reservado acima
+            visit_stats.add_occupancy(self.session.connection(), [
+                visit_stats.VisitState(client.id, when, AppointmentStatus.SCHEDULED) for when in accepted])
+            mark_dashboard_dirty(self.session)
+            table_versions.mark_changed(self.session, 'appointments', 'daily_occupancy')
+        return results
+
+class SlotFinderService:
+    """Próximos horários livres para um cliente, já filtrados pelas regras do plano e pelas cadeiras."""
+    MAX_DAYS = 90
+
+    def __init__(self, session):
+        self.session = session
+
+    def next_slots(self, client: Client, start: date, end: date, limit: int = 10) -> list:
+        # Consultas fixas, independentes do período: plano, semanas, última visita e ocupação dos slots
+        hours = ShopHours.load(SettingsService(self.session).get)
+        now = datetime.now()
+        first = max(start, now.date())
+        days = [first + timedelta(days=i) for i in range((end - first).days + 1)]
+        if not days or limit < 1:
+            return []
+        policy = PlanPolicyService(self.session)
+        plan = policy.active_plan(client.id)
+        if not plan:
+            return []
+        stats = VisitStatsService(self.session)
+        weekly = stats.scheduled_by_week(client.id, {week_start(datetime.combine(d, time())) for d in days})
+        visits = stats.for_client(client.id)
+        last_done = visits.last_done_at if visits else None
+        busy = stats.scheduled_by_slot(datetime.combine(days[0], time()),
+                                       datetime.combine(days[-1] + timedelta(days=1), time()))
+
+        found = []
+        for day in days:
+            for when in hours.slots(day):
+                if when <= now or busy[when] >= hours.chairs:
+                    continue
+                if PlanPolicyService.violation(plan, when, weekly[week_start(when)], last_done):
+                    # regras do plano valem para o dia inteiro: pula para o próximo
+                    break
+                found.append(FreeSlot(when, hours.chairs - busy[when]))
+                if len(found) == limit:
+                    return found
+        return found
 
 class ReturnEstimatorService:
+    IN_CHUNK = 500
+
     def __init__(self, session):
         self.session = session
         self.settings = SettingsService(session)
 
     def estimate_for(self, client: Client) -> EstimateRange:
+        visits = VisitStatsService(self.session).for_client(client.id)
+        return self._estimate(client.age, visits.done_count if visits else 0, visits.gap_sum_days if visits else 0)
+
+    def estimate_for_many(self, client_ids) -> dict:
+        """Estimativas de vários clientes lendo o resumo de visitas, uma query por lote de ids."""
+        ids = list(dict.fromkeys(client_ids))
+        estimates = {}
+        for i in range(0, len(ids), self.IN_CHUNK):
+            rows = self.session.execute(
+                select(Client.id, Client.age, ClientVisitStats.done_count, ClientVisitStats.first_done_at,
+                       ClientVisitStats.last_done_at)
+                .outerjoin(ClientVisitStats, ClientVisitStats.client_id == Client.id)
+                .where(Client.id.in_(ids[i:i + self.IN_CHUNK]))
+            ).all()
+            for client_id, age, done_count, first, last in rows:
+                gap_sum = (last.date() - first.date()).days if first else 0
+                estimates[client_id] = self._estimate(age, done_count or 0, gap_sum)
+        return estimates
+
+    def _estimate(self, age: Optional[int], done_count: int, gap_sum: int) -> EstimateRange:
+        baseline = self._baseline(age)
+        if done_count >= 3:
+            return self._from_history(baseline, gap_sum / (done_count - 1))
+        return self._from_heuristic(baseline)
+
+    def _baseline(self, age: Optional[int]) -> int:
         target_cm = float(self.settings.get(SettingsService.EST_TARGET_CM, '1.2'))
         base_rate = float(self.settings.get(SettingsService.EST_BASE_RATE, '0.04'))
-        rate = self._adjust_rate_by_age(base_rate, client.age)
-        baseline = max(5, round(target_cm / rate))
-        min_days, max_days = max(3, baseline - 3), baseline + 4
-
-        done = self.session.query(Appointment).filter_by(
-            client_id=client.id,
-            status=AppointmentStatus.DONE
-        ).order_by(Appointment.appointment_date_time.asc()).all()
-        if len(done) >= 3:
-            gaps = []
-            for i in range(1, len(done)):
-                gaps.append((done[i].appointment_date_time.date() - done[i-1].appointment_date_time.date()).days)
-            avg = sum(gaps) / len(gaps)
-            mid = round((baseline + avg) / 2)
-            return EstimateRange(max(3, mid-2), max(mid+3, mid-1), 'Heurística de idade + média móvel do histórico real.')
-        return EstimateRange(min_days, max_days, 'Heurística por idade e taxa média de crescimento.')
+        rate = self._adjust_rate_by_age(base_rate, age)
+        return max(5, round(target_cm / rate))
+
+    def _from_history(self, baseline: int, avg: float) -> EstimateRange:
+        mid = round((baseline + avg) / 2)
+        return EstimateRange(max(3, mid-2), max(mid+3, mid-1), 'Heurística de idade + média móvel do histórico real.')
+
+    def _from_heuristic(self, baseline: int) -> EstimateRange:
+        return EstimateRange(max(3, baseline - 3), baseline + 4, 'Heurística por idade e taxa média de crescimento.')
 
     def _adjust_rate_by_age(self, base_rate: float, age: Optional[int]) -> float:
         if age is None:
@@ -133,6 +493,172 @@ class ReturnEstimatorService:
             return base_rate
         return base_rate * 0.9
 
+class AgendaService:
+    PAGE_SIZE = 50
+
+    def __init__(self, session):
+        self.session = session
+
+    def page(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             status: Optional[AppointmentStatus] = None, cursor: Optional[str] = None,
+             limit: int = PAGE_SIZE) -> AgendaPage:
+        # Paginação por chave (dataHora, id): custo constante por página, independente do histórico
+        query = self.session.query(Appointment).join(Appointment.client).options(contains_eager(Appointment.client))
+        if start:
+            query = query.filter(Appointment.appointment_date_time >= start)
+        if end:
+            query = query.filter(Appointment.appointment_date_time <= end)
+        if status:
+            query = query.filter(Appointment.status == status)
+        if cursor:
+            when, last_id = self.decode_cursor(cursor)
+            query = query.filter(tuple_(Appointment.appointment_date_time, Appointment.id) < tuple_(when, last_id))
+        rows = query.order_by(Appointment.appointment_date_time.desc(), Appointment.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(rows[-1])
+        return AgendaPage(rows, next_cursor)
+
+    @staticmethod
+    def encode_cursor(appointment: Appointment) -> str:
+        return f'{appointment.appointment_date_time.isoformat()}_{appointment.id}'
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        when_text, _, id_text = cursor.rpartition('_')
+        return datetime.fromisoformat(when_text), int(id_text)
+
+class CsvExportService:
+    BATCH_SIZE = 1000
+
+    def __init__(self, session, batch_size: int = BATCH_SIZE):
+        self.session = session
+        self.batch_size = batch_size
+
+    def export_clients(self) -> Iterator[str]:
+        stmt = select(Client.id, Client.full_name, Client.email, Client.phone, Client.age, Client.notes).order_by(Client.id)
+        return self._stream(['id', 'nome', 'email', 'telefone', 'idade', 'observacoes'], stmt,
+                            lambda r: (r.id, r.full_name, r.email, r.phone, '' if r.age is None else r.age, r.notes or ''))
+
+    def export_appointments(self, start: datetime, end: datetime) -> Iterator[str]:
+        stmt = select(Appointment.id, Client.full_name, Appointment.appointment_date_time, Appointment.service,
+                      Appointment.status).join(Client, Client.id == Appointment.client_id).filter(
+            Appointment.appointment_date_time >= start,
+            Appointment.appointment_date_time <= end,
+        ).order_by(Appointment.appointment_date_time, Appointment.id)
+        return self._stream(['id', 'cliente', 'dataHora', 'servico', 'status'], stmt,
+                            lambda r: (r.id, r.full_name, r.appointment_date_time.isoformat(), r.service, r.status.value))
+
+    def _stream(self, header, stmt, to_row) -> Iterator[str]:
+        # Lê em lotes (cursor no servidor quando o driver suporta) e emite um bloco de CSV por lote
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(header)
+        yield buffer.getvalue()
+        result = self.session.execute(stmt.execution_options(yield_per=self.batch_size))
+        for batch in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(to_row(r) for r in batch)
+            yield buffer.getvalue()
+
+class DashboardCache:
+    """Último snapshot do dashboard por engine, válido por ttl segundos ou até a próxima escrita."""
+    _by_engine = weakref.WeakKeyDictionary()
+    _registry_lock = threading.Lock()
+    DEFAULT_TTL = 10.0
+    WATCHED = (Appointment, Client, Plan, Subscription)
+
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self.snapshot = None
+        self.day = None
+        self.loaded_at = 0.0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_engine(cls, engine) -> 'DashboardCache':
+        engine = _base_engine(engine)
+        with cls._registry_lock:
+            cache = cls._by_engine.get(engine)
+            if cache is None:
+                cache = cls._by_engine[engine] = cls()
+            return cache
+
+    def get(self, day: date, loader) -> DashboardSnapshot:
+        snapshot = self.snapshot
+        if snapshot is not None and self.day == day and monotonic() - self.loaded_at < self.ttl:
+            CACHE_REQUESTS.inc(cache='dashboard', result='hit')
+            return snapshot
+        CACHE_REQUESTS.inc(cache='dashboard', result='miss')
+        generation = self.generation
+        snapshot = loader()
+        with self.lock:
+            # uma escrita durante o carregamento invalida o resultado; não guarda
+            if generation == self.generation:
+                self.snapshot, self.day, self.loaded_at = snapshot, day, monotonic()
+        return snapshot
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.snapshot = None
+
+
+class DashboardService:
+    def __init__(self, session):
+        self.session = session
+
+    def snapshot(self, today: Optional[date] = None) -> DashboardSnapshot:
+        today = today or date.today()
+        cache = DashboardCache.for_engine(self.session.get_bind())
+        return cache.get(today, lambda: self.compute(today))
+
+    def compute(self, today: date) -> DashboardSnapshot:
+        # Um único round trip: agregação condicional na janela de 7 dias + subqueries escalares
+        start = datetime.combine(today, datetime.min.time())
+        today_end = datetime.combine(today, datetime.max.time())
+        week_end = datetime.combine(today + timedelta(days=7), datetime.max.time())
+        window = select(
+            func.count(case((Appointment.appointment_date_time <= today_end, Appointment.id))).label('today_count'),
+            func.count(Appointment.id).label('next7'),
+        ).where(Appointment.appointment_date_time >= start, Appointment.appointment_date_time <= week_end).subquery()
+        row = self.session.execute(select(
+            select(func.count(Client.id)).scalar_subquery(),
+            window.c.today_count,
+            window.c.next7,
+            select(func.count(Subscription.id)).where(Subscription.active.is_(True)).scalar_subquery(),
+            select(func.count(Plan.id)).where(Plan.active.is_(False)).scalar_subquery(),
+        )).one()
+        return DashboardSnapshot(*(value or 0 for value in row))
+
+
+def mark_dashboard_dirty(session):
+    """Invalida o snapshot do dashboard no próximo commit (use após escritas fora do ORM)."""
+    session.info['dashboard_cache'] = DashboardCache.for_engine(session.get_bind())
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_dashboard_dirty(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, DashboardCache.WATCHED):
+            mark_dashboard_dirty(session)
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_dashboard(session):
+    cache = session.info.pop('dashboard_cache', None)
+    if cache is not None:
+        cache.invalidate()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_dashboard_mark(session, previous_transaction):
+    session.info.pop('dashboard_cache', None)
+
 
 def seed_defaults(session):
     seeds = [
@@ -140,8 +666,9 @@ def seed_defaults(session):
         ('Plus', 119.90, PlanDayRule.WEEKDAYS_ONLY, 0, 999),
         ('Max', 159.90, PlanDayRule.ANY_DAY, 0, 999),
     ]
+    existing = set(session.execute(select(func.lower(Plan.name))).scalars())
     for name, price, day_rule, min_days, weekly in seeds:
-        if not session.query(Plan).filter(func.lower(Plan.name) == name.lower()).first():
+        if name.lower() not in existing:
             session.add(Plan(
                 name=name,
                 price=price,
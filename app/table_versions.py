@@ -0,0 +1,128 @@
+from __future__ import annotations
+from datetime import datetime
+from functools import wraps
+import hashlib
+import logging
+
+from flask import make_response, request, session as flask_session
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from .db import current_branch, get_session
+from .models import Appointment, ArchivedAppointment, Client, DailyOccupancy, Plan, Subscription, TableVersion
+
+logger = logging.getLogger(__name__)
+
+# tabelas lidas pelas listagens e exports com GET condicional e pelos relatórios em cache
+TRACKED = {model.__tablename__ for model in (Appointment, ArchivedAppointment, Client, DailyOccupancy, Plan,
+                                             Subscription)}
+
+_VERSIONS = TableVersion.__table__
+
+
+def mark_changed(session, *tables):
+    """Registra escritas feitas fora do ORM (insert em lote); a versão sobe no commit."""
+    session.info.setdefault('changed_tables', set()).update(t for t in tables if t in TRACKED)
+
+
+def current(session, tables) -> dict:
+    """{tabela: (versão, atualizado_em)} numa única query; tabela sem linha conta como versão 0."""
+    rows = session.execute(select(TableVersion.table_name, TableVersion.version, TableVersion.updated_at)
+                           .where(TableVersion.table_name.in_(sorted(tables))))
+    return {name: (version, updated_at) for name, version, updated_at in rows}
+
+
+def bump(conn, tables):
+    """Sobe a versão das tabelas; as linhas já existem (seed), então é um UPDATE só.
+
+    Chamado numa transação própria depois do commit da escrita: a linha de cada tabela é a mesma
+    para todas as escritas e, dentro delas, as enfileiraria até o commit (no PostgreSQL).
+    """
+    conn.execute(update(_VERSIONS).where(_VERSIONS.c.table_name.in_(sorted(tables)))
+                 .values(version=_VERSIONS.c.version + 1, updated_at=datetime.utcnow()))
+
+
+def seed(conn):
+    existing = set(conn.execute(select(_VERSIONS.c.table_name)).scalars())
+    missing = [{'table_name': t, 'version': 1, 'updated_at': datetime.utcnow()} for t in sorted(TRACKED - existing)]
+    if missing:
+        conn.execute(insert(_VERSIONS), missing)
+
+
+def conditional(*tables, daily=False):
+    """ETag/Last-Modified a partir das versões das tabelas; 304 sem consultar linhas nem renderizar.
+
+    daily: a resposta também depende da data de hoje (filtros e links padrão).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # mensagens flash pendentes mudam a página: responde sem cache condicional
+            if '_flashes' in flask_session:
+                return view(*args, **kwargs)
+            versions = current(get_session(), tables)
+            # a mesma URL (cabeçalho X-Branch) serve bancos diferentes, cada um com suas versões
+            parts = [current_branch().name, request.endpoint, request.full_path,
+                     *(f'{t}:{versions.get(t, (0,))[0]}' for t in sorted(tables))]
+            if daily:
+                parts.append(datetime.now().date().isoformat())
+            etag = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+            stamps = [updated_at for _, updated_at in versions.values()]
+            last_modified = max(stamps) if stamps else None
+
+            if request.if_none_match.contains(etag) or (
+                    not request.if_none_match and last_modified and request.if_modified_since
+                    and last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_tables(session, flush_context):
+    changed = {obj.__table__.name for obj in (*session.new, *session.dirty, *session.deleted)
+               if getattr(obj, '__table__', None) is not None}
+    if changed & TRACKED:
+        mark_changed(session, *changed)
+
+
+@event.listens_for(_VERSIONS, 'after_create')
+def _seed_versions(target, conn, **kwargs):
+    seed(conn)
+
+
+@event.listens_for(Session, 'before_commit')
+def _flush_changed_tables(session):
+    # o commit só faz o flush depois deste hook: antecipa para as tabelas do flush entrarem na conta
+    session.flush()
+    if session.info.get('changed_tables'):
+        session.info['versions_conn'] = session.connection()
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_changed_tables(session):
+    changed = session.info.pop('changed_tables', None)
+    conn = session.info.pop('versions_conn', None)
+    if not changed or conn is None:
+        return
+    # na mesma conexão, já fora da transação da escrita: nenhum leitor vê a versão nova antes dos dados
+    try:
+        with conn.begin():
+            bump(conn, changed)
+    except DBAPIError:
+        # os dados já foram gravados; no pior caso o ETag fica velho até a próxima escrita
+        logger.exception('Falha ao subir a versão de %s', ', '.join(sorted(changed)))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changed_tables(session, previous_transaction):
+    session.info.pop('changed_tables', None)
+    session.info.pop('versions_conn', None)
@@ -0,0 +1,53 @@
+"""Renderização das páginas: cache de bytecode do Jinja em disco e streaming das listas grandes."""
+from __future__ import annotations
+from typing import Iterator
+
+from flask import Response, current_app, render_template, session as flask_session, stream_template
+from jinja2 import FileSystemBytecodeCache
+
+# bytes acumulados antes de cada envio: o Jinja gera um pedaço por trecho de template, pequeno demais
+STREAM_CHUNK_SIZE = 8192
+
+
+def init_templates(app):
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        # compartilhado entre workers e reinícios; o Jinja invalida pelo checksum do fonte
+        app.jinja_options = {**app.jinja_options,
+                             'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'] or None)}
+
+
+def compile_templates(app) -> int:
+    """Compila todos os templates para o cache de bytecode; devolve quantos."""
+    names = app.jinja_env.list_templates(extensions=('html',))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def render_page(template: str, **context) -> Response:
+    """Página com linhas vindas de um gerador: envia o HTML à medida que é gerado.
+
+    Cabeçalhos e status saem antes do corpo, então um erro no meio da tabela trunca a página.
+    Com mensagens flash pendentes renderiza inteiro: o cookie da sessão só muda antes do envio.
+    No orçamento estrito de queries também, para contar as queries feitas durante a renderização.
+    """
+    config = current_app.config
+    if not config['STREAM_TEMPLATES'] or config['QUERY_BUDGET_STRICT'] or '_flashes' in flask_session:
+        return Response(render_template(template, **context))
+    return Response(_buffered(stream_template(template, **context)))
+
+
+def _buffered(chunks: Iterator[str], size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    buffer, length = [], 0
+    try:
+        for chunk in chunks:
+            buffer.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                yield ''.join(buffer)
+                buffer, length = [], 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # cliente desconectou no meio: fecha já o gerador interno, que libera o contexto e a sessão
+        chunks.close()
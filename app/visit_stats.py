@@ -0,0 +1,441 @@
+from __future__ import annotations
+from collections import Counter, defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, delete, event, func, inspect, insert, select, union_all, update
+from sqlalchemy.orm import Session
+
+from . import table_versions
+from .models import (Appointment, AppointmentStatus, ArchivedAppointment, Client, ClientArchiveStats, ClientVisitStats,
+                     ClientWeekCount, DailyOccupancy, SlotCount)
+
+VisitState = namedtuple('VisitState', 'client_id when status')
+
+_STATS = ClientVisitStats.__table__
+_WEEKS = ClientWeekCount.__table__
+_SLOTS = SlotCount.__table__
+_ARCHIVE = ClientArchiveStats.__table__
+_ARCHIVED = ArchivedAppointment.__table__
+_OCCUPANCY = DailyOccupancy.__table__
+
+# grade fixa de horários: cada agendamento ocupa uma cadeira no slot em que começa
+SLOT_MINUTES = 30
+
+
+def week_start(when: datetime) -> date:
+    return when.date() - timedelta(days=when.weekday())
+
+
+def slot_start(when: datetime) -> datetime:
+    minutes = when.hour * 60 + when.minute
+    return datetime.combine(when.date(), datetime.min.time()) + timedelta(minutes=minutes - minutes % SLOT_MINUTES)
+
+
+class VisitStatsService:
+    """Leitura O(1) e reconstrução do resumo de visitas por cliente."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def for_client(self, client_id: int):
+        return self.session.execute(
+            select(ClientVisitStats).where(ClientVisitStats.client_id == client_id)
+            .execution_options(populate_existing=True)
+        ).scalar()
+
+    def scheduled_in_week(self, client_id: int, when: datetime) -> int:
+        return self.session.execute(
+            select(ClientWeekCount.scheduled_count).where(
+                ClientWeekCount.client_id == client_id,
+                ClientWeekCount.week_start == week_start(when),
+            )
+        ).scalar() or 0
+
+    def scheduled_by_week(self, client_id: int, week_starts) -> Counter:
+        rows = self.session.execute(
+            select(ClientWeekCount.week_start, ClientWeekCount.scheduled_count).where(
+                ClientWeekCount.client_id == client_id,
+                ClientWeekCount.week_start.in_(list(week_starts)),
+            )
+        )
+        return Counter(dict(rows.all()))
+
+    def scheduled_by_slot(self, start: datetime, end: datetime) -> Counter:
+        rows = self.session.execute(
+            select(SlotCount.slot_start, SlotCount.scheduled_count).where(
+                SlotCount.slot_start >= start, SlotCount.slot_start < end, SlotCount.scheduled_count > 0)
+        )
+        return Counter(dict(rows.all()))
+
+    def rebuild(self):
+        rebuild(self.session.connection())
+
+    def verify(self) -> list:
+        return verify(self.session.connection())
+
+
+def rebuild(conn):
+    # a migração 2 reconstrói antes de a migração 5 criar slot_counts; a 5 reconstrói de novo
+    slots_ready = inspect(conn).has_table(_SLOTS.name)
+    conn.execute(delete(_STATS))
+    conn.execute(delete(_WEEKS))
+    if slots_ready:
+        conn.execute(delete(_SLOTS))
+    conn.execute(insert(_STATS).from_select(
+        ['client_id', 'done_count', 'first_done_at', 'last_done_at'], _done_aggregate(conn)))
+    weeks, slots = _scheduled_counts(conn)
+    if weeks:
+        conn.execute(insert(_WEEKS), [
+            {'client_id': client_id, 'week_start': start, 'scheduled_count': n}
+            for (client_id, start), n in weeks.items()
+        ])
+    if slots and slots_ready:
+        conn.execute(insert(_SLOTS), [{'slot_start': start, 'scheduled_count': n} for start, n in slots.items()])
+
+
+def verify(conn) -> list:
+    """Compara o resumo gravado com um recálculo do zero; devolve as divergências."""
+    problems = []
+    expected = {row.client_id: tuple(row[1:]) for row in conn.execute(_done_aggregate(conn))}
+    stored = {row.client_id: tuple(row[1:]) for row in conn.execute(
+        select(_STATS.c.client_id, _STATS.c.done_count, _STATS.c.first_done_at, _STATS.c.last_done_at)
+        .where(_STATS.c.done_count > 0))}
+    for client_id in expected.keys() | stored.keys():
+        if expected.get(client_id) != stored.get(client_id):
+            problems.append(('done', client_id, expected.get(client_id), stored.get(client_id)))
+    expected_weeks, expected_slots = _scheduled_counts(conn)
+    stored_weeks = {(r.client_id, r.week_start): r.scheduled_count for r in conn.execute(
+        select(_WEEKS).where(_WEEKS.c.scheduled_count != 0))}
+    for key in expected_weeks.keys() | stored_weeks.keys():
+        if expected_weeks.get(key) != stored_weeks.get(key):
+            problems.append(('week', key, expected_weeks.get(key), stored_weeks.get(key)))
+    stored_slots = {r.slot_start: r.scheduled_count for r in conn.execute(
+        select(_SLOTS).where(_SLOTS.c.scheduled_count != 0))}
+    for key in expected_slots.keys() | stored_slots.keys():
+        if expected_slots.get(key) != stored_slots.get(key):
+            problems.append(('slot', key, expected_slots.get(key), stored_slots.get(key)))
+    return problems
+
+
+def apply_changes(conn, changes, counters: bool = True):
+    """Aplica deltas de (antes, depois) de agendamentos ao resumo.
+
+    counters=False deixa de fora semana e slot, já movidos por reserve_*/release_*.
+    """
+    week_deltas = Counter()
+    slot_deltas = Counter()
+    occupancy_deltas = Counter()
+    done_added = defaultdict(list)
+    done_removed = Counter()
+    for before, after in changes:
+        if before == after:
+            continue
+        for state, sign in ((before, -1), (after, 1)):
+            if state is None:
+                continue
+            occupancy_deltas[(state.when.date(), state.when.hour, state.status)] += sign
+            if state.status == AppointmentStatus.SCHEDULED and counters:
+                week_deltas[(state.client_id, week_start(state.when))] += sign
+                slot_deltas[slot_start(state.when)] += sign
+            elif state.status == AppointmentStatus.DONE:
+                if sign > 0:
+                    done_added[state.client_id].append(state.when)
+                else:
+                    done_removed[state.client_id] += 1
+
+    _add_deltas(conn, _WEEKS, [{'client_id': client_id, 'week_start': start, 'scheduled_count': delta}
+                               for (client_id, start), delta in week_deltas.items() if delta])
+    _add_deltas(conn, _SLOTS, [{'slot_start': start, 'scheduled_count': delta}
+                               for start, delta in slot_deltas.items() if delta])
+    _add_occupancy(conn, occupancy_deltas)
+
+    for client_id in done_added.keys() | done_removed.keys():
+        added = done_added.get(client_id, [])
+        delta = len(added) - done_removed.get(client_id, 0)
+        if done_removed.get(client_id):
+            # remoção pode tirar o primeiro/último corte: relê só os extremos
+            first, last = _done_bounds(conn, client_id)
+        else:
+            first = case((_STATS.c.first_done_at.is_(None) | (_STATS.c.first_done_at > min(added)), min(added)),
+                         else_=_STATS.c.first_done_at)
+            last = case((_STATS.c.last_done_at.is_(None) | (_STATS.c.last_done_at < max(added)), max(added)),
+                        else_=_STATS.c.last_done_at)
+        _upsert(conn, _STATS, {'client_id': client_id},
+                {'done_count': delta, 'first_done_at': min(added, default=None), 'last_done_at': max(added, default=None)},
+                {'done_count': _STATS.c.done_count + delta, 'first_done_at': first, 'last_done_at': last})
+
+
+def add_occupancy(conn, states):
+    """Conta na ocupação diária agendamentos gravados sem passar pelo flush (insert em lote)."""
+    _add_occupancy(conn, Counter((s.when.date(), s.when.hour, s.status) for s in states))
+
+
+def _add_occupancy(conn, deltas):
+    _add_deltas(conn, _OCCUPANCY, [{'day': day, 'hour': hour, 'status': status, 'appointment_count': delta}
+                                   for (day, hour, status), delta in deltas.items() if delta], 'appointment_count')
+
+
+def add_archived(conn, states):
+    """Soma ao resumo do arquivo os agendamentos encerrados que saíram de appointments."""
+    totals = {}
+    for state in states:
+        row = totals.setdefault(state.client_id, {'client_id': state.client_id, 'done_count': 0, 'canceled_count': 0,
+                                                  'no_show_count': 0, 'first_done_at': None, 'last_done_at': None})
+        if state.status == AppointmentStatus.DONE:
+            row['done_count'] += 1
+            row['first_done_at'] = min(filter(None, (row['first_done_at'], state.when)))
+            row['last_done_at'] = max(filter(None, (row['last_done_at'], state.when)))
+        elif state.status == AppointmentStatus.CANCELED:
+            row['canceled_count'] += 1
+        elif state.status == AppointmentStatus.NO_SHOW:
+            row['no_show_count'] += 1
+    if not totals:
+        return
+    c = _ARCHIVE.c
+    dialect_insert = _dialect_insert(conn)
+    if dialect_insert:
+        stmt = dialect_insert(_ARCHIVE)
+        new = stmt.excluded
+        conn.execute(stmt.on_conflict_do_update(index_elements=['client_id'], set_={
+            'done_count': c.done_count + new.done_count,
+            'canceled_count': c.canceled_count + new.canceled_count,
+            'no_show_count': c.no_show_count + new.no_show_count,
+            'first_done_at': case((c.first_done_at.is_(None) | (new.first_done_at < c.first_done_at), new.first_done_at),
+                                  else_=c.first_done_at),
+            'last_done_at': case((c.last_done_at.is_(None) | (new.last_done_at > c.last_done_at), new.last_done_at),
+                                 else_=c.last_done_at),
+        }), list(totals.values()))
+        return
+    for row in totals.values():
+        first, last = row['first_done_at'], row['last_done_at']
+        _upsert(conn, _ARCHIVE, {'client_id': row['client_id']}, {k: v for k, v in row.items() if k != 'client_id'}, {
+            'done_count': c.done_count + row['done_count'],
+            'canceled_count': c.canceled_count + row['canceled_count'],
+            'no_show_count': c.no_show_count + row['no_show_count'],
+            'first_done_at': case((c.first_done_at.is_(None) | (c.first_done_at > first), first), else_=c.first_done_at)
+            if first else c.first_done_at,
+            'last_done_at': case((c.last_done_at.is_(None) | (c.last_done_at < last), last), else_=c.last_done_at)
+            if last else c.last_done_at,
+        })
+
+
+def _done_aggregate(conn):
+    live = (select(Appointment.client_id, func.count(Appointment.id).label('done_count'),
+                   func.min(Appointment.appointment_date_time).label('first_done_at'),
+                   func.max(Appointment.appointment_date_time).label('last_done_at'))
+            .where(Appointment.status == AppointmentStatus.DONE)
+            .group_by(Appointment.client_id))
+    if not inspect(conn).has_table(_ARCHIVE.name):
+        # migrações anteriores ao arquivamento reconstroem antes de a tabela existir
+        return live
+    archived = select(_ARCHIVE.c.client_id, _ARCHIVE.c.done_count, _ARCHIVE.c.first_done_at,
+                      _ARCHIVE.c.last_done_at).where(_ARCHIVE.c.done_count > 0)
+    both = union_all(live, archived).subquery()
+    return (select(both.c.client_id, func.sum(both.c.done_count), func.min(both.c.first_done_at),
+                   func.max(both.c.last_done_at))
+            .group_by(both.c.client_id))
+
+
+def _done_bounds(conn, client_id: int):
+    """Primeiro e último corte do cliente, juntando o histórico vivo (pelo índice) e o resumo do arquivo."""
+    done = select(Appointment.appointment_date_time).where(
+        Appointment.client_id == client_id, Appointment.status == AppointmentStatus.DONE)
+    row = conn.execute(select(
+        done.order_by(Appointment.appointment_date_time).limit(1).scalar_subquery(),
+        done.order_by(Appointment.appointment_date_time.desc()).limit(1).scalar_subquery(),
+        select(_ARCHIVE.c.first_done_at).where(_ARCHIVE.c.client_id == client_id).scalar_subquery(),
+        select(_ARCHIVE.c.last_done_at).where(_ARCHIVE.c.client_id == client_id).scalar_subquery(),
+    )).one()
+    firsts = [v for v in (row[0], row[2]) if v is not None]
+    lasts = [v for v in (row[1], row[3]) if v is not None]
+    return min(firsts, default=None), max(lasts, default=None)
+
+
+def _scheduled_counts(conn):
+    weeks = Counter()
+    slots = Counter()
+    rows = conn.execute(select(Appointment.client_id, Appointment.appointment_date_time)
+                        .where(Appointment.status == AppointmentStatus.SCHEDULED)
+                        .execution_options(yield_per=1000))
+    for client_id, when in rows:
+        weeks[(client_id, week_start(when))] += 1
+        slots[slot_start(when)] += 1
+    return weeks, slots
+
+
+def reserve_week(conn, client_id: int, start: date, count: int, limit: int) -> bool:
+    """Soma count ao contador da semana só se couber no limite, num único statement atômico.
+
+    O upsert trava apenas a linha (cliente, semana) até o commit: reservas do mesmo cliente na
+    mesma semana se enfileiram, as demais seguem em paralelo.
+    """
+    return _reserve(conn, _WEEKS, {'client_id': client_id, 'week_start': start}, count, limit)
+
+
+def reserve_slot(conn, start: datetime, count: int, chairs: int) -> bool:
+    """Ocupa count cadeiras do slot só se ainda houver cadeiras livres (mesma garantia de reserve_week)."""
+    return _reserve(conn, _SLOTS, {'slot_start': start}, count, chairs)
+
+
+def release_week(conn, client_id: int, start: date, count: int):
+    """Devolve vagas reservadas por reserve_week quando o resto da reserva falhou."""
+    _add_deltas(conn, _WEEKS, [{'client_id': client_id, 'week_start': start, 'scheduled_count': -count}])
+
+
+def release_slot(conn, start: datetime, count: int):
+    """Devolve cadeiras ocupadas por reserve_slot."""
+    _add_deltas(conn, _SLOTS, [{'slot_start': start, 'scheduled_count': -count}])
+
+
+def _reserve(conn, table, keys, count, limit) -> bool:
+    if count > limit:
+        return False
+    counter = table.c.scheduled_count
+    dialect_insert = _dialect_insert(conn)
+    if dialect_insert:
+        stmt = dialect_insert(table).values(**keys, scheduled_count=count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={'scheduled_count': counter + count},
+            where=counter + count <= limit,
+        )
+        return conn.execute(stmt).rowcount == 1
+    where = [table.c[k] == v for k, v in keys.items()]
+    if conn.execute(update(table).where(*where, counter + count <= limit)
+                    .values(scheduled_count=counter + count)).rowcount:
+        return True
+    if conn.execute(select(counter).where(*where)).first():
+        return False
+    conn.execute(insert(table).values(**keys, scheduled_count=count))
+    return True
+
+
+def _dialect_insert(conn):
+    if conn.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        return dialect_insert
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        return dialect_insert
+    return None
+
+
+def _add_deltas(conn, table, rows, column='scheduled_count'):
+    if not rows:
+        return
+    keys = [column.name for column in table.primary_key]
+    dialect_insert = _dialect_insert(conn)
+    if dialect_insert:
+        # um único executemany com upsert para todas as chaves tocadas
+        stmt = dialect_insert(table)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={column: table.c[column] + stmt.excluded[column]}), rows)
+        return
+    for row in rows:
+        _upsert(conn, table, {k: row[k] for k in keys}, {column: row[column]},
+                {column: table.c[column] + row[column]})
+
+
+def _upsert(conn, table, keys, insert_values, update_values):
+    dialect_insert = _dialect_insert(conn)
+    if dialect_insert:
+        conn.execute(dialect_insert(table).values(**keys, **insert_values)
+                     .on_conflict_do_update(index_elements=list(keys), set_=update_values))
+        return
+    where = [table.c[k] == v for k, v in keys.items()]
+    if not conn.execute(update(table).where(*where).values(**update_values)).rowcount:
+        conn.execute(insert(table).values(**keys, **insert_values))
+
+
+def _current(obj) -> VisitState:
+    return VisitState(obj.client_id, obj.appointment_date_time, obj.status)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_appointment_changes(session, flush_context, instances):
+    changes = session.info.setdefault('visit_changes', [])
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Appointment):
+                if obj.appointment_date_time is None:
+                    obj.appointment_date_time = datetime.utcnow()
+                if obj.status is None:
+                    obj.status = AppointmentStatus.SCHEDULED
+                if getattr(obj, '_counters_reserved', False):
+                    # contadores de semana e de slot já incrementados por reserve_week/reserve_slot
+                    obj._counters_reserved = False
+                    session.info.setdefault('visit_reserved', []).append(_current(obj))
+                    continue
+                changes.append((None, _current(obj)))
+
+        deleted_clients = [inspect(obj).identity[0] for obj in session.deleted if isinstance(obj, Client)]
+        if deleted_clients:
+            # agendamentos vivos saem pelo ORM junto com o cliente: entram em removed e devolvem semana, slot e ocupação
+            for obj in session.scalars(select(Appointment).where(Appointment.client_id.in_(deleted_clients))):
+                session.delete(obj)
+            session.info.setdefault('visit_deleted_clients', set()).update(deleted_clients)
+
+        touched = [obj for obj in session.dirty if isinstance(obj, Appointment) and session.is_modified(obj)]
+        removed = [obj for obj in session.deleted if isinstance(obj, Appointment)]
+        if touched or removed:
+            # atributos expirados não guardam o valor antigo: o banco ainda tem o estado pré-flush
+            ids = [inspect(obj).identity[0] for obj in touched + removed]
+            stored = {row.id: VisitState(row.client_id, row.appointment_date_time, row.status)
+                      for row in session.connection().execute(
+                          select(Appointment.id, Appointment.client_id, Appointment.appointment_date_time,
+                                 Appointment.status).where(Appointment.id.in_(ids)))}
+            for obj in touched:
+                change = (stored.get(inspect(obj).identity[0]), _current(obj))
+                if getattr(obj, '_counters_reserved', False):
+                    # semana e slot já trocados por BookingService.reschedule
+                    obj._counters_reserved = False
+                    session.info.setdefault('visit_moved', []).append(change)
+                else:
+                    changes.append(change)
+            for obj in removed:
+                changes.append((stored.get(inspect(obj).identity[0]), None))
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_appointment_changes(session, flush_context):
+    changes = session.info.pop('visit_changes', None)
+    reserved = session.info.pop('visit_reserved', None)
+    moved = session.info.pop('visit_moved', None)
+    deleted_clients = session.info.pop('visit_deleted_clients', None)
+    if not changes and not reserved and not moved and not deleted_clients:
+        return
+    conn = session.connection()
+    if changes:
+        apply_changes(conn, changes)
+    if moved:
+        apply_changes(conn, moved, counters=False)
+    if reserved:
+        add_occupancy(conn, reserved)
+    if deleted_clients:
+        remove_clients(conn, list(deleted_clients))
+        table_versions.mark_changed(session, _ARCHIVED.name)
+    table_versions.mark_changed(session, _OCCUPANCY.name)
+
+
+def remove_clients(conn, client_ids):
+    """Apaga resumos e agendamentos arquivados de clientes removidos, e tira os arquivados da ocupação.
+
+    Os agendamentos vivos já foram removidos pelo flush (ver _collect_appointment_changes).
+    """
+    a = _ARCHIVED.c
+    archived = conn.execute(select(a.appointment_date_time, a.status).where(a.client_id.in_(client_ids)))
+    _add_occupancy(conn, Counter({key: -n for key, n in Counter((when.date(), when.hour, status)
+                                                                for when, status in archived).items()}))
+    conn.execute(delete(_ARCHIVED).where(a.client_id.in_(client_ids)))
+    conn.execute(delete(_STATS).where(_STATS.c.client_id.in_(client_ids)))
+    conn.execute(delete(_WEEKS).where(_WEEKS.c.client_id.in_(client_ids)))
+    conn.execute(delete(_ARCHIVE).where(_ARCHIVE.c.client_id.in_(client_ids)))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_appointment_changes(session, previous_transaction):
+    session.info.pop('visit_changes', None)
+    session.info.pop('visit_reserved', None)
+    session.info.pop('visit_moved', None)
+    session.info.pop('visit_deleted_clients', None)
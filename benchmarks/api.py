@@ -0,0 +1,120 @@
+"""Vazão de listagens grandes: objetos do ORM vs. API de leitura (/api/v1) em tuplas do Core.
+
+Mede cada recurso página a página no serviço e, por HTTP, a leitura de todos os clientes
+pela página HTML (o que as integrações raspam hoje) contra a paginação da API.
+
+Uso: python -m benchmarks.api --clients 20000 --appointments 200000 --page 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import create_app
+from app.api import RESOURCES, ReadApi
+from app.models import Appointment, Client, Plan, Subscription
+from benchmarks.data import generate
+
+MODELS = {'clients': Client, 'plans': Plan, 'subscriptions': Subscription, 'appointments': Appointment}
+
+
+def orm_page(session, resource, limit):
+    """Caminho de hoje: entidades completas no identity map, convertidas campo a campo."""
+    model = MODELS[resource.name]
+    order = [getattr(model, name) for name in resource.order]
+    objects = session.query(model).order_by(*order).limit(limit).all()
+    data = []
+    for obj in objects:
+        item = {}
+        for name in resource.default_fields:
+            value = getattr(obj, name)
+            convert = resource.fields[name].convert
+            item[name] = convert(value) if convert and value is not None else value
+        data.append(item)
+    return json.dumps({'data': data}, ensure_ascii=False, separators=(',', ':'))
+
+
+def core_page(session, resource, limit):
+    return ReadApi(session).page(resource, limit=limit).to_json()
+
+
+def run(Session, call, resource, limit, iterations):
+    timings = []
+    for _ in range(iterations):
+        session = Session()
+        started = perf_counter()
+        body = call(session, resource, limit)
+        timings.append(perf_counter() - started)
+        session.close()
+    return statistics.median(timings), body
+
+
+def crawl_api(client, path, limit):
+    rows, cursor = 0, None
+    while True:
+        response = client.get(path, query_string={'limit': limit, **({'cursor': cursor} if cursor else {})})
+        body = response.get_json()
+        rows += len(body['data'])
+        cursor = body['next_cursor']
+        if not cursor:
+            return rows
+
+
+def http(database, limit, iterations):
+    app = create_app({'DATABASE_URL': database, 'EMAIL_WORKER': 'off', 'QUERY_STATS': False, 'METRICS': False})
+    client = app.test_client()
+
+    def scrape():
+        return client.get('/clients').get_data().count(b'<tr') - 1
+
+    def paginate():
+        return crawl_api(client, '/api/v1/clients', limit)
+
+    result = {}
+    for name, call in (('html_clients', scrape), ('api_clients', paginate)):
+        timings = []
+        for _ in range(iterations):
+            started = perf_counter()
+            rows = call()
+            timings.append(perf_counter() - started)
+        seconds = statistics.median(timings)
+        result[name] = {'rows': rows, 'ms': round(seconds * 1000, 1), 'rows_per_s': round(rows / seconds)}
+    result['speedup'] = round(result['html_clients']['ms'] / result['api_clients']['ms'], 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', help='base já gerada; sem ela, cria uma temporária')
+    parser.add_argument('--clients', type=int, default=20000)
+    parser.add_argument('--appointments', type=int, default=200000)
+    parser.add_argument('--page', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    database = args.database or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'api.db')}"
+    engine = create_engine(database, future=True)
+    if not args.database:
+        generate(engine, args.clients, args.appointments)
+    Session = sessionmaker(bind=engine, future=True)
+
+    results = {}
+    for name, resource in RESOURCES.items():
+        orm, orm_body = run(Session, orm_page, resource, args.page, args.iterations)
+        core, core_body = run(Session, core_page, resource, args.page, args.iterations)
+        rows = len(json.loads(core_body)['data'])
+        assert json.loads(orm_body)['data'] == json.loads(core_body)['data'], name
+        results[name] = {'rows': rows, 'orm_ms': round(orm * 1000, 2), 'core_ms': round(core * 1000, 2),
+                         'orm_rows_per_s': round(rows / orm), 'core_rows_per_s': round(rows / core),
+                         'speedup': round(orm / core, 2)}
+    print(json.dumps({'database': database, 'page': args.page, 'results': results,
+                      'http': http(database, args.page, max(3, args.iterations // 5))}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Reservas concorrentes: reservas efetivadas por segundo e recusas por motivo.
+
+Cada tentativa usa um horário próprio (nunca falta cadeira); as recusas vêm do limite semanal do plano.
+
+Uso: python -m benchmarks.booking --clients 50 --attempts 2000 --threads 8
+"""
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.config import Config
+from app.db import engine_options, install_sqlite_pragmas
+from app.models import Appointment, AppointmentStatus, Base, Client, Plan, PlanDayRule, Subscription
+from app.services import BookingService
+from app.visit_stats import SLOT_MINUTES, week_start
+
+TUNED = {key: getattr(Config, key) for key in dir(Config) if key.startswith(('DB_', 'SQLITE_'))}
+
+
+def seed(engine, clients, weekly_limit):
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Plan), [{'id': 1, 'name': 'Bench', 'price': 10, 'day_rule': PlanDayRule.ANY_DAY,
+                                     'min_days_between_appointments': 0, 'weekly_limit': weekly_limit}])
+        conn.execute(insert(Client), [{'id': i, 'full_name': f'C{i}', 'email': f'c{i}@bench.local', 'phone': '0'}
+                                      for i in range(1, clients + 1)])
+        conn.execute(insert(Subscription), [{'client_id': i, 'plan_id': 1, 'active': True}
+                                            for i in range(1, clients + 1)])
+
+
+def attempts(clients, count, days):
+    """Horários distintos: `days` dias a partir da próxima segunda, um slot novo a cada volta."""
+    monday = week_start(datetime.now() + timedelta(days=7))
+    base = datetime.combine(monday, datetime.min.time())
+    rng = random.Random(0)
+    return [(rng.randint(1, clients), base + timedelta(days=i % days, minutes=SLOT_MINUTES * (i // days)))
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--attempts', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--weekly-limit', type=int, default=2)
+    args = parser.parse_args()
+
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'booking.db')}"
+    engine = create_engine(url, **engine_options(url, TUNED))
+    install_sqlite_pragmas(engine, TUNED)
+    seed(engine, args.clients, args.weekly_limit)
+    Session = sessionmaker(bind=engine, future=True)
+    # até 48 slots de 30 min por dia: dias suficientes para nenhum horário se repetir
+    days = max(14, -(-args.attempts // 48))
+
+    def book(attempt):
+        client_id, when = attempt
+        with Session() as s:
+            try:
+                BookingService(s).book(s.get(Client, client_id),
+                                       Appointment(client_id=client_id, appointment_date_time=when, service='Corte',
+                                                   status=AppointmentStatus.SCHEDULED))
+                s.commit()
+                return None
+            except ValueError as exc:
+                s.rollback()
+                return str(exc)
+
+    work = attempts(args.clients, args.attempts, days)
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        outcomes = Counter(pool.map(book, work))
+    elapsed = perf_counter() - started
+    booked = outcomes.pop(None, 0)
+    with engine.connect() as conn:
+        stored = len(conn.execute(select(Appointment.id)).all())
+    print(json.dumps({'attempts': len(work), 'booked': booked, 'stored': stored, 'seconds': round(elapsed, 2),
+                      'bookings_per_s': round(booked / elapsed), 'attempts_per_s': round(len(work) / elapsed),
+                      'rejected': dict(outcomes)}, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
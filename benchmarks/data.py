@@ -0,0 +1,91 @@
+"""Gera uma base sintética para benchmarks: clientes, assinaturas com planos variados e agendamentos.
+
+Uso: python -m benchmarks.data --database sqlite:///data/bench.db --clients 100000 --appointments 2000000
+"""
+import argparse
+from datetime import date, datetime, timedelta
+import json
+import random
+from time import perf_counter
+
+from sqlalchemy import create_engine, insert, select
+
+from app import search, table_versions, visit_stats
+from app.migrations import init_db
+from app.models import Appointment, AppointmentStatus, Client, Plan, Subscription
+
+BATCH = 20000
+SERVICES = ['Corte', 'Barba', 'Corte + Barba', 'Pigmentação', 'Sobrancelha']
+FIRST_NAMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriel', 'Helena', 'Igor', 'João',
+               'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sofia', 'Thiago', 'Vitória', 'Wesley']
+LAST_NAMES = ['Silva', 'Souza', 'Oliveira', 'Santos', 'Lima', 'Pereira', 'Costa', 'Ferreira', 'Almeida',
+              'Ribeiro', 'Carvalho', 'Gomes', 'Martins', 'Araújo', 'Conceição', 'Barbosa']
+
+
+def generate(engine, clients: int, appointments: int, seed: int = 42, today: date = None) -> dict:
+    """Cria o schema, os planos padrão e os dados; reconstrói os resumos derivados no fim."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    init_db(engine)
+
+    with engine.begin() as conn:
+        first_id = (conn.execute(select(Client.id).order_by(Client.id.desc()).limit(1)).scalar() or 0) + 1
+        plan_ids = list(conn.execute(select(Plan.id).where(Plan.active.is_(True))).scalars())
+        ids = range(first_id, first_id + clients)
+        _insert_batches(conn, Client, ({
+            'id': i, 'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}',
+            'email': f'cliente{i}@bench.local', 'phone': f'11{i:09d}', 'age': rng.choice([None, rng.randint(14, 80)]),
+            'notes': '',
+        } for i in ids))
+        # ~75% com assinatura, algumas inativas
+        _insert_batches(conn, Subscription, ({
+            'client_id': i, 'plan_id': rng.choice(plan_ids), 'active': rng.random() > 0.05,
+            'start_date': today - timedelta(days=rng.randint(0, 720)),
+        } for i in ids if rng.random() < 0.75))
+        _insert_batches(conn, Appointment, (_appointment(rng, first_id, clients, today) for _ in range(appointments)))
+        visit_stats.rebuild(conn)
+        search.rebuild(conn)
+        table_versions.bump(conn, table_versions.TRACKED)
+    return {'clients': clients, 'appointments': appointments, 'seed': seed}
+
+
+def _appointment(rng, first_id, clients, today) -> dict:
+    # um ano de histórico e dois meses de agenda futura, em horários de meia hora
+    day = today + timedelta(days=rng.randint(-365, 60))
+    when = datetime(day.year, day.month, day.day, rng.randint(9, 19), rng.choice((0, 30)))
+    if day >= today:
+        status = AppointmentStatus.SCHEDULED if rng.random() < 0.9 else AppointmentStatus.CANCELED
+    else:
+        roll = rng.random()
+        status = (AppointmentStatus.DONE if roll < 0.8 else
+                  AppointmentStatus.NO_SHOW if roll < 0.9 else AppointmentStatus.CANCELED)
+    return {'client_id': first_id + rng.randrange(clients), 'appointment_date_time': when,
+            'service': rng.choice(SERVICES), 'status': status}
+
+
+def _insert_batches(conn, model, rows):
+    table = model.__table__
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            conn.execute(insert(table), batch)
+            batch = []
+    if batch:
+        conn.execute(insert(table), batch)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', default='sqlite:///data/bench.db')
+    parser.add_argument('--clients', type=int, default=100000)
+    parser.add_argument('--appointments', type=int, default=2000000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    started = perf_counter()
+    result = generate(create_engine(args.database, future=True), args.clients, args.appointments, args.seed)
+    print(json.dumps({**result, 'database': args.database, 'seconds': round(perf_counter() - started, 1)}))
+
+
+if __name__ == '__main__':
+    main()
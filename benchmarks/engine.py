@@ -0,0 +1,107 @@
+"""Vazão de leitura/escrita concorrente: engine padrão vs. engine ajustada (WAL + pragmas + pool).
+
+Uso: python -m benchmarks.engine --readers 6 --writers 2 --seconds 5
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import os
+import tempfile
+import threading
+from time import perf_counter
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.config import Config
+from app.db import engine_options, install_sqlite_pragmas
+from app.models import Appointment, AppointmentStatus, Base, Client
+
+TUNED = {key: getattr(Config, key) for key in dir(Config) if key.startswith(('DB_', 'SQLITE_'))}
+
+
+def build_engine(path, tuned):
+    url = f'sqlite:///{path}'
+    if not tuned:
+        return create_engine(url, future=True)
+    engine = create_engine(url, **engine_options(url, TUNED))
+    install_sqlite_pragmas(engine, TUNED)
+    return engine
+
+
+def seed(engine, rows):
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Client), [{'id': 1, 'full_name': 'Bench', 'email': 'b@bench.local', 'phone': '0'}])
+        start = datetime(2026, 1, 1, 9)
+        conn.execute(insert(Appointment), [
+            {'client_id': 1, 'appointment_date_time': start + timedelta(minutes=30 * i), 'service': 'Corte',
+             'status': AppointmentStatus.SCHEDULED} for i in range(rows)
+        ])
+
+
+def run(tuned, readers, writers, seconds, rows):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = build_engine(path, tuned)
+    seed(engine, rows)
+    Session = sessionmaker(bind=engine, future=True)
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def reader():
+        done = 0
+        while not stop.is_set():
+            with Session() as s:
+                s.execute(select(func.count(Appointment.id)).where(
+                    Appointment.appointment_date_time >= datetime(2026, 2, 1))).scalar()
+            done += 1
+        with lock:
+            counts['reads'] += done
+
+    def writer():
+        done = errors = 0
+        while not stop.is_set():
+            try:
+                with Session() as s:
+                    s.add(Appointment(client_id=1, appointment_date_time=datetime(2027, 1, 1), service='Corte',
+                                      status=AppointmentStatus.DONE))
+                    s.commit()
+                done += 1
+            except OperationalError:
+                errors += 1
+        with lock:
+            counts['writes'] += done
+            counts['errors'] += errors
+
+    with ThreadPoolExecutor(max_workers=readers + writers) as pool:
+        for _ in range(readers):
+            pool.submit(reader)
+        for _ in range(writers):
+            pool.submit(writer)
+        started = perf_counter()
+        stop.wait(seconds)
+        stop.set()
+    elapsed = perf_counter() - started
+    engine.dispose()
+    return {'reads_per_s': round(counts['reads'] / elapsed), 'writes_per_s': round(counts['writes'] / elapsed),
+            'write_errors': counts['errors']}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+    print(json.dumps({
+        'default': run(False, args.readers, args.writers, args.seconds, args.rows),
+        'tuned': run(True, args.readers, args.writers, args.seconds, args.rows),
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Compara ReturnEstimatorService.estimate_for (por cliente) com estimate_for_many.
+
+Uso: python -m benchmarks.estimator --clients 2000 --history 20
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import random
+from time import perf_counter
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Appointment, AppointmentStatus, Base, Client
+from app.services import ReturnEstimatorService, SettingsService
+from app.visit_stats import rebuild
+
+
+def build_session(clients: int, history: int):
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(Client), [
+            {'id': i, 'full_name': f'Cliente {i}', 'email': f'c{i}@bench.local', 'phone': '0', 'age': rng.randint(12, 80)}
+            for i in range(1, clients + 1)
+        ])
+        start = datetime(2024, 1, 1, 9, 0)
+        rows = []
+        for client_id in range(1, clients + 1):
+            when = start
+            for _ in range(rng.randint(0, history)):
+                when += timedelta(days=rng.randint(7, 40))
+                rows.append({'client_id': client_id, 'appointment_date_time': when, 'service': 'Corte',
+                             'status': AppointmentStatus.DONE})
+        conn.execute(insert(Appointment), rows)
+        rebuild(conn)
+    session = sessionmaker(bind=engine, future=True)()
+    SettingsService(session).ensure_defaults()
+    session.commit()
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--history', type=int, default=20)
+    args = parser.parse_args()
+
+    session = build_session(args.clients, args.history)
+    svc = ReturnEstimatorService(session)
+    clients = session.query(Client).all()
+    ids = [c.id for c in clients]
+
+    started = perf_counter()
+    single = {c.id: svc.estimate_for(c) for c in clients}
+    per_client = perf_counter() - started
+
+    started = perf_counter()
+    batch = svc.estimate_for_many(ids)
+    many = perf_counter() - started
+
+    assert single == batch
+    print(json.dumps({
+        'clients': args.clients,
+        'history': args.history,
+        'estimate_for_s': round(per_client, 4),
+        'estimate_for_many_s': round(many, 4),
+        'speedup': round(per_client / many, 1),
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Busca de clientes com muitos matches: latência por termo (autocomplete e listagem).
+
+Prefixos comuns ('ma', 'ana', 'silva') casam com dezenas de milhares de clientes numa base de 500k.
+
+Uso: python -m benchmarks.search --clients 500000
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.search import ClientSearch
+from benchmarks.data import generate
+
+TERMS = ['a', 'ma', 'ana', 'silva', 'jo', 'ana silva', 'conceicao', 'marcos martins', 'cliente1234', 'zz']
+
+
+def measure(session, term, limit, iterations):
+    search = ClientSearch(session)
+    rows = search.search(term, limit)
+    times = []
+    for _ in range(iterations):
+        started = perf_counter()
+        search.search(term, limit)
+        times.append(perf_counter() - started)
+    times.sort()
+    return {'rows': len(rows), 'p50_ms': round(statistics.median(times) * 1000, 2),
+            'p95_ms': round(times[int(len(times) * 0.95) - 1] * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', help='base já gerada; sem ela, cria uma temporária')
+    parser.add_argument('--clients', type=int, default=500000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--limits', default='10,100', help='limites medidos (autocomplete, listagem)')
+    args = parser.parse_args()
+
+    database = args.database or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'search.db')}"
+    engine = create_engine(database, future=True)
+    if not args.database:
+        generate(engine, args.clients, 0)
+    limits = [int(limit) for limit in args.limits.split(',')]
+    with Session(engine) as session:
+        result = {term: {limit: measure(session, term, limit, args.iterations) for limit in limits} for term in TERMS}
+    print(json.dumps({'database': database, 'terms': result}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Cold start por worker: N processos sobem create_app ao mesmo tempo, com banco novo e já inicializado.
+
+Uso: python -m benchmarks.startup --workers 8
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+WORKER = r'''
+import json, sys
+from time import perf_counter
+started = perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+queries = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+import app
+imported = perf_counter()
+app.create_app({'DATABASE_URL': sys.argv[1], 'EMAIL_WORKER': 'off'})
+done = perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (done - imported) * 1000,
+                  'queries': len(queries)}))
+'''
+
+
+def boot(database, workers):
+    env = {**os.environ, 'PYTHONPATH': os.getcwd()}
+
+    def one(_):
+        out = subprocess.run([sys.executable, '-c', WORKER, database], capture_output=True, text=True, env=env)
+        if out.returncode:
+            raise RuntimeError(out.stderr)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        runs = list(pool.map(one, range(workers)))
+    create = [r['create_app_ms'] for r in runs]
+    return {
+        'create_app_ms_p50': round(statistics.median(create), 1),
+        'create_app_ms_max': round(max(create), 1),
+        'import_ms_p50': round(statistics.median(r['import_ms'] for r in runs), 1),
+        'queries_p50': statistics.median(r['queries'] for r in runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+    database = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+    print(json.dumps({
+        'workers': args.workers,
+        # todos sobem juntos num banco vazio: um inicializa, os outros esperam a trava e só conferem a versão
+        'fresh_database': boot(database, args.workers),
+        'initialized_database': boot(database, args.workers),
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Suíte de benchmarks das rotas principais e dos serviços, com saída JSON comparável entre commits.
+
+Uso:
+  python -m benchmarks.suite                                   # base temporária pequena
+  python -m benchmarks.suite --database sqlite:///data/bench.db --output atual.json --compare base.json
+
+A base de --database deve ter sido gerada antes com python -m benchmarks.data.
+"""
+import argparse
+from datetime import date, datetime, timedelta
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from sqlalchemy import create_engine, event, func, select
+
+from app import create_app
+from app.db import get_session
+from app.models import Appointment, Client, Subscription
+from app.services import PlanPolicyService, ReturnEstimatorService
+from benchmarks.data import generate
+
+
+class Case:
+    def __init__(self, name, run):
+        self.name = name
+        self.run = run
+
+
+def route(client, url):
+    def run():
+        response = client.get(url)
+        response.get_data()  # consome o corpo: exports são streaming
+        response.close()
+        assert response.status_code == 200, (url, response.status_code)
+    return run
+
+
+def service(app, call):
+    def run():
+        with app.app_context():
+            call(get_session())
+    return run
+
+
+def build_cases(app, rng, iterations):
+    client = app.test_client()
+    with app.app_context():
+        session = get_session()
+        total = session.execute(select(func.count(Client.id))).scalar()
+        subscribed = list(session.execute(
+            select(Subscription.client_id).where(Subscription.active.is_(True)).limit(iterations * 10)).scalars())
+        busiest = session.execute(select(Appointment.client_id).group_by(Appointment.client_id)
+                                  .order_by(func.count().desc()).limit(1)).scalar()
+    today = date.today()
+    start, end = today.isoformat(), (today + timedelta(days=30)).isoformat()
+
+    def validate(session):
+        client_obj = session.get(Client, rng.choice(subscribed))
+        when = datetime.combine(today + timedelta(days=rng.randint(1, 30)), datetime.min.time()).replace(hour=10)
+        try:
+            PlanPolicyService(session).validate_appointment(client_obj, when)
+        except ValueError:
+            pass
+
+    def estimate(session):
+        ReturnEstimatorService(session).estimate_for(session.get(Client, rng.choice(subscribed)))
+
+    return [
+        Case('route.dashboard', route(client, '/')),
+        Case('route.agenda', route(client, '/appointments')),
+        Case('route.client_details', route(client, f'/clients/{busiest}')),
+        Case('route.search', route(client, '/clients?q=ana silva')),
+        Case('route.autocomplete', route(client, '/api/clients/autocomplete?q=jo')),
+        Case('route.export_appointments', route(client, f'/export/appointments.csv?start={start}&end={end}')),
+        Case('route.export_clients', route(client, '/export/clients.csv')),
+        Case('route.occupancy', route(client, '/occupancy')),
+        Case('route.api_clients', route(client, '/api/v1/clients?limit=1000')),
+        Case('route.api_appointments', route(client, f'/api/v1/appointments?start={start}&limit=1000')),
+        Case('service.validate_appointment', service(app, validate)),
+        Case('service.estimate_for', service(app, estimate)),
+    ], total
+
+
+def measure(engine, case, iterations, warmup):
+    queries = []
+    counter = {'n': 0}
+
+    def count(*args):
+        counter['n'] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        for _ in range(warmup):
+            case.run()
+        timings = []
+        for _ in range(iterations):
+            counter['n'] = 0
+            started = perf_counter()
+            case.run()
+            timings.append((perf_counter() - started) * 1000)
+            queries.append(counter['n'])
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    # pico de memória numa execução à parte: o tracemalloc distorce a latência
+    tracemalloc.start()
+    case.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(_percentile(timings, 95), 3),
+        'queries': int(statistics.median(queries)),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    lines = []
+    for name, result in current['cases'].items():
+        before = baseline.get('cases', {}).get(name)
+        if not before:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        lines.append(f"{name:32} p50 {before['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f} ms ({ratio:.2f}x)  "
+                     f"queries {before['queries']} -> {result['queries']}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', help='base já gerada; sem ela, cria uma temporária')
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--appointments', type=int, default=40000)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', help='roda só os casos cujo nome contém este texto')
+    parser.add_argument('--output')
+    parser.add_argument('--compare', help='JSON de uma execução anterior')
+    args = parser.parse_args()
+
+    database = args.database
+    meta = {}
+    if not database:
+        database = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+        meta = generate(create_engine(database, future=True), args.clients, args.appointments)
+    # cache do dashboard desligado: mede o cálculo, não o acerto de cache
+    app = create_app({'DATABASE_URL': database, 'EMAIL_WORKER': 'off', 'QUERY_STATS': False,
+                      'DASHBOARD_CACHE_TTL': 0})
+    cases, total = build_cases(app, random.Random(7), args.iterations)
+    with app.app_context():
+        engine = get_session().get_bind()
+
+    results = {}
+    for case in cases:
+        if args.only and args.only not in case.name:
+            continue
+        results[case.name] = measure(engine, case, args.iterations, args.warmup)
+
+    report = {'commit': _commit(), 'database': database, 'clients': total, 'iterations': args.iterations,
+              **{k: v for k, v in meta.items() if k != 'clients'}, 'cases': results}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(text + '\n')
+    print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(report, json.load(f)))
+
+
+if __name__ == '__main__':
+    main()
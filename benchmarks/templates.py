@@ -0,0 +1,104 @@
+"""Páginas grandes: tempo até o primeiro byte, tempo total e pico de memória, renderizando inteiro
+(STREAM_TEMPLATES=0, como antes) ou em streaming; e o custo de compilar os templates num worker novo
+sem cache de bytecode, com o cache vazio e com o cache já preenchido.
+
+Uso: python -m benchmarks.templates --clients 20000 --appointments 200000 --history 800
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import os
+import statistics
+import tempfile
+from time import perf_counter
+import tracemalloc
+
+from sqlalchemy import create_engine, func, insert, select
+from werkzeug.test import EnvironBuilder
+
+from app import create_app
+from app.models import Appointment, AppointmentStatus
+from app.templating import compile_templates
+from benchmarks.data import generate
+
+
+def loyal_client(engine, visits: int) -> int:
+    """Cliente 1 ganha `visits` atendimentos concluídos: a ficha com histórico longo."""
+    with engine.begin() as conn:
+        start = datetime(2015, 1, 5, 9)
+        conn.execute(insert(Appointment), [{'client_id': 1, 'service': 'Corte', 'status': AppointmentStatus.DONE,
+                                            'appointment_date_time': start + timedelta(days=4 * i)}
+                                           for i in range(visits)])
+        return conn.execute(select(func.count()).where(Appointment.client_id == 1)).scalar()
+
+
+def request(app, path):
+    """Chama o app WSGI direto; devolve (segundos até o primeiro pedaço, segundos no total, bytes)."""
+    environ = EnvironBuilder(path=path).get_environ()
+    started = perf_counter()
+    first = None
+    size = 0
+    body = app(environ, lambda status, headers, exc_info=None: None)
+    try:
+        for chunk in body:
+            if chunk and first is None:
+                first = perf_counter() - started
+            size += len(chunk)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return first, perf_counter() - started, size
+
+
+def measure(app, path, iterations):
+    request(app, path)
+    runs = [request(app, path) for _ in range(iterations)]
+    tracemalloc.start()
+    request(app, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'ttfb_ms': round(statistics.median(r[0] for r in runs) * 1000, 1),
+            'total_ms': round(statistics.median(r[1] for r in runs) * 1000, 1),
+            'kb': round(runs[0][2] / 1024), 'peak_mb': round(peak / 1024 / 1024, 2)}
+
+
+def cold_compile(database, cache_dir):
+    """Worker novo (ambiente Jinja vazio) carregando todos os templates."""
+    config = {'DATABASE_URL': database, 'EMAIL_WORKER': 'off', 'TEMPLATE_CACHE_DIR': cache_dir}
+    result = {}
+    for name, cached in (('no_cache', False), ('empty_cache', True), ('warm_cache', True)):
+        app = create_app({**config, 'TEMPLATE_BYTECODE_CACHE': cached})
+        started = perf_counter()
+        count = compile_templates(app)
+        result[name] = round((perf_counter() - started) * 1000, 1)
+    result['templates'] = count
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', help='base já gerada; sem ela, cria uma temporária')
+    parser.add_argument('--clients', type=int, default=20000)
+    parser.add_argument('--appointments', type=int, default=200000)
+    parser.add_argument('--history', type=int, default=800, help='atendimentos extras do cliente 1')
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    database = args.database or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'templates.db')}"
+    engine = create_engine(database, future=True)
+    if not args.database:
+        generate(engine, args.clients, args.appointments)
+    history = loyal_client(engine, args.history)
+
+    config = {'DATABASE_URL': database, 'EMAIL_WORKER': 'off', 'QUERY_STATS': False, 'METRICS': False}
+    apps = {'render': create_app({**config, 'STREAM_TEMPLATES': False}),
+            'stream': create_app({**config, 'STREAM_TEMPLATES': True})}
+    pages = {}
+    for path in ('/clients', '/clients/1', '/appointments'):
+        pages[path] = {mode: measure(app, path, args.iterations) for mode, app in apps.items()}
+    print(json.dumps({'database': database, 'client_1_history': history, 'pages': pages,
+                      'cold_compile_ms': cold_compile(database, tempfile.mkdtemp())}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Client, Appointment, AppointmentStatus
+from app.services import AgendaService
+
+
+def setup_session():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    return Session()
+
+
+def seed(s, total):
+    c = Client(full_name='Ana', email='ana@a.com', phone='123')
+    s.add(c)
+    s.flush()
+    base = datetime(2026, 3, 1, 9, 0)
+    for i in range(total):
+        status = AppointmentStatus.DONE if i % 2 else AppointmentStatus.SCHEDULED
+        # pares com o mesmo horário exercitam o desempate por id
+        s.add(Appointment(client_id=c.id, appointment_date_time=base + timedelta(days=i // 2), service='Corte', status=status))
+    s.commit()
+    return c
+
+
+def test_pages_follow_cursor_without_gaps_or_repeats():
+    s = setup_session()
+    seed(s, 25)
+    seen = []
+    cursor = None
+    while True:
+        page = AgendaService(s).page(cursor=cursor, limit=10)
+        seen.extend(a.id for a in page.items)
+        if not page.next_cursor:
+            break
+        cursor = page.next_cursor
+    expected = [a.id for a in s.query(Appointment).order_by(Appointment.appointment_date_time.desc(), Appointment.id.desc())]
+    assert seen == expected
+
+
+def test_filters_and_client_loaded_in_same_query():
+    s = setup_session()
+    seed(s, 20)
+    s.expunge_all()
+    statements = []
+    event.listen(s.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    page = AgendaService(s).page(start=datetime(2026, 3, 3), end=datetime(2026, 3, 6, 23, 59),
+                                 status=AppointmentStatus.DONE)
+    names = [a.client.full_name for a in page.items]
+
+    assert len(statements) == 1
+    assert names == ['Ana'] * 4
+    assert all(a.status == AppointmentStatus.DONE for a in page.items)
+    assert page.next_cursor is None
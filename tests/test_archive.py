@@ -0,0 +1,179 @@
+from datetime import date, datetime, timedelta
+import html
+import random
+import re
+
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app import create_app, occupancy
+from app.archive import AppointmentArchiver, ArchiveService
+from app.db import get_session
+from app.models import (AppSetting, Appointment, AppointmentStatus, ArchivedAppointment, Base, Client,
+                        ClientArchiveStats, ClientVisitStats, Plan, PlanDayRule, Subscription)
+from app.occupancy import OccupancyService
+from app.services import PlanPolicyService, ReturnEstimatorService
+from app.visit_stats import VisitStatsService
+
+NOW = datetime(2026, 6, 1, 12)
+
+
+def setup(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'archive.db'}", future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    s = Session()
+    s.add_all([AppSetting(setting_key='estimator.targetCm', setting_value='1.2'),
+               AppSetting(setting_key='estimator.baseRateCmPerDay', setting_value='0.04'),
+               Plan(id=1, name='Mensal', price=50, day_rule=PlanDayRule.ANY_DAY, min_days_between_appointments=10,
+                    weekly_limit=1, active=True)])
+    rng = random.Random(3)
+    for i in range(1, 9):
+        s.add(Client(id=i, full_name=f'C{i}', email=f'c{i}@x.com', phone='1', age=20 + 5 * i))
+        s.add(Subscription(client_id=i, plan_id=1, active=True))
+    s.flush()
+    statuses = [AppointmentStatus.DONE] * 6 + [AppointmentStatus.CANCELED, AppointmentStatus.NO_SHOW,
+                                               AppointmentStatus.SCHEDULED]
+    for _ in range(300):
+        s.add(Appointment(client_id=rng.randint(1, 8), service='Corte', status=rng.choice(statuses),
+                          appointment_date_time=NOW - timedelta(days=rng.randint(-20, 900), hours=rng.randint(0, 8))))
+    s.commit()
+    return engine, s
+
+
+def answers(s):
+    clients = s.query(Client).order_by(Client.id).all()
+    estimator = ReturnEstimatorService(s)
+    policy = PlanPolicyService(s)
+    slots = [NOW + timedelta(days=d) for d in (1, 3, 9, 15)]
+    return ([estimator.estimate_for(c) for c in clients], estimator.estimate_for_many([c.id for c in clients]),
+            [[check.error for check in policy.validate_many(c, slots)] for c in clients])
+
+
+def test_archive_is_resumable_and_keeps_estimator_and_policy_answers(tmp_path):
+    engine, s = setup(tmp_path)
+    before = answers(s)
+    old_closed = s.execute(select(func.count(Appointment.id)).where(
+        Appointment.appointment_date_time < NOW - timedelta(days=365),
+        Appointment.status != AppointmentStatus.SCHEDULED)).scalar()
+    s.close()
+
+    archiver = AppointmentArchiver(engine, horizon_days=365, batch_size=7)
+    partial = archiver.run(now=NOW, max_batches=3)
+    assert (partial.moved, partial.batches) == (21, 3)
+    rest = archiver.run(now=NOW)
+    assert partial.moved + rest.moved == old_closed
+    assert archiver.run(now=NOW).moved == 0
+
+    s = sessionmaker(bind=engine, future=True)()
+    assert s.execute(select(func.count()).select_from(ArchivedAppointment)).scalar() == old_closed
+    assert s.execute(select(func.sum(ClientArchiveStats.done_count + ClientArchiveStats.canceled_count
+                                     + ClientArchiveStats.no_show_count))).scalar() == old_closed
+    assert s.execute(select(func.count(Appointment.id)).where(
+        Appointment.appointment_date_time < NOW - timedelta(days=365),
+        Appointment.status != AppointmentStatus.SCHEDULED)).scalar() == 0
+    assert answers(s) == before
+    stats = VisitStatsService(s)
+    assert stats.verify() == []
+    stored = s.execute(select(ClientVisitStats.client_id, ClientVisitStats.done_count, ClientVisitStats.first_done_at,
+                              ClientVisitStats.last_done_at).order_by(ClientVisitStats.client_id)).all()
+    stats.rebuild()
+    s.commit()
+    assert s.execute(select(ClientVisitStats.client_id, ClientVisitStats.done_count, ClientVisitStats.first_done_at,
+                            ClientVisitStats.last_done_at).order_by(ClientVisitStats.client_id)).all() == stored
+
+
+def test_removing_live_visits_keeps_archived_first_visit(tmp_path):
+    engine, s = setup(tmp_path)
+    s.execute(insert(Client), [{'id': 20, 'full_name': 'Z', 'email': 'z@x.com', 'phone': '1'}])
+    s.add_all([Appointment(client_id=20, appointment_date_time=datetime(2023, 1, 5, 10), service='Corte',
+                           status=AppointmentStatus.DONE),
+               Appointment(client_id=20, appointment_date_time=datetime(2026, 5, 1, 10), service='Corte',
+                           status=AppointmentStatus.DONE)])
+    s.commit()
+    s.close()
+    AppointmentArchiver(engine, horizon_days=365).run(now=NOW)
+
+    s = sessionmaker(bind=engine, future=True)()
+    s.delete(s.query(Appointment).filter_by(client_id=20).one())
+    s.commit()
+    visits = VisitStatsService(s).for_client(20)
+    assert (visits.done_count, visits.first_done_at, visits.last_done_at) == (
+        1, datetime(2023, 1, 5, 10), datetime(2023, 1, 5, 10))
+    assert VisitStatsService(s).verify() == []
+
+
+def test_client_page_reads_archive_only_when_asked(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'app.db'}", 'EMAIL_WORKER': 'off'})
+    with app.app_context():
+        s = get_session()
+        s.add(Client(id=1, full_name='Ana', email='ana@x.com', phone='1'))
+        s.add(Appointment(client_id=1, appointment_date_time=datetime(2022, 3, 1, 10), service='Barba antiga',
+                          status=AppointmentStatus.DONE))
+        s.commit()
+        engine = s.get_bind()
+    AppointmentArchiver(engine, horizon_days=365).run()
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    client = app.test_client()
+    page = client.get('/clients/1').get_data(as_text=True)
+    assert '1 agendamentos antigos' in page and 'Barba antiga' not in page
+    assert not any('appointments_archive' in sql for sql in statements)
+    assert 'Barba antiga' in client.get('/clients/1?archived=1').get_data(as_text=True)
+
+
+def test_deleting_a_client_removes_their_archived_visits(tmp_path):
+    engine, s = setup(tmp_path)
+    s.close()
+    AppointmentArchiver(engine, horizon_days=365).run(now=NOW)
+    with engine.begin() as conn:
+        occupancy.materialize(conn, date(2020, 1, 1))
+
+    s = sessionmaker(bind=engine, future=True)()
+    assert s.execute(select(func.count()).select_from(ArchivedAppointment).where(ArchivedAppointment.client_id == 3)).scalar()
+    assert s.query(Appointment).filter_by(client_id=3).count()
+    # agendamentos vivos não são apagados à mão: saem junto com o cliente
+    s.delete(s.query(Subscription).filter_by(client_id=3).one())
+    s.delete(s.get(Client, 3))
+    s.commit()
+    assert s.query(Appointment).filter_by(client_id=3).count() == 0
+    AppointmentArchiver(engine, horizon_days=30).run(now=NOW)
+
+    assert s.execute(select(func.count()).select_from(ArchivedAppointment).where(ArchivedAppointment.client_id == 3)).scalar() == 0
+    assert s.get(ClientArchiveStats, 3) is None
+    # a ocupação diária (lida pelos relatórios) deixa de contar os arquivados do cliente
+    stored = sum(count for _, _, count in OccupancyService(s).by_day(date(2020, 1, 1), NOW.date() + timedelta(days=30)))
+    assert stored == (s.execute(select(func.count(Appointment.id))).scalar()
+                      + s.execute(select(func.count()).select_from(ArchivedAppointment)).scalar())
+    assert VisitStatsService(s).verify() == []
+
+
+def test_archived_history_pages_by_date_and_id(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'app.db'}", 'EMAIL_WORKER': 'off'})
+    with app.app_context():
+        s = get_session()
+        s.add(Client(id=1, full_name='Ana', email='ana@x.com', phone='1'))
+        # dois no mesmo horário: o id desempata sem repetir nem pular linhas entre páginas
+        s.add_all([Appointment(client_id=1, appointment_date_time=datetime(2022, 3, day, 10), service=f'Corte {day}',
+                               status=AppointmentStatus.DONE) for day in (1, 2, 2, 3, 4)])
+        s.add_all([Appointment(client_id=1, appointment_date_time=datetime(2021, 1, 1) + timedelta(days=i),
+                               service='Antigo', status=AppointmentStatus.DONE) for i in range(ArchiveService.PAGE_SIZE)])
+        s.commit()
+        engine = s.get_bind()
+    AppointmentArchiver(engine, horizon_days=365).run()
+
+    with app.app_context():
+        archive, seen, before = ArchiveService(get_session()), [], None
+        for _ in range(3):
+            rows, before = archive.history(1, before, limit=2)
+            seen += [row.service for row in rows]
+        assert seen == ['Corte 4', 'Corte 3', 'Corte 2', 'Corte 2', 'Corte 1', 'Antigo']
+
+    client = app.test_client()
+    page = client.get('/clients/1?archived=1').get_data(as_text=True)
+    assert page.count('Antigo') == ArchiveService.PAGE_SIZE - 5
+    link = html.unescape(re.search(r'href="([^"]*before=[^"]*)">Mais antigos', page).group(1))
+    page = client.get(link).get_data(as_text=True)
+    assert page.count('Antigo') == 5 and 'Mais antigos' not in page
+    assert client.get('/clients/1?archived=1&before=nada').status_code == 302
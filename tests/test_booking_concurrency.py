@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import random
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Client, Plan, Subscription, PlanDayRule, Appointment, AppointmentStatus
+from app.services import BookingService
+from app.visit_stats import SLOT_MINUTES, VisitStatsService, week_start
+
+WEEKLY_LIMIT = 2
+
+
+def setup_sessions(tmp_path, clients):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stress.db'}", future=True, connect_args={'timeout': 30})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    s = Session()
+    p = Plan(name='P', price=10, day_rule=PlanDayRule.ANY_DAY, min_days_between_appointments=0, weekly_limit=WEEKLY_LIMIT)
+    s.add(p)
+    s.add_all([Client(full_name=f'C{i}', email=f'c{i}@a.com', phone='1') for i in range(clients)])
+    s.flush()
+    s.add_all([Subscription(client_id=c.id, plan_id=p.id, active=True) for c in s.query(Client)])
+    s.commit()
+    return Session, [c.id for c in s.query(Client)]
+
+
+def test_concurrent_bookings_never_exceed_weekly_limit(tmp_path):
+    Session, client_ids = setup_sessions(tmp_path, clients=4)
+    monday = week_start(datetime.now() + timedelta(days=7))
+    base = datetime.combine(monday, datetime.min.time()) + timedelta(hours=9)
+    # cada tentativa num slot só dela: a cadeira nunca falta, toda recusa tem de ser do limite semanal
+    attempts = [(random.Random(i).choice(client_ids), base + timedelta(days=i % 12, minutes=SLOT_MINUTES * (i // 12)))
+                for i in range(240)]
+    assert len({when for _, when in attempts}) == len(attempts)
+
+    def book(attempt):
+        client_id, when = attempt
+        s = Session()
+        try:
+            BookingService(s).book(s.get(Client, client_id),
+                                   Appointment(client_id=client_id, appointment_date_time=when, service='Corte',
+                                               status=AppointmentStatus.SCHEDULED))
+            s.commit()
+            return None
+        except ValueError as exc:
+            s.rollback()
+            return str(exc)
+        finally:
+            s.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        errors = list(pool.map(book, attempts))
+    booked = errors.count(None)
+    assert {error for error in errors if error} == {'Limite semanal do plano atingido.'}
+
+    s = Session()
+    per_week = s.query(Appointment.client_id, Appointment.appointment_date_time).all()
+    counts = {}
+    for client_id, when in per_week:
+        counts[(client_id, week_start(when))] = counts.get((client_id, week_start(when)), 0) + 1
+    assert max(counts.values()) == WEEKLY_LIMIT
+    assert booked == len(per_week) == len(client_ids) * 2 * WEEKLY_LIMIT
+    assert VisitStatsService(s).verify() == []
+
+
+def test_reservation_upsert_refuses_when_full(tmp_path):
+    Session, (client_id, *_) = setup_sessions(tmp_path, clients=1)
+    s = Session()
+    when = datetime.now() + timedelta(days=8)
+    for expected in (True, True, False):
+        ok = True
+        try:
+            BookingService(s).book(s.get(Client, client_id),
+                                   Appointment(client_id=client_id, appointment_date_time=when, service='Corte',
+                                               status=AppointmentStatus.SCHEDULED))
+            s.commit()
+        except ValueError:
+            ok = False
+            s.rollback()
+        assert ok is expected
+    assert s.query(func.count(Appointment.id)).scalar() == WEEKLY_LIMIT
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import threading
+from time import perf_counter
+
+from app import create_app, db
+from app.models import Appointment, Client
+
+
+def make_app(tmp_path, **config):
+    return create_app({'TESTING': True, 'EMAIL_WORKER': 'off', 'SQLITE_BUSY_TIMEOUT_MS': 2000,
+                       'BRANCH_DATABASES': f"centro=sqlite:///{tmp_path / 'centro.db'},"
+                                           f"norte=sqlite:///{tmp_path / 'norte.db'}",
+                       'DEFAULT_BRANCH': 'centro', **config})
+
+
+def add_client(app, branch, name, appointments=0):
+    with db.session_scope(branch) as s:
+        client = Client(full_name=name, email=f'{name.lower()}@x.com', phone='1')
+        s.add(client)
+        s.flush()
+        s.add_all([Appointment(client_id=client.id, appointment_date_time=datetime.now() + timedelta(hours=i + 1),
+                               service='Corte') for i in range(appointments)])
+
+
+def test_url_prefix_and_header_select_the_branch_database(tmp_path):
+    app = make_app(tmp_path)
+    add_client(app, 'centro', 'Ana')
+    add_client(app, 'norte', 'Bia')
+    client = app.test_client()
+
+    page = client.get('/branches/norte/clients').get_data(as_text=True)
+    assert 'Bia' in page and 'Ana' not in page
+    assert 'href="/branches/norte/clients/new"' in page
+    assert 'Ana' in client.get('/clients').get_data(as_text=True)
+    assert 'Bia' in client.get('/clients', headers={'X-Branch': 'norte'}).get_data(as_text=True)
+    assert client.get('/clients', headers={'X-Branch': 'sul'}).status_code == 404
+    assert client.get('/branches/sul/clients').status_code == 404
+
+    response = client.post('/branches/norte/clients/new', data={'full_name': 'Caio', 'email': 'caio@x.com',
+                                                               'phone': '1'})
+    assert response.status_code == 302 and response.location.startswith('/branches/norte/')
+    with db.session_scope('norte') as s:
+        assert s.query(Client).count() == 2
+    with db.session_scope('centro') as s:
+        assert s.query(Client).count() == 1
+
+    client = app.test_client()
+    first = client.get('/clients')
+    other = client.get('/clients', headers={'X-Branch': 'norte', 'If-None-Match': first.headers['ETag']})
+    assert other.status_code == 200 and other.headers['ETag'] != first.headers['ETag']
+    assert 'X-Branch' in other.headers['Vary']
+
+
+def test_cross_branch_dashboard_sums_every_shard(tmp_path):
+    app = make_app(tmp_path, BRANCH_DATABASES={'centro': f"sqlite:///{tmp_path / 'centro.db'}",
+                                               'norte': f"sqlite:///{tmp_path / 'norte.db'}",
+                                               'sul': f"sqlite:///{tmp_path / 'sul.db'}"})
+    add_client(app, 'centro', 'Ana', appointments=2)
+    add_client(app, 'norte', 'Bia', appointments=1)
+    add_client(app, 'norte', 'Caio')
+
+    page = app.test_client().get('/branches').get_data(as_text=True)
+    assert '<b>Total clientes:</b> 3' in page and '<b>Próximos 7 dias:</b> 3' in page
+    assert 'href="/branches/sul/"' in page
+
+
+def test_a_write_lock_on_one_branch_does_not_block_another(tmp_path):
+    app = make_app(tmp_path)
+    client = app.test_client()
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold_centro_writer_lock():
+        with db.BRANCHES['centro'].engine.connect() as conn:
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            held.set()
+            release.wait(10)
+            conn.rollback()
+
+    holder = threading.Thread(target=hold_centro_writer_lock)
+    holder.start()
+    try:
+        held.wait(5)
+        started = perf_counter()
+        response = client.post('/clients/new', headers={'X-Branch': 'norte'},
+                               data={'full_name': 'Bia', 'email': 'bia@x.com', 'phone': '1'})
+        assert response.status_code == 302
+        assert perf_counter() - started < 1.0
+    finally:
+        release.set()
+        holder.join()
@@ -0,0 +1,104 @@
+import io
+
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app import create_app
+from app import table_versions
+from app.client_import import ClientImportService
+from app.models import Base, Client, EmailOutbox
+from app.search import ClientSearch
+
+CSV = """nome,email,telefone,idade,observacoes
+Ana Souza,ANA@a.com,111,30,
+Bruno Lima,bruno@b.com,222,,vip
+Sem Email,,333,,
+Email Ruim,ruim@,444,,
+Idade Ruim,idade@c.com,555,-3,
+Ana Repetida,ana@a.com,666,,
+Já Existe,existe@d.com,777,,
+Carla Dias,carla@e.com,888,41,
+"""
+
+
+def setup_session():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    return Session()
+
+
+def test_import_validates_deduplicates_and_queues_welcome():
+    s = setup_session()
+    s.add(Client(full_name='Existente', email='existe@d.com', phone='0'))
+    s.commit()
+
+    report = ClientImportService(s, chunk_size=3).import_csv(io.StringIO(CSV))
+
+    assert report.imported == 3
+    assert [(r.line, r.reason) for r in sorted(report.rejected, key=lambda r: r.line)] == [
+        (4, 'Nome, email e telefone são obrigatórios.'),
+        (5, 'E-mail inválido.'),
+        (6, 'Idade deve ser um número positivo.'),
+        # repetida em outro lote: o primeiro já foi gravado
+        (7, 'Já existe cliente com este e-mail.'),
+        (8, 'Já existe cliente com este e-mail.'),
+    ]
+    ana = s.query(Client).filter_by(email='ana@a.com').one()
+    assert (ana.full_name, ana.age) == ('Ana Souza', 30)
+    assert sorted(s.execute(select(EmailOutbox.to_email)).scalars()) == ['ana@a.com', 'bruno@b.com', 'carla@e.com']
+    # inserts em lote também entram no índice de busca
+    assert [r.full_name for r in ClientSearch(s).search('carl')] == ['Carla Dias']
+    # insert em lote também sobe a versão usada pelo ETag da listagem
+    assert table_versions.current(s, ['clients'])['clients'][0] == 4  # seed + cadastro inicial + 2 lotes com inserts
+
+
+def test_import_rejects_repeated_email_in_same_chunk():
+    s = setup_session()
+    report = ClientImportService(s).import_csv(io.StringIO(CSV))
+    assert report.imported == 4
+    assert [(r.line, r.reason) for r in report.rejected if r.line == 7] == [(7, 'E-mail repetido no arquivo.')]
+
+
+def test_import_uses_one_dedup_query_and_one_insert_per_chunk():
+    s = setup_session()
+    rows = ''.join(f'Cliente {i},c{i}@x.com,{i},,\n' for i in range(250))
+    statements = []
+    event.listen(s.get_bind(), 'before_cursor_execute',
+                 lambda conn, cursor, sql, params, context, executemany: statements.append(sql))
+
+    report = ClientImportService(s, chunk_size=100).import_csv(io.StringIO('nome,email,telefone,idade,observacoes\n' + rows))
+
+    assert report.imported == 250
+    assert s.execute(select(func.count(Client.id))).scalar() == 250
+    assert sum(1 for sql in statements if sql.startswith('SELECT clients.email')) == 3
+    assert sum(1 for sql in statements if sql.startswith('INSERT INTO clients')) == 3
+
+
+def test_import_route_reports_rejected_rows(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off'})
+    client = app.test_client()
+    data = {'file': (io.BytesIO(CSV.encode()), 'clientes.csv'), 'rejected_csv': '1'}
+    response = client.post('/clients/import', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.get_data(as_text=True).splitlines()[0] == 'linha,email,motivo'
+    assert len(response.get_data(as_text=True).splitlines()) == 5
+
+
+def test_email_taken_after_the_check_is_a_rejected_row_not_an_error(monkeypatch):
+    s = setup_session()
+    insert_rows = ClientImportService._insert
+
+    def racing(self, conn, rows):
+        # outra requisição cadastra o mesmo e-mail entre a consulta de existentes e o insert
+        conn.execute(insert(Client), [{'full_name': 'Outro Bruno', 'email': 'bruno@b.com', 'phone': '0'}])
+        return insert_rows(self, conn, rows)
+
+    monkeypatch.setattr(ClientImportService, '_insert', racing)
+    report = ClientImportService(s).import_csv(io.StringIO(CSV))
+    assert report.imported == 3
+    assert [(r.line, r.reason) for r in report.rejected if r.email == 'bruno@b.com'] == [
+        (3, 'Já existe cliente com este e-mail.')]
+    assert s.execute(select(Client.full_name).where(Client.email == 'bruno@b.com')).scalar() == 'Outro Bruno'
+    assert 'bruno@b.com' not in s.execute(select(EmailOutbox.to_email)).scalars().all()
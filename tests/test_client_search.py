@@ -0,0 +1,87 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import create_app
+from app.db import get_session
+from app.models import Base, Client
+from app.search import ClientSearch, normalize
+
+
+def setup_session():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    return Session()
+
+
+def names(rows):
+    return [r.full_name for r in rows]
+
+
+def test_normalize_strips_accents_and_case():
+    assert normalize('João CONCEIÇÃO') == 'joao conceicao'
+
+
+def test_prefix_search_is_accent_insensitive_and_kept_in_sync():
+    s = setup_session()
+    joao = Client(full_name='João Conceição', email='joao@barbearia.com', phone='1')
+    s.add_all([joao, Client(full_name='Joana Silva', email='joana@a.com', phone='2'),
+               Client(full_name='Mário Souza', email='mario@b.com', phone='3')])
+    s.commit()
+    search = ClientSearch(s)
+
+    assert sorted(names(search.search('jo'))) == ['Joana Silva', 'João Conceição']
+    assert names(search.search('joao conc')) == ['João Conceição']
+    assert names(search.search('CONCEIC')) == ['João Conceição']
+    assert names(search.search('mario')) == ['Mário Souza']
+    assert names(search.search('barbearia')) == ['João Conceição']
+    assert len(search.search('jo', limit=1)) == 1
+
+    joao.full_name = 'João Batista'
+    s.commit()
+    assert search.search('conceicao') == []
+    assert names(search.search('batista')) == ['João Batista']
+
+    s.delete(joao)
+    s.commit()
+    assert search.search('batista') == []
+
+
+def test_autocomplete_endpoint_caps_results(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off',
+                      'AUTOCOMPLETE_MAX': 3})
+    with app.app_context():
+        s = get_session()
+        s.add_all([Client(full_name=f'Ântonio {i}', email=f'antonio{i}@a.com', phone='1') for i in range(5)])
+        s.commit()
+    client = app.test_client()
+    data = client.get('/api/clients/autocomplete?q=anto&limit=50').get_json()
+    assert len(data) == 3
+    assert set(data[0]) == {'id', 'full_name', 'email'}
+    assert client.get('/api/clients/autocomplete?q=').get_json() == []
+    page = client.get('/clients?q=antonio').get_data(as_text=True)
+    assert page.count('Ântonio') == 5
+
+
+def test_names_starting_with_the_term_come_first_in_order_and_the_page_says_it_was_cut(tmp_path):
+    s = setup_session()
+    # inseridos fora de ordem: sem o índice de nomes viriam os primeiros rowids
+    s.add_all([Client(full_name=name, email=f'c{i}@a.com', phone='1')
+               for i, name in enumerate(['Zeca Lima', 'Limão Souza', 'Lima Barreto', 'Ângela Lima', 'Lia Lima'])])
+    s.commit()
+    assert names(ClientSearch(s).search('lima', limit=2)) == ['Lima Barreto', 'Limão Souza']
+    found = names(ClientSearch(s).search('lima', limit=10))
+    assert found[:2] == ['Lima Barreto', 'Limão Souza']
+    assert sorted(found[2:]) == ['Lia Lima', 'Zeca Lima', 'Ângela Lima']
+
+    app = create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off',
+                      'CLIENT_SEARCH_LIMIT': 3})
+    with app.app_context():
+        s = get_session()
+        s.add_all([Client(full_name=f'Lima {i}', email=f'l{i}@a.com', phone='1') for i in (4, 3, 2, 1)])
+        s.commit()
+    client = app.test_client()
+    page = client.get('/clients?q=lima').get_data(as_text=True)
+    assert page.count('Detalhes</a>') == 3 and 'Lima 4' not in page
+    assert 'Mostrando os 3 primeiros resultados' in page
+    assert 'Mostrando' not in client.get('/clients?q=lima 1').get_data(as_text=True)
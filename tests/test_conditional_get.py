@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import create_app, table_versions
+from app.db import get_session
+from app.models import Appointment, AppointmentStatus, Client, Plan, PlanDayRule
+
+
+def setup_app(tmp_path):
+    return create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off'})
+
+
+def count_queries(app):
+    statements = []
+    with app.app_context():
+        event.listen(get_session().get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_unchanged_list_returns_304_with_a_single_version_query(tmp_path):
+    app = setup_app(tmp_path)
+    client = app.test_client()
+    first = client.get('/clients')
+    assert first.status_code == 200 and first.headers['ETag'] and first.headers['Last-Modified']
+
+    statements = count_queries(app)
+    again = client.get('/clients', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert len(statements) == 1 and 'table_versions' in statements[0]
+
+
+def test_writes_through_session_change_the_etag(tmp_path):
+    app = setup_app(tmp_path)
+    client = app.test_client()
+    etag = client.get('/plans').headers['ETag']
+    with app.app_context():
+        s = get_session()
+        s.add(Plan(name='Novo', price=10, day_rule=PlanDayRule.ANY_DAY, min_days_between_appointments=0,
+                   weekly_limit=1))
+        s.commit()
+    response = client.get('/plans', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    # tabela não relacionada não invalida
+    assert client.get('/clients', headers={'If-None-Match': client.get('/clients').headers['ETag']}).status_code == 304
+
+
+def test_exports_and_agenda_track_appointments_and_clients(tmp_path):
+    app = setup_app(tmp_path)
+    client = app.test_client()
+    urls = ['/appointments', '/export/appointments.csv', '/export/clients.csv']
+    etags = {}
+    for url in urls:
+        response = client.get(url)
+        response.get_data()
+        etags[url] = response.headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etags[url]}).status_code == 304
+    with app.app_context():
+        s = get_session()
+        c = Client(full_name='Ana', email='ana@a.com', phone='1')
+        s.add(c)
+        s.flush()
+        s.add(Appointment(client_id=c.id, appointment_date_time=datetime.now() + timedelta(days=1), service='Corte',
+                          status=AppointmentStatus.SCHEDULED))
+        s.commit()
+    for url in urls:
+        response = client.get(url, headers={'If-None-Match': etags[url]})
+        response.get_data()
+        assert response.status_code == 200
+
+
+def test_query_string_is_part_of_the_etag(tmp_path):
+    app = setup_app(tmp_path)
+    client = app.test_client()
+    assert client.get('/clients?q=ana').headers['ETag'] != client.get('/clients').headers['ETag']
+
+
+def test_version_bump_runs_after_the_write_commits(tmp_path):
+    app = setup_app(tmp_path)
+    with app.app_context():
+        s = get_session()
+        assert set(table_versions.current(s, table_versions.TRACKED)) == table_versions.TRACKED
+        events = []
+        engine = s.get_bind()
+        event.listen(engine, 'before_cursor_execute', lambda conn, cursor, sql, *args: events.append(sql.split()[0]))
+        event.listen(engine, 'commit', lambda conn: events.append('COMMIT'))
+        s.add(Plan(name='Novo', price=10, day_rule=PlanDayRule.ANY_DAY, min_days_between_appointments=0,
+                   weekly_limit=1))
+        s.commit()
+        # a linha de versão não é travada pela transação da escrita, e já existe: nada de INSERT nela
+        assert events == ['INSERT', 'COMMIT', 'UPDATE', 'COMMIT']
+        assert table_versions.current(s, ['plans'])['plans'][0] == 2
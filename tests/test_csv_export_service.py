@@ -0,0 +1,49 @@
+import csv
+from datetime import datetime, timedelta
+import io
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Client, Appointment, AppointmentStatus
+from app.services import CsvExportService
+
+
+def setup_session():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    return Session()
+
+
+def test_clients_export_quotes_fields_with_csv_module():
+    s = setup_session()
+    s.add(Client(full_name='Zé "Navalha", Jr', email='ze@a.com', phone='123', notes='linha 1\nlinha 2'))
+    s.add(Client(full_name='Bia', email='bia@a.com', phone='456', age=31))
+    s.commit()
+
+    rows = list(csv.reader(io.StringIO(''.join(CsvExportService(s).export_clients()))))
+    assert rows[0] == ['id', 'nome', 'email', 'telefone', 'idade', 'observacoes']
+    assert rows[1][1:] == ['Zé "Navalha", Jr', 'ze@a.com', '123', '', 'linha 1\nlinha 2']
+    assert rows[2][1:] == ['Bia', 'bia@a.com', '456', '31', '']
+
+
+def test_appointments_export_streams_batches_in_one_query():
+    s = setup_session()
+    c = Client(full_name='Ana', email='ana@a.com', phone='123')
+    s.add(c)
+    s.flush()
+    for i in range(25):
+        s.add(Appointment(client_id=c.id, appointment_date_time=datetime(2026, 3, 1, 9) + timedelta(days=i),
+                          service='Corte', status=AppointmentStatus.DONE))
+    s.commit()
+    s.expunge_all()
+    statements = []
+    event.listen(s.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    chunks = list(CsvExportService(s, batch_size=10).export_appointments(datetime(2026, 3, 1), datetime(2026, 3, 31)))
+
+    assert len(chunks) == 1 + 3  # cabeçalho + 3 lotes
+    assert len(statements) == 1
+    rows = list(csv.reader(io.StringIO(''.join(chunks))))
+    assert len(rows) == 1 + 25
+    assert rows[1][1:] == ['Ana', '2026-03-01T09:00:00', 'Corte', 'DONE']
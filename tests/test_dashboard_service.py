@@ -0,0 +1,75 @@
+from datetime import date, datetime
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Client, Plan, Subscription, PlanDayRule, Appointment, AppointmentStatus
+from app.services import DashboardCache, DashboardService
+
+
+def setup_session():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    return Session()
+
+
+def count_queries(s):
+    statements = []
+    event.listen(s.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def seed(s):
+    a = Client(full_name='A', email='a@a.com', phone='1')
+    b = Client(full_name='B', email='b@a.com', phone='2')
+    p = Plan(name='P', price=10, day_rule=PlanDayRule.ANY_DAY, min_days_between_appointments=0, weekly_limit=9)
+    off = Plan(name='Off', price=10, day_rule=PlanDayRule.ANY_DAY, min_days_between_appointments=0, weekly_limit=9, active=False)
+    s.add_all([a, b, p, off])
+    s.flush()
+    s.add(Subscription(client_id=a.id, plan_id=p.id, active=True))
+    for when in (datetime(2026, 3, 10, 9), datetime(2026, 3, 10, 23, 59), datetime(2026, 3, 17, 18), datetime(2026, 3, 18, 9),
+                 datetime(2026, 3, 9, 23, 59)):
+        s.add(Appointment(client_id=a.id, appointment_date_time=when, service='Corte', status=AppointmentStatus.SCHEDULED))
+    s.commit()
+    return a
+
+
+def test_counts_come_from_one_query():
+    s = setup_session()
+    seed(s)
+    statements = count_queries(s)
+    snap = DashboardService(s).compute(date(2026, 3, 10))
+    assert len(statements) == 1
+    assert (snap.total_clients, snap.today_count, snap.next7, snap.active_subs, snap.inactive_plans) == (2, 2, 3, 1, 1)
+    assert snap.without_plan == 1
+
+
+def test_snapshot_is_cached_until_a_write_commits():
+    s = setup_session()
+    a = seed(s)
+    svc = DashboardService(s)
+    assert svc.snapshot(date(2026, 3, 10)).today_count == 2
+    statements = count_queries(s)
+    assert svc.snapshot(date(2026, 3, 10)).today_count == 2
+    assert statements == []
+
+    s.add(Appointment(client_id=a.id, appointment_date_time=datetime(2026, 3, 10, 15), service='Barba',
+                      status=AppointmentStatus.SCHEDULED))
+    s.flush()
+    assert svc.snapshot(date(2026, 3, 10)).today_count == 2
+    s.commit()
+    assert svc.snapshot(date(2026, 3, 10)).today_count == 3
+    assert svc.snapshot(date(2026, 3, 11)).today_count == 0
+
+
+def test_read_sessions_on_an_option_engine_see_the_invalidation():
+    s = setup_session()
+    a = seed(s)
+    ReadSession = sessionmaker(bind=s.get_bind().execution_options(isolation_level='SERIALIZABLE'), future=True)
+    assert DashboardService(ReadSession()).snapshot(date(2026, 3, 10)).today_count == 2
+    assert DashboardCache.for_engine(ReadSession().get_bind()) is DashboardCache.for_engine(s.get_bind())
+
+    s.add(Appointment(client_id=a.id, appointment_date_time=datetime(2026, 3, 10, 15), service='Barba',
+                      status=AppointmentStatus.SCHEDULED))
+    s.commit()
+    assert DashboardService(ReadSession()).snapshot(date(2026, 3, 10)).today_count == 3
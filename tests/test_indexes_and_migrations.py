@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, event, inspect, select, text
+from sqlalchemy.orm import sessionmaker
+
+from app.migrations import MIGRATIONS, ensure_current, init_db, latest_version, migrate, schema_version
+from app.models import Base, Client, Plan, Subscription, PlanDayRule, Appointment, AppointmentStatus, SlotCount
+from app.services import AgendaService, PlanPolicyService, ReturnEstimatorService
+from app.visit_stats import verify
+
+
+def setup_session():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    return Session()
+
+
+def capture_plans(s, action):
+    captured = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM appointments' in statement and not statement.startswith('EXPLAIN'):
+            captured.append((statement, parameters))
+
+    engine = s.get_bind()
+    event.listen(engine, 'before_cursor_execute', listener)
+    action()
+    event.remove(engine, 'before_cursor_execute', listener)
+    with engine.connect() as conn:
+        return [' | '.join(row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + stmt, params))
+                for stmt, params in captured]
+
+
+def seeded_client(s):
+    c = Client(full_name='A', email='a@a.com', phone='123', age=30)
+    p = Plan(name='Basic', price=10, day_rule=PlanDayRule.ANY_DAY, min_days_between_appointments=0, weekly_limit=10)
+    s.add_all([c, p])
+    s.flush()
+    s.add(Subscription(client_id=c.id, plan_id=p.id, active=True))
+    s.add(Appointment(client_id=c.id, appointment_date_time=datetime(2026, 2, 1, 10, 0), service='Corte', status=AppointmentStatus.DONE))
+    s.commit()
+    return c
+
+
+def test_services_read_summary_and_maintenance_uses_client_status_index():
+    s = setup_session()
+    c = seeded_client(s)
+    plans = capture_plans(s, lambda: (
+        PlanPolicyService(s).validate_appointment(c, datetime(2026, 2, 20, 10, 0)),
+        ReturnEstimatorService(s).estimate_for(c),
+    ))
+    assert plans == []
+
+    # remover um DONE relê primeiro/último corte do cliente pelo índice composto
+    done = s.query(Appointment).filter_by(status=AppointmentStatus.DONE).one()
+    plans = capture_plans(s, lambda: (s.delete(done), s.flush()))
+    extremes = [plan for plan in plans if 'SUBQUERY' in plan]
+    assert len(extremes) == 1
+    assert extremes[0].count('ix_appointments_client_status_datetime') == 2
+    assert 'SCAN appointments' not in extremes[0]
+
+
+def test_agenda_and_range_counts_use_datetime_index():
+    s = setup_session()
+    seeded_client(s)
+    plans = capture_plans(s, lambda: AgendaService(s).page(start=datetime(2026, 1, 1), end=datetime(2026, 3, 1)))
+    plans += capture_plans(s, lambda: s.execute(text(
+        'SELECT count(id) FROM appointments WHERE appointment_date_time >= :a AND appointment_date_time <= :b'),
+        {'a': datetime(2026, 1, 1), 'b': datetime(2026, 1, 8)}))
+    assert len(plans) == 2
+    for plan in plans:
+        assert 'ix_appointments_datetime_id' in plan
+
+
+def test_migrate_adds_indexes_to_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}", future=True)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text('DROP INDEX ix_appointments_client_status_datetime'))
+        conn.execute(text('DROP INDEX ix_appointments_datetime_id'))
+        conn.execute(text('DROP TABLE schema_migrations'))
+
+    assert migrate(engine) == [version for version, _, _ in MIGRATIONS]
+    names = {ix['name'] for ix in inspect(engine).get_indexes('appointments')}
+    assert {'ix_appointments_client_status_datetime', 'ix_appointments_datetime_id'} <= names
+    assert migrate(engine) == []
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT count(*) FROM schema_migrations')).scalar() == len(MIGRATIONS)
+
+
+def test_boot_only_checks_version_once_initialized(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'boot.db'}", future=True)
+    with pytest.raises(RuntimeError, match='init-db'):
+        ensure_current(engine, auto_init=False)
+    assert init_db(engine) == [version for version, _, _ in MIGRATIONS]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM plans")).scalar() == 3
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    assert ensure_current(engine, auto_init=False) == []
+    assert len(statements) == 1
+    assert schema_version(engine) == latest_version()
+
+
+def test_concurrent_init_applies_each_migration_once(tmp_path):
+    url = f"sqlite:///{tmp_path / 'race.db'}"
+
+    def boot(_):
+        return ensure_current(create_engine(url, future=True, connect_args={'timeout': 30}), auto_init=True)
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(boot, range(6)))
+    assert sorted(results, key=len)[-1] == [version for version, _, _ in MIGRATIONS]
+    assert sum(1 for applied in results if applied) == 1
+    with create_engine(url, future=True).connect() as conn:
+        assert conn.execute(text('SELECT count(*) FROM schema_migrations')).scalar() == len(MIGRATIONS)
+        assert conn.execute(text('SELECT count(*) FROM plans')).scalar() == 3
+
+
+def test_migrate_from_the_baseline_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}", future=True)
+    # só as tabelas da primeira versão, com dados gravados antes de qualquer migração
+    Base.metadata.create_all(engine, tables=[Base.metadata.tables[name] for name in
+                                             ('clients', 'plans', 'subscriptions', 'appointments', 'app_settings')])
+    with engine.begin() as conn:
+        conn.execute(Client.__table__.insert().values(id=1, full_name='A', email='a@a.com', phone='1'))
+        conn.execute(Appointment.__table__.insert(), [
+            {'client_id': 1, 'appointment_date_time': when, 'service': 'Corte', 'status': status}
+            for when, status in ((datetime(2026, 2, 1, 10), AppointmentStatus.DONE),
+                                 (datetime(2099, 3, 2, 10), AppointmentStatus.SCHEDULED))])
+
+    assert migrate(engine) == [version for version, _, _ in MIGRATIONS]
+    with engine.connect() as conn:
+        assert conn.execute(select(SlotCount.slot_start, SlotCount.scheduled_count)).all() == [
+            (datetime(2099, 3, 2, 10), 1)]
+        assert conn.execute(text('SELECT done_count FROM client_visit_stats')).scalar() == 1
+        assert verify(conn) == []
@@ -0,0 +1,70 @@
+import logging
+import re
+import time
+
+from flask import Response, stream_with_context
+
+from app import create_app
+from app.metrics import Registry
+
+
+def setup_app(tmp_path, **config):
+    return create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off',
+                       **config})
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram('x_seconds', 'Teste.', ['endpoint'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3):
+        latency.observe(value, endpoint='a')
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP x_seconds Teste.', '# TYPE x_seconds histogram']
+    assert lines[2:] == [
+        'x_seconds_bucket{endpoint="a",le="0.1"} 1',
+        'x_seconds_bucket{endpoint="a",le="1.0"} 3',
+        'x_seconds_bucket{endpoint="a",le="+Inf"} 4',
+        'x_seconds_sum{endpoint="a"} 4.05',
+        'x_seconds_count{endpoint="a"} 4',
+    ]
+
+
+def test_metrics_endpoint_reports_routes_pool_and_caches(tmp_path):
+    app = setup_app(tmp_path)
+    client = app.test_client()
+    client.get('/')
+    client.get('/')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'barbershop_request_duration_seconds_count{endpoint="dashboard",method="GET"} 2' in body
+    assert 'barbershop_requests_total{endpoint="dashboard",method="GET",status="200"}' in body
+    assert 'barbershop_request_db_seconds_count{endpoint="dashboard"}' in body
+    assert 'barbershop_db_pool_checkout_seconds_count ' in body
+    assert 'barbershop_cache_requests_total{cache="dashboard",result="hit"}' in body
+
+
+def test_slow_requests_are_logged(tmp_path, caplog):
+    app = setup_app(tmp_path, SLOW_REQUEST_MS=0.001)
+    with caplog.at_level(logging.WARNING, logger='app.metrics'):
+        app.test_client().get('/plans')
+    assert any('Requisição lenta: GET /plans' in r.getMessage() for r in caplog.records)
+
+
+def test_streamed_responses_are_timed_until_the_body_is_sent(tmp_path, caplog):
+    app = setup_app(tmp_path, SLOW_REQUEST_MS=150)
+
+    @app.route('/slow-stream')
+    def slow_stream():
+        def body():
+            yield 'a'
+            time.sleep(0.2)
+            yield 'b'
+        return Response(stream_with_context(body()))
+
+    client = app.test_client()
+    with caplog.at_level(logging.WARNING, logger='app.metrics'):
+        with client.get('/slow-stream') as response:
+            assert response.get_data(as_text=True) == 'ab'
+    assert any('Requisição lenta: GET /slow-stream' in r.getMessage() for r in caplog.records)
+    body = client.get('/metrics').get_data(as_text=True)
+    total = re.search(r'barbershop_request_duration_seconds_sum\{endpoint="slow_stream",method="GET"\} (\S+)', body)
+    assert float(total.group(1)) >= 0.2
@@ -0,0 +1,104 @@
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import create_app, occupancy
+from app.archive import AppointmentArchiver
+from app.db import get_session
+from app.models import Appointment, AppointmentStatus, Base, Client, Plan, PlanDayRule, Subscription
+from app.occupancy import OccupancyService
+from app.services import BookingService, SettingsService
+from app.visit_stats import week_start
+
+
+def setup_session():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    s = sessionmaker(bind=engine, future=True)()
+    SettingsService(s).ensure_defaults()
+    c = Client(full_name='Ana', email='ana@a.com', phone='1')
+    p = Plan(name='Livre', price=10, day_rule=PlanDayRule.ANY_DAY, min_days_between_appointments=0, weekly_limit=99)
+    s.add_all([c, p])
+    s.flush()
+    s.add(Subscription(client_id=c.id, plan_id=p.id, active=True))
+    occupancy.materialize(s.connection(), date(2020, 1, 1))
+    s.commit()
+    return s, c
+
+
+def test_incremental_counts_match_a_full_recompute():
+    s, c = setup_session()
+    monday = datetime.combine(week_start(datetime.now()) + timedelta(days=14), time(10))
+    done = Appointment(client_id=c.id, appointment_date_time=datetime(2026, 1, 5, 9, 30), service='Corte',
+                       status=AppointmentStatus.DONE)
+    moved = Appointment(client_id=c.id, appointment_date_time=datetime(2026, 1, 5, 14), service='Corte',
+                        status=AppointmentStatus.SCHEDULED)
+    gone = Appointment(client_id=c.id, appointment_date_time=datetime(2026, 1, 6, 9), service='Barba',
+                       status=AppointmentStatus.NO_SHOW)
+    s.add_all([done, moved, gone])
+    s.commit()
+    moved.appointment_date_time = datetime(2026, 1, 7, 15)
+    moved.status = AppointmentStatus.CANCELED
+    s.delete(gone)
+    BookingService(s).book(c, Appointment(client_id=c.id, appointment_date_time=monday, service='Corte'))
+    BookingService(s).book_many(c, [monday + timedelta(days=1), monday + timedelta(days=8)], 'Corte')
+    s.commit()
+
+    svc = OccupancyService(s)
+    start, end = date(2026, 1, 1), monday.date() + timedelta(days=10)
+    incremental = [tuple(r) for r in svc.by_hour(start, end)]
+    assert incremental[:2] == [(date(2026, 1, 5), 9, AppointmentStatus.DONE, 1),
+                               (date(2026, 1, 7), 15, AppointmentStatus.CANCELED, 1)]
+    assert len(incremental) == 5
+    occupancy.materialize(s.connection(), date(2020, 1, 1))
+    assert [tuple(r) for r in svc.by_hour(start, end)] == incremental
+    assert [tuple(r) for r in svc.by_day(start, date(2026, 1, 31))] == [
+        (date(2026, 1, 5), AppointmentStatus.DONE, 1), (date(2026, 1, 7), AppointmentStatus.CANCELED, 1)]
+
+
+def test_unmaterialized_days_fall_back_and_backfill_keeps_archived_rows(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off'})
+    today = date.today()
+    with app.app_context():
+        s = get_session()
+        s.add(Client(id=1, full_name='Ana', email='ana@a.com', phone='1'))
+        s.add_all([Appointment(client_id=1, appointment_date_time=datetime.combine(today - timedelta(days=d), time(10)),
+                               service='Corte', status=AppointmentStatus.DONE) for d in (3, 40, 400, 401)])
+        s.commit()
+        engine = s.get_bind()
+        assert occupancy.covered_from(s) == today
+        expected = [tuple(r) for r in OccupancyService(s).by_day(today - timedelta(days=365), today)]
+        assert len(expected) == 2
+    AppointmentArchiver(engine, horizon_days=365).run()
+
+    steps = []
+    while (step := occupancy.backfill(engine, days=30)) is not None:
+        steps.append(step)
+    assert steps[-1] == today - timedelta(days=401) and len(steps) > 10
+    with app.app_context():
+        svc = OccupancyService(get_session())
+        assert [tuple(r) for r in svc.by_day(today - timedelta(days=365), today)] == expected
+        assert sum(r[-1] for r in svc.by_day(today - timedelta(days=410), today - timedelta(days=366))) == 2
+
+
+def test_heatmap_page_and_api(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off'})
+    with app.app_context():
+        s = get_session()
+        s.add(Client(id=1, full_name='Ana', email='ana@a.com', phone='1'))
+        s.add_all([Appointment(client_id=1, appointment_date_time=datetime(2026, 3, 2, 9), service='Corte',
+                               status=AppointmentStatus.DONE),
+                   Appointment(client_id=1, appointment_date_time=datetime(2026, 3, 2, 11), service='Corte',
+                               status=AppointmentStatus.CANCELED)])
+        s.commit()
+        heatmap = OccupancyService(s).heatmap(date(2026, 1, 1), date(2026, 12, 31), {AppointmentStatus.DONE})
+        assert heatmap.total == 1 and len(heatmap.weeks) == 53
+        assert heatmap.hours == [(9, [(1, 4), (0, 0), (0, 0), (0, 0), (0, 0), (0, 0), (0, 0)])]
+    client = app.test_client()
+    page = client.get('/occupancy?start=2026-01-01&end=2026-12-31')
+    assert page.status_code == 200 and '02/03/2026: 2' in page.get_data(as_text=True)
+    body = client.get('/api/occupancy?start=2026-03-01&end=2026-03-31&by=hour').get_json()
+    assert body['data'] == [{'day': '2026-03-02', 'hour': 9, 'status': 'DONE', 'count': 1},
+                            {'day': '2026-03-02', 'hour': 11, 'status': 'CANCELED', 'count': 1}]
+    assert client.get('/api/occupancy?start=2025-01-01&end=2026-12-31').status_code == 400
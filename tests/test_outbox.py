@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+import smtplib
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import create_app, stop_email_workers
+from app.metrics import EMAIL_FAILURES, EMAIL_SEND
+from app.models import Base, EmailOutbox, OutboxStatus
+from app.outbox import OutboxSender
+from app.services import EmailService, SettingsService
+
+
+class FakeSMTP:
+    """Servidor SMTP de mentira: registra conexões e mensagens, e falha sob demanda."""
+    connections = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sent = []
+        FakeSMTP.connections.append(self)
+
+    def send_message(self, msg):
+        if msg['To'] in FakeSMTP.refuse:
+            raise smtplib.SMTPRecipientsRefused({msg['To']: (550, b'no such user')})
+        self.sent.append(msg)
+
+    def quit(self):
+        pass
+
+
+def setup_sessions():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    s = Session()
+    SettingsService(s).ensure_defaults()
+    SettingsService(s).set(SettingsService.EMAIL_MODE, 'SMTP')
+    s.commit()
+    FakeSMTP.connections = []
+    FakeSMTP.refuse = set()
+    return s, Session
+
+
+def sender(Session, **kwargs):
+    return OutboxSender(Session, EmailService.mode, smtp_factory=FakeSMTP, **kwargs)
+
+
+def test_send_welcome_only_writes_outbox_row():
+    s, Session = setup_sessions()
+    EmailService(s).send_welcome('ana@a.com', 'Ana')
+    s.commit()
+    row = s.query(EmailOutbox).one()
+    assert (row.to_email, row.status, row.attempts) == ('ana@a.com', OutboxStatus.PENDING, 0)
+    assert 'Ana' in row.body
+    assert FakeSMTP.connections == []
+
+
+def test_drain_sends_batches_over_one_connection():
+    s, Session = setup_sessions()
+    for i in range(7):
+        EmailService(s).send_welcome(f'c{i}@a.com', f'C{i}')
+    s.commit()
+
+    assert sender(Session, batch_size=3).drain() == 7
+    assert len(FakeSMTP.connections) == 1
+    assert [m['To'] for m in FakeSMTP.connections[0].sent] == [f'c{i}@a.com' for i in range(7)]
+    assert {r.status for r in Session().query(EmailOutbox)} == {OutboxStatus.SENT}
+
+
+def test_failures_back_off_and_give_up_after_max_attempts():
+    s, Session = setup_sessions()
+    EmailService(s).send_welcome('bad@a.com', 'Bad')
+    EmailService(s).send_welcome('ok@a.com', 'Ok')
+    s.commit()
+    FakeSMTP.refuse = {'bad@a.com'}
+    out = sender(Session, max_attempts=2, retry_base_seconds=60)
+    failures, sends = EMAIL_FAILURES.value(mode='SMTP'), EMAIL_SEND.count(mode='SMTP')
+
+    assert out.drain() == 1
+    assert (EMAIL_FAILURES.value(mode='SMTP') - failures, EMAIL_SEND.count(mode='SMTP') - sends) == (1, 1)
+    bad = Session().query(EmailOutbox).filter_by(to_email='bad@a.com').one()
+    assert (bad.status, bad.attempts) == (OutboxStatus.PENDING, 1)
+    assert 'SMTPRecipientsRefused' in bad.last_error
+    assert bad.next_attempt_at > datetime.utcnow() + timedelta(seconds=50)
+
+    assert out.drain() == 0  # ainda em backoff
+    s.query(EmailOutbox).filter_by(to_email='bad@a.com').update({'next_attempt_at': datetime.utcnow()})
+    s.commit()
+    assert out.drain() == 0
+    bad = Session().query(EmailOutbox).filter_by(to_email='bad@a.com').one()
+    assert (bad.status, bad.attempts) == (OutboxStatus.FAILED, 2)
+
+
+def test_claimed_messages_are_not_picked_by_another_sender():
+    s, Session = setup_sessions()
+    for i in range(4):
+        EmailService(s).send_welcome(f'c{i}@a.com', f'C{i}')
+    s.commit()
+    first, second = sender(Session, batch_size=2), sender(Session, batch_size=2)
+    assert first.send_batch() == (2, 2)
+    assert second.send_batch() == (2, 2)
+    assert first.send_batch() == (0, 0)
+    sent = [m['To'] for conn in FakeSMTP.connections for m in conn.sent]
+    assert sorted(sent) == [f'c{i}@a.com' for i in range(4)]
+
+
+def test_web_workers_stay_off_under_testing_and_stop_cleanly(tmp_path):
+    config = {'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'thread',
+              'EMAIL_POLL_INTERVAL': 0.05}
+    testing = create_app({**config, 'TESTING': True})
+    testing.test_client().get('/plans')
+    assert 'email_workers' not in testing.extensions
+
+    app = create_app(config)
+    try:
+        app.test_client().get('/plans')
+        workers = app.extensions['email_workers']
+        assert workers and all(worker.is_alive() for worker in workers)
+    finally:
+        stop_email_workers(app)
+    assert not any(worker.is_alive() for worker in workers)
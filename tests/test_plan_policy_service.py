@@ -1,10 +1,11 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 from app.models import Base, Client, Plan, Subscription, PlanDayRule, Appointment, AppointmentStatus
-from app.services import PlanPolicyService
+from app.services import BookingService, PlanPolicyService
+from app.visit_stats import VisitStatsService
 
 
 def setup_session():
@@ -39,3 +40,69 @@ def test_blocks_when_min_days_between_not_respected():
 
     with pytest.raises(ValueError, match='Intervalo mínimo'):
         PlanPolicyService(s).validate_appointment(c, datetime(2026, 2, 3, 10, 0))
+
+
+def subscribed_client(s, **plan_fields):
+    c = Client(full_name='C', email='c@a.com', phone='123')
+    p = Plan(name='P', price=10, **plan_fields)
+    s.add_all([c, p])
+    s.flush()
+    s.add(Subscription(client_id=c.id, plan_id=p.id, active=True))
+    s.commit()
+    return c
+
+
+def test_violation_applies_plan_rules_without_the_database():
+    plan = Plan(name='P', price=10, day_rule=PlanDayRule.WEEKDAYS_ONLY, min_days_between_appointments=7, weekly_limit=2)
+    monday = datetime(2026, 2, 16, 10)
+    assert PlanPolicyService.violation(plan, monday, 1, None) is None
+    assert 'dias úteis' in PlanPolicyService.violation(plan, datetime(2026, 2, 21, 10), 0, None)
+    assert 'Limite semanal' in PlanPolicyService.violation(plan, monday, 2, None)
+    assert 'Intervalo' in PlanPolicyService.violation(plan, monday, 0, monday - timedelta(days=3))
+
+
+def test_validate_many_counts_earlier_batch_bookings_toward_weekly_limit():
+    s = setup_session()
+    c = subscribed_client(s, day_rule=PlanDayRule.WEEKDAYS_ONLY, min_days_between_appointments=0, weekly_limit=2)
+    s.add(Appointment(client_id=c.id, appointment_date_time=datetime(2026, 3, 2, 9, 0), service='Corte',
+                      status=AppointmentStatus.SCHEDULED))
+    s.commit()
+
+    checks = PlanPolicyService(s).validate_many(c, [
+        datetime(2026, 3, 3, 10, 0),   # 2º da semana: ok
+        datetime(2026, 3, 4, 10, 0),   # 3º da semana: estoura
+        datetime(2026, 3, 7, 10, 0),   # sábado
+        datetime(2026, 3, 9, 10, 0),   # semana seguinte
+    ])
+    assert [c.error for c in checks] == [None, 'Limite semanal do plano atingido.', 'Este plano permite somente dias úteis.', None]
+
+
+def test_validate_many_without_plan_rejects_everything():
+    s = setup_session()
+    c = Client(full_name='D', email='d@a.com', phone='123')
+    s.add(c)
+    s.commit()
+    checks = PlanPolicyService(s).validate_many(c, [datetime(2026, 3, 3, 10, 0), datetime(2026, 3, 4, 10, 0)])
+    assert {c.error for c in checks} == {'Cliente sem plano ativo.'}
+
+
+def test_book_many_inserts_accepted_series_and_updates_week_counts():
+    s = setup_session()
+    c = subscribed_client(s, day_rule=PlanDayRule.ANY_DAY, min_days_between_appointments=0, weekly_limit=1)
+    first = datetime.now().replace(microsecond=0) + timedelta(days=1)
+    series = BookingService.recurrence(first, 3, (first + timedelta(days=27)).date())
+    statements = []
+    event.listen(s.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    results = BookingService(s).book_many(c, series, 'Corte')
+    s.commit()
+
+    accepted = [r.when for r in results if r.ok]
+    assert len(series) == 10
+    assert 0 < len(accepted) < len(series)
+    assert len([st for st in statements if st.startswith('INSERT INTO appointments')]) == 1
+    stored = [a.appointment_date_time for a in s.query(Appointment).order_by(Appointment.appointment_date_time)]
+    assert stored == accepted
+    stats = VisitStatsService(s)
+    assert all(stats.scheduled_in_week(c.id, when) == 1 for when in accepted)
+    assert stats.verify() == []
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import logging
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from app.db import ReadOnlySession, ReadOnlySessionError, get_session
+from app.instrumentation import QueryBudgetExceeded, fingerprint
+from app.models import Appointment, AppointmentStatus, Client
+
+
+def setup_app(tmp_path, **config):
+    return create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off',
+                       **config})
+
+
+def seed_appointments(app, total):
+    with app.app_context():
+        s = get_session()
+        c = Client(full_name='Ana', email='ana@a.com', phone='123')
+        s.add(c)
+        s.flush()
+        for i in range(total):
+            s.add(Appointment(client_id=c.id, appointment_date_time=datetime(2026, 3, 1, 9) + timedelta(days=i),
+                              service='Corte', status=AppointmentStatus.DONE))
+        s.commit()
+
+
+def test_fingerprint_normalizes_literals_and_in_lists():
+    a = fingerprint("SELECT * FROM clients WHERE id IN (?, ?, ?) AND name = 'Ana'")
+    b = fingerprint('SELECT *  FROM clients\n WHERE id IN (?, ?) AND name = \'Bia\'')
+    assert a == b == 'SELECT * FROM clients WHERE id IN (?) AND name = ?'
+
+
+def test_response_reports_query_headers(tmp_path):
+    app = setup_app(tmp_path)
+    seed_appointments(app, 12)
+    response = app.test_client().get('/appointments')
+    assert response.status_code == 200
+    assert int(response.headers['X-DB-Queries']) >= 1
+    assert response.headers['X-DB-Repeated'] == '0'
+    assert float(response.headers['X-DB-Time-Ms']) >= 0
+
+
+def test_strict_mode_fails_route_over_budget(tmp_path):
+    app = setup_app(tmp_path, QUERY_BUDGET=2, QUERY_BUDGET_STRICT=True)
+    seed_appointments(app, 3)
+    with pytest.raises(QueryBudgetExceeded, match='orçamento 2'):
+        app.test_client().get('/clients/1')
+
+
+def test_get_requests_use_read_only_session(tmp_path):
+    app = setup_app(tmp_path)
+    with app.test_request_context('/clients', method='GET'):
+        s = get_session()
+        assert isinstance(s, ReadOnlySession)
+        s.add(Client(full_name='Bia', email='bia@b.com', phone='1'))
+        with pytest.raises(ReadOnlySessionError):
+            s.flush()
+    with app.test_request_context('/clients/new', method='POST'):
+        assert not isinstance(get_session(), ReadOnlySession)
+
+
+def count_statements(app):
+    statements = []
+    with app.app_context():
+        event.listen(get_session().get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_write_headers_count_the_commit_flush(tmp_path):
+    app = setup_app(tmp_path)
+    statements = count_statements(app)
+    response = app.test_client().post('/clients/new', data={'full_name': 'Bia', 'email': 'bia@b.com', 'phone': '1'})
+    assert response.status_code == 302
+    assert any(sql.startswith('INSERT INTO clients') for sql in statements)
+    assert int(response.headers['X-DB-Queries']) == len(statements)
+
+
+def test_streamed_page_is_accounted_when_the_body_finishes(tmp_path, caplog):
+    app = setup_app(tmp_path, QUERY_BUDGET=1)
+    seed_appointments(app, 3)
+    statements = count_statements(app)
+    with caplog.at_level(logging.DEBUG, logger='app.instrumentation'):
+        response = app.test_client().get('/clients/1')
+        assert response.content_length is None and 'queries=' not in caplog.text
+        response.get_data()
+        response.close()
+    assert f'GET /clients/1 queries={len(statements)} ' in caplog.text
+    assert f'executou {len(statements)} queries (orçamento 1)' in caplog.text
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app import create_app
+from app.db import get_session
+from app.models import Appointment, AppointmentStatus, Client
+
+
+def setup_app(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off'})
+    with app.app_context():
+        s = get_session()
+        s.execute(insert(Client), [{'id': i, 'full_name': f'Cliente {i}', 'email': f'c{i}@x.com', 'phone': str(i),
+                                    'age': 20 + i} for i in range(1, 8)])
+        base = datetime(2026, 3, 2, 9)
+        s.execute(insert(Appointment), [
+            {'client_id': 1 + i % 3, 'appointment_date_time': base + timedelta(days=i // 2), 'service': 'Corte',
+             'status': AppointmentStatus.DONE if i % 2 else AppointmentStatus.SCHEDULED} for i in range(10)])
+        s.commit()
+    return app
+
+
+def test_cursor_pagination_walks_every_row_once_with_selected_fields(tmp_path):
+    client = setup_app(tmp_path).test_client()
+    seen, cursor = [], None
+    while True:
+        body = client.get('/api/v1/clients', query_string={'fields': 'id,email', 'limit': 3,
+                                                           **({'cursor': cursor} if cursor else {})}).get_json()
+        seen.extend(body['data'])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert [row['id'] for row in seen] == list(range(1, 8))
+    assert seen[0] == {'id': 1, 'email': 'c1@x.com'}
+
+
+def test_appointments_filters_join_and_datetime_cursor(tmp_path):
+    client = setup_app(tmp_path).test_client()
+    first = client.get('/api/v1/appointments?status=scheduled&start=2026-03-03&limit=2'
+                       '&fields=id,appointment_date_time,client_name,status').get_json()
+    assert first['data'][0] == {'id': 3, 'appointment_date_time': '2026-03-03T09:00:00',
+                                'client_name': 'Cliente 3', 'status': 'SCHEDULED'}
+    rest = client.get(f"/api/v1/appointments?status=scheduled&start=2026-03-03&cursor={first['next_cursor']}").get_json()
+    assert [row['id'] for row in first['data'] + rest['data']] == [3, 5, 7, 9]
+    assert rest['next_cursor'] is None
+
+
+def test_plans_and_subscriptions_serialize_decimals_and_dates(tmp_path):
+    app = setup_app(tmp_path)
+    client = app.test_client()
+    plans = client.get('/api/v1/plans?active=true').get_json()['data']
+    assert plans and isinstance(plans[0]['price'], str) and plans[0]['day_rule'] in ('ANY_DAY', 'WEEKDAYS_ONLY')
+    client.post('/clients/1/subscription', data={'plan_id': plans[0]['id']})
+    subs = client.get('/api/v1/subscriptions?fields=client_name,plan_name,start_date').get_json()['data']
+    assert subs and subs[0]['client_name'] == 'Cliente 1' and subs[0]['plan_name'] == plans[0]['name']
+
+
+def test_invalid_parameters_return_400(tmp_path):
+    client = setup_app(tmp_path).test_client()
+    for url in ('/api/v1/clients?fields=id,senha', '/api/v1/clients?nope=1', '/api/v1/clients?age_min=x',
+                '/api/v1/appointments?cursor=lixo', '/api/v1/appointments?status=talvez'):
+        response = client.get(url)
+        assert response.status_code == 400, url
+        assert response.get_json()['error']
+
+
+def test_unchanged_listing_answers_304(tmp_path):
+    client = setup_app(tmp_path).test_client()
+    first = client.get('/api/v1/appointments')
+    assert client.get('/api/v1/appointments', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
@@ -0,0 +1,140 @@
+from datetime import date, datetime
+import json
+import time
+
+import pytest
+
+from app import create_app, occupancy
+from app.archive import AppointmentArchiver
+from app.db import get_session
+from app.models import (Appointment, AppointmentStatus, Client, Plan, PlanDayRule, ReportJob, ReportStatus,
+                        Subscription)
+from app.reports import ReportError, ReportService, execute
+
+PERIOD = {'start': '2025-01-01', 'end': '2025-02-28'}
+
+
+def setup_app(tmp_path, **config):
+    app = create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off',
+                      'REPORT_WORKERS': 1, **config})
+    with app.app_context():
+        s = get_session()
+        s.add_all([Plan(id=101, name='Ouro', price=100, day_rule=PlanDayRule.ANY_DAY),
+                   Plan(id=102, name='Prata', price='49.90', day_rule=PlanDayRule.ANY_DAY)])
+        for i, (started, plan) in enumerate([(date(2025, 1, 10), 101), (date(2025, 1, 20), 102),
+                                             (date(2025, 2, 1), 102)], start=1):
+            s.add(Client(id=i, full_name=f'C{i}', email=f'c{i}@x.com', phone='1'))
+            s.add(Subscription(client_id=i, plan_id=plan, start_date=started, active=True))
+        s.flush()
+        s.add_all([Appointment(client_id=c, appointment_date_time=at, service='Corte', status=status)
+                   for c, at, status in [(1, datetime(2025, 1, 15, 10), AppointmentStatus.DONE),
+                                         (1, datetime(2025, 1, 20, 10), AppointmentStatus.CANCELED),
+                                         (3, datetime(2025, 1, 22, 10), AppointmentStatus.NO_SHOW),
+                                         (1, datetime(2025, 2, 12, 10), AppointmentStatus.DONE),
+                                         (2, datetime(2025, 2, 19, 10), AppointmentStatus.DONE),
+                                         (2, datetime(2025, 2, 25, 10), AppointmentStatus.SCHEDULED)]])
+        s.commit()
+    return app
+
+
+def run(app, kind, params):
+    with app.app_context():
+        s = get_session()
+        job, queued = ReportService(s).submit(kind, params)
+        assert queued
+        assert execute(s.get_bind(), job.id) == ReportStatus.DONE
+        s.refresh(job)
+        return job.result
+
+
+def test_reports_compute_revenue_rates_and_cohorts(tmp_path):
+    app = setup_app(tmp_path)
+    revenue = json.loads(run(app, 'revenue_by_plan', {}))
+    rows = {row[0]: row for row in revenue['rows']}
+    assert rows['Ouro'] == ['Ouro', '100.00', True, 1, '100.00']
+    assert rows['Prata'] == ['Prata', '49.90', True, 2, '99.80']
+    assert rows['Total'][3:] == [3, '199.80']
+
+    rates = json.loads(run(app, 'attendance_rates', PERIOD))
+    assert rates['rows'] == [['2025-01', 3, 1, 1, 1, 33.3, 33.3], ['2025-02', 2, 2, 0, 0, 0.0, 0.0]]
+
+    cohorts = json.loads(run(app, 'retention_cohorts', {**PERIOD, 'months': '3'}))
+    assert cohorts['columns'] == ['coorte', 'clientes', 'm0', 'm1', 'm2']
+    assert cohorts['rows'] == [['2025-01', 2, 100.0, 50.0, 0.0], ['2025-02', 1, 0.0, 0.0, 0.0]]
+
+
+def test_identical_requests_share_a_job_until_the_data_changes(tmp_path):
+    app = setup_app(tmp_path)
+    with app.app_context():
+        s = get_session()
+        service = ReportService(s)
+        first, queued = service.submit('attendance_rates', PERIOD)
+        again, queued_again = service.submit('attendance_rates', {'end': '2025-02-28', 'start': '2025-01-01'})
+        assert queued and not queued_again and again.id == first.id
+        execute(s.get_bind(), first.id)
+        s.expire_all()
+        cached, queued = service.submit('attendance_rates', PERIOD)
+        assert cached.id == first.id and cached.status == ReportStatus.DONE and not queued
+        other, queued = service.submit('revenue_by_plan', {})
+        assert queued and other.id != first.id
+
+        first_id = first.id
+        s.add(Appointment(client_id=1, appointment_date_time=datetime(2025, 1, 28, 10), service='Corte',
+                          status=AppointmentStatus.NO_SHOW))
+        s.commit()
+        fresh, queued = service.submit('attendance_rates', PERIOD)
+        assert queued and fresh.id != first_id
+        assert s.get(ReportJob, first_id) is None   # resultado da versão anterior descartado
+        with pytest.raises(ReportError, match='start'):
+            service.submit('attendance_rates', {'start': '2025-13-01'})
+
+
+def test_api_runs_the_report_in_the_process_pool(tmp_path):
+    app = setup_app(tmp_path)
+    client = app.test_client()
+    try:
+        response = client.post('/api/reports', json={'kind': 'retention_cohorts', 'params': {**PERIOD, 'months': 2}})
+        assert response.status_code == 202
+        status_url = response.headers['Location']
+        deadline = time.monotonic() + 60
+        while (body := client.get(status_url).get_json())['status'] in ('PENDING', 'RUNNING'):
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+        assert body['status'] == 'DONE'
+        csv = client.get(body['download_url']).get_data(as_text=True)
+        assert csv.splitlines() == ['coorte,clientes,m0,m1', '2025-01,2,100.0,50.0', '2025-02,1,0.0,0.0']
+        repeated = client.post('/api/reports', json={'kind': 'retention_cohorts',
+                                                     'params': {**PERIOD, 'months': 2}})
+        assert repeated.status_code == 200 and repeated.get_json()['id'] == body['id']
+        assert client.post('/api/reports', json={'kind': 'nada'}).status_code == 400
+        assert 'Baixar CSV' in client.get('/reports').get_data(as_text=True)
+    finally:
+        app.extensions['report_queue'].shutdown()
+
+
+def test_archiving_and_backfill_invalidate_reports_that_read_those_tables(tmp_path):
+    app = setup_app(tmp_path)
+    with app.app_context():
+        s = get_session()
+        engine = s.get_bind()
+        service = ReportService(s)
+
+        def fresh_run(kind, params):
+            job, queued = service.submit(kind, params)
+            if queued:
+                execute(engine, job.id)
+                s.expire_all()
+            return queued
+
+        assert fresh_run('attendance_rates', PERIOD) and fresh_run('retention_cohorts', PERIOD)
+        revenue, _ = service.submit('revenue_by_plan', {})
+        s.commit()
+
+        # move os encerrados para appointments_archive: appointments e o arquivo mudam de versão
+        assert AppointmentArchiver(engine, horizon_days=30).run().moved == 5
+        assert fresh_run('attendance_rates', PERIOD) and fresh_run('retention_cohorts', PERIOD)
+        assert not fresh_run('attendance_rates', PERIOD)
+
+        assert occupancy.backfill(engine) is not None
+        assert fresh_run('attendance_rates', PERIOD) and not fresh_run('retention_cohorts', PERIOD)
+        assert service.submit('revenue_by_plan', {})[0].id == revenue.id
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -44,3 +44,23 @@ def test_estimator_without_history_uses_heuristic():
     estimate = ReturnEstimatorService(s).estimate_for(c)
     assert 'Heurística por idade' in estimate.reasoning
     assert estimate.min_days > 0
+
+
+def test_estimate_for_many_matches_per_client_estimates():
+    s = setup_session()
+    clients = [Client(full_name=f'C{i}', email=f'c{i}@a.com', phone='123', age=age)
+               for i, age in enumerate([None, 15, 30, 60, 40])]
+    s.add_all(clients)
+    s.flush()
+    histories = [[], [1, 9], [1, 15, 29], [1, 3, 20, 41, 70], [2, 2, 30]]
+    for c, days in zip(clients, histories):
+        for d in days:
+            s.add(Appointment(client_id=c.id, appointment_date_time=datetime(2026, 1, 1, 8 + d % 10, 0) + timedelta(days=d),
+                              service='Corte', status=AppointmentStatus.DONE))
+        s.add(Appointment(client_id=c.id, appointment_date_time=datetime(2026, 6, 1, 10, 0), service='Corte',
+                          status=AppointmentStatus.SCHEDULED))
+    s.commit()
+
+    svc = ReturnEstimatorService(s)
+    batch = svc.estimate_for_many([c.id for c in clients] + [clients[0].id])
+    assert batch == {c.id: svc.estimate_for(c) for c in clients}
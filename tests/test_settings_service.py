@@ -0,0 +1,88 @@
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base
+from app.services import SettingsCache, SettingsService
+
+
+def setup_sessions():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    s = Session()
+    SettingsService(s).ensure_defaults()
+    s.commit()
+    return engine, Session
+
+
+def count_queries(engine):
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_reads_are_served_from_cache():
+    engine, Session = setup_sessions()
+    s = Session()
+    assert SettingsService(s).get(SettingsService.EST_TARGET_CM, 'x') == '1.2'
+    statements = count_queries(engine)
+    for _ in range(10):
+        assert SettingsService(s).get(SettingsService.EMAIL_MODE, 'x') == 'TEST'
+    assert SettingsService(s).get('missing', 'default') == 'default'
+    assert statements == []
+
+
+def test_set_is_visible_in_session_and_invalidates_on_commit():
+    engine, Session = setup_sessions()
+    s = Session()
+    svc = SettingsService(s)
+    assert svc.get(SettingsService.EMAIL_MODE, 'x') == 'TEST'
+    svc.set(SettingsService.EMAIL_MODE, 'SMTP')
+    assert svc.get(SettingsService.EMAIL_MODE, 'x') == 'SMTP'
+    assert SettingsService(Session()).get(SettingsService.EMAIL_MODE, 'x') == 'TEST'
+    s.commit()
+    assert SettingsService(Session()).get(SettingsService.EMAIL_MODE, 'x') == 'SMTP'
+    assert SettingsCache.for_engine(engine).version == '1'
+
+
+def test_rollback_discards_pending_value():
+    engine, Session = setup_sessions()
+    s = Session()
+    SettingsService(s).set(SettingsService.EMAIL_MODE, 'SMTP')
+    s.rollback()
+    assert SettingsService(s).get(SettingsService.EMAIL_MODE, 'x') == 'TEST'
+
+
+def test_version_bump_from_other_process_reloads_after_ttl():
+    engine, Session = setup_sessions()
+    cache = SettingsCache.for_engine(engine)
+    cache.ttl = 0
+    s = Session()
+    assert SettingsService(s).get(SettingsService.EMAIL_FROM, 'x') == 'no-reply@barbearia.local'
+
+    statements = count_queries(engine)
+    assert SettingsService(s).get(SettingsService.EMAIL_FROM, 'x') == 'no-reply@barbearia.local'
+    assert len(statements) == 1  # só a checagem de versão
+
+    # outro worker grava direto no banco, sem passar por este cache
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE app_settings SET setting_value = 'loja@barbearia.local' WHERE setting_key = 'email.from'"))
+        conn.execute(text("UPDATE app_settings SET setting_value = '7' WHERE setting_key = 'settings.version'"))
+    s.rollback()
+    assert SettingsService(s).get(SettingsService.EMAIL_FROM, 'x') == 'loja@barbearia.local'
+
+
+def test_read_sessions_on_an_option_engine_share_the_cache():
+    # no PostgreSQL as leituras usam engine.execution_options(postgresql_readonly=True)
+    engine, Session = setup_sessions()
+    ReadSession = sessionmaker(bind=engine.execution_options(isolation_level='SERIALIZABLE'), future=True)
+    cache = SettingsCache.for_engine(engine)
+    cache.ttl = 3600
+    reader = SettingsService(ReadSession())
+    assert reader.cache is cache
+    assert reader.get(SettingsService.EMAIL_MODE, 'x') == 'TEST'
+
+    s = Session()
+    SettingsService(s).set(SettingsService.EMAIL_MODE, 'SMTP')
+    s.commit()
+    assert SettingsService(ReadSession()).get(SettingsService.EMAIL_MODE, 'x') == 'SMTP'
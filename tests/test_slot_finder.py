@@ -0,0 +1,191 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Appointment, AppointmentStatus, Base, Client, Plan, PlanDayRule, Subscription
+from app.services import BookingService, SettingsService, ShopHours, SlotFinderService
+from app.visit_stats import VisitStatsService, week_start
+
+
+def setup_session(engine=None):
+    engine = engine or create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    s = Session()
+    SettingsService(s).ensure_defaults()
+    for key, value in ((SettingsService.SHOP_CHAIRS, '2'), (SettingsService.SHOP_OPENS_AT, '09:00'),
+                       (SettingsService.SHOP_CLOSES_AT, '11:00'), (SettingsService.SHOP_CLOSED_WEEKDAYS, '6')):
+        SettingsService(s).set(key, value)
+    s.commit()
+    return s, Session
+
+
+def subscribe(s, name, day_rule=PlanDayRule.ANY_DAY, min_days=0, weekly=999):
+    c = Client(full_name=name, email=f'{name.lower()}@a.com', phone='1')
+    p = Plan(name=f'Plano {name}', price=10, day_rule=day_rule, min_days_between_appointments=min_days,
+             weekly_limit=weekly)
+    s.add_all([c, p])
+    s.flush()
+    s.add(Subscription(client_id=c.id, plan_id=p.id, active=True))
+    s.commit()
+    return c
+
+
+def next_monday():
+    return week_start(datetime.now()) + timedelta(days=14)
+
+
+def test_shop_hours_slots_end_before_closing():
+    hours = ShopHours(2, time(9, 15), time(11, 0), frozenset({6}))
+    monday = next_monday()
+    assert [w.time() for w in hours.slots(monday)] == [time(9, 30), time(10, 0), time(10, 30)]
+    assert hours.slots(monday + timedelta(days=6)) == []
+
+
+def test_free_slots_follow_plan_rules_and_chairs_in_fixed_queries():
+    s, _ = setup_session()
+    monday = next_monday()
+    weekdays = subscribe(s, 'Ana', PlanDayRule.WEEKDAYS_ONLY, weekly=1)
+    other = subscribe(s, 'Bia')
+    at = lambda day, hour, minute=0: datetime.combine(monday + timedelta(days=day), time(hour, minute))
+    # Ana já tem horário na terça da semana seguinte: aquela semana está cheia para ela
+    BookingService(s).book(weekdays, Appointment(client_id=weekdays.id, appointment_date_time=at(8, 9),
+                                                 service='Corte', status=AppointmentStatus.SCHEDULED))
+    # segunda 9:00 lotada (duas cadeiras)
+    for c in (other, subscribe(s, 'Caio')):
+        BookingService(s).book(c, Appointment(client_id=c.id, appointment_date_time=at(0, 9),
+                                              service='Corte', status=AppointmentStatus.SCHEDULED))
+    s.commit()
+
+    statements = []
+    event.listen(s.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    slots = SlotFinderService(s).next_slots(weekdays, monday, monday + timedelta(days=29), limit=100)
+
+    assert len(statements) <= 5
+    assert slots[0].start == at(0, 9, 30) and slots[0].free_chairs == 2
+    assert all(slot.start.weekday() < 5 for slot in slots)
+    assert not any(week_start(slot.start) == monday + timedelta(days=7) for slot in slots)
+    assert all(time(9) <= slot.start.time() <= time(10, 30) for slot in slots)
+
+
+def test_free_slots_respect_min_days_since_last_visit():
+    s, _ = setup_session()
+    monday = next_monday()
+    c = subscribe(s, 'Duda', min_days=10)
+    s.add(Appointment(client_id=c.id, appointment_date_time=datetime.combine(monday, time(9)), service='Corte',
+                      status=AppointmentStatus.DONE))
+    s.commit()
+    slots = SlotFinderService(s).next_slots(c, monday, monday + timedelta(days=20), limit=1)
+    assert slots[0].start == datetime.combine(monday + timedelta(days=10), time(9))
+
+
+def test_concurrent_bookings_never_exceed_chairs(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chairs.db'}", future=True, connect_args={'timeout': 30})
+    s, Session = setup_session(engine)
+    client_ids = [subscribe(s, f'C{i}').id for i in range(6)]
+    when = datetime.combine(next_monday(), time(10, 10))
+
+    def book(client_id):
+        session = Session()
+        try:
+            BookingService(session).book(session.get(Client, client_id), Appointment(
+                client_id=client_id, appointment_date_time=when, service='Corte', status=AppointmentStatus.SCHEDULED))
+            session.commit()
+            return True
+        except ValueError:
+            session.rollback()
+            return False
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        assert sum(pool.map(book, client_ids)) == 2
+    assert VisitStatsService(Session()).verify() == []
+
+
+def test_refused_chair_releases_week_reservation():
+    s, _ = setup_session()
+    when = datetime.combine(next_monday(), time(9))
+    clients = [subscribe(s, name, weekly=1) for name in ('Eva', 'Fabi', 'Gil')]
+    for c in clients[:2]:
+        BookingService(s).book(c, Appointment(client_id=c.id, appointment_date_time=when, service='Corte',
+                                              status=AppointmentStatus.SCHEDULED))
+    s.commit()
+    with pytest.raises(ValueError, match='cadeira'):
+        BookingService(s).book(clients[2], Appointment(client_id=clients[2].id, appointment_date_time=when,
+                                                       service='Corte', status=AppointmentStatus.SCHEDULED))
+    s.commit()  # como o close_session da rota: a recusa não pode deixar a semana reservada
+    assert VisitStatsService(s).scheduled_in_week(clients[2].id, when) == 0
+    assert VisitStatsService(s).verify() == []
+
+
+def test_edit_into_a_full_slot_is_refused_and_a_free_one_moves_the_counters():
+    s, _ = setup_session()
+    monday = next_monday()
+    at = lambda hour, minute=0: datetime.combine(monday, time(hour, minute))
+    clients = [subscribe(s, name) for name in ('Hugo', 'Iris', 'Juca')]
+    booked = []
+    for c, when in zip(clients, (at(9), at(9), at(10))):
+        booked.append(Appointment(client_id=c.id, appointment_date_time=when, service='Corte',
+                                  status=AppointmentStatus.SCHEDULED))
+        BookingService(s).book(c, booked[-1])
+    s.commit()
+
+    moving = booked[2]
+    moving.appointment_date_time = at(9, 15)
+    with pytest.raises(ValueError, match='cadeira'):
+        BookingService(s).reschedule(moving)
+    s.rollback()
+    assert VisitStatsService(s).scheduled_by_slot(at(9), at(11)) == {at(9): 2, at(10): 1}
+
+    moving.appointment_date_time = at(10, 30)
+    BookingService(s).reschedule(moving)
+    s.commit()
+    assert VisitStatsService(s).scheduled_by_slot(at(9), at(11)) == {at(9): 2, at(10, 30): 1}
+    assert VisitStatsService(s).verify() == []
+
+
+def test_reactivating_into_a_full_slot_or_week_is_refused():
+    s, _ = setup_session()
+    when = datetime.combine(next_monday(), time(9))
+    kelly, lia, mel = (subscribe(s, name, weekly=1) for name in ('Kelly', 'Lia', 'Mel'))
+    canceled = Appointment(client_id=mel.id, appointment_date_time=when, service='Corte',
+                           status=AppointmentStatus.CANCELED)
+    s.add(canceled)
+    for c in (kelly, lia):
+        BookingService(s).book(c, Appointment(client_id=c.id, appointment_date_time=when, service='Corte',
+                                              status=AppointmentStatus.SCHEDULED))
+    s.commit()
+
+    canceled.status = AppointmentStatus.SCHEDULED
+    with pytest.raises(ValueError, match='cadeira'):
+        BookingService(s).reschedule(canceled)
+    s.rollback()
+    assert VisitStatsService(s).scheduled_by_slot(when, when + timedelta(hours=1)) == {when: 2}
+    assert VisitStatsService(s).scheduled_in_week(mel.id, when) == 0
+
+    # em outro horário cabe, mas a semana da Mel passa a estar cheia para uma segunda reativação
+    canceled.status, canceled.appointment_date_time = AppointmentStatus.SCHEDULED, when + timedelta(hours=1)
+    BookingService(s).reschedule(canceled)
+    s.add(Appointment(client_id=mel.id, appointment_date_time=when + timedelta(hours=1, minutes=30),
+                      service='Corte', status=AppointmentStatus.NO_SHOW))
+    s.commit()
+    no_show = s.query(Appointment).filter_by(status=AppointmentStatus.NO_SHOW).one()
+    no_show.status = AppointmentStatus.SCHEDULED
+    with pytest.raises(ValueError, match='semanal'):
+        BookingService(s).reschedule(no_show)
+    s.rollback()
+    assert VisitStatsService(s).scheduled_in_week(mel.id, when) == 1
+    assert VisitStatsService(s).verify() == []
+
+
+def test_booking_reads_the_plan_once():
+    s, _ = setup_session()
+    c = subscribe(s, 'Nina')
+    statements = []
+    event.listen(s.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    BookingService(s).book(c, Appointment(client_id=c.id, appointment_date_time=datetime.combine(next_monday(), time(9)),
+                                          service='Corte', status=AppointmentStatus.SCHEDULED))
+    assert sum('FROM plans' in sql for sql in statements) == 1
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app import create_app
+from app.db import get_session
+from app.models import Appointment, AppointmentStatus, Client
+from app.templating import compile_templates
+
+
+def setup_app(tmp_path, **config):
+    return create_app({'TESTING': True, 'DATABASE_URL': f"sqlite:///{tmp_path / 'test.db'}", 'EMAIL_WORKER': 'off',
+                       'TEMPLATE_CACHE_DIR': str(tmp_path), 'STREAM_BATCH_SIZE': 50, **config})
+
+
+def seed(app, clients=300, visits=400):
+    with app.app_context():
+        s = get_session()
+        s.execute(insert(Client), [{'id': i, 'full_name': f'Cliente {i:04d}', 'email': f'c{i}@x.com', 'phone': '1'}
+                                   for i in range(1, clients + 1)])
+        if visits:
+            s.execute(insert(Appointment), [
+                {'client_id': 1, 'service': f'Corte {i}', 'status': AppointmentStatus.DONE,
+                 'appointment_date_time': datetime(2026, 1, 1, 9) + timedelta(days=i)} for i in range(visits)])
+        s.commit()
+
+
+def test_large_pages_stream_the_same_html_they_render(tmp_path):
+    streamed_app = setup_app(tmp_path)
+    seed(streamed_app)
+    rendered_app = setup_app(tmp_path, STREAM_TEMPLATES=False)
+    for url in ('/clients', '/clients/1', '/appointments'):
+        streamed = streamed_app.test_client().get(url)
+        rendered = rendered_app.test_client().get(url)
+        # resposta em streaming não tem tamanho conhecido de antemão
+        assert streamed.content_length is None and rendered.content_length
+        assert streamed.get_data(as_text=True) == rendered.get_data(as_text=True)
+    page = streamed_app.test_client().get('/clients/1').get_data(as_text=True)
+    assert page.count('<td>Corte') == 400 and page.index('Corte 399') < page.index('Corte 0<')
+    assert streamed_app.test_client().get('/clients').get_data(as_text=True).count('Detalhes</a>') == 300
+
+
+def test_pending_flash_is_rendered_whole_and_consumed(tmp_path):
+    app = setup_app(tmp_path)
+    seed(app, clients=3, visits=0)
+    client = app.test_client()
+    client.post('/clients/3/delete')
+    page = client.get('/clients')
+    assert page.content_length and 'Cliente removido.' in page.get_data(as_text=True)
+    again = client.get('/clients')
+    assert again.content_length is None and 'Cliente removido.' not in again.get_data(as_text=True)
+
+
+def test_bytecode_cache_lets_a_new_worker_skip_compilation(tmp_path):
+    assert compile_templates(setup_app(tmp_path)) >= 10
+    assert any(path.name.startswith('__jinja2_') for path in tmp_path.iterdir())
+
+    fresh = setup_app(tmp_path)
+    fresh.jinja_env.compile = None   # qualquer compilação quebraria
+    fresh.jinja_env.get_template('clients/list.html')
+    fresh.jinja_env.get_template('appointments/list.html')
@@ -0,0 +1,93 @@
+from datetime import date, datetime
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Client, Appointment, AppointmentStatus
+from app.visit_stats import VisitStatsService
+
+
+def setup_session():
+    engine = create_engine('sqlite:///:memory:', future=True)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    return Session()
+
+
+def add(s, client, when, status):
+    a = Appointment(client_id=client.id, appointment_date_time=when, service='Corte', status=status)
+    s.add(a)
+    return a
+
+
+def test_summary_follows_create_edit_status_and_delete():
+    s = setup_session()
+    c = Client(full_name='A', email='a@a.com', phone='123')
+    s.add(c)
+    s.flush()
+    stats = VisitStatsService(s)
+
+    first = add(s, c, datetime(2026, 1, 5, 10), AppointmentStatus.DONE)
+    middle = add(s, c, datetime(2026, 1, 20, 10), AppointmentStatus.DONE)
+    last = add(s, c, datetime(2026, 2, 3, 10), AppointmentStatus.DONE)
+    upcoming = add(s, c, datetime(2026, 3, 4, 10), AppointmentStatus.SCHEDULED)
+    s.commit()
+    visits = stats.for_client(c.id)
+    assert (visits.done_count, visits.gap_sum_days) == (3, 29)
+    assert stats.scheduled_in_week(c.id, datetime(2026, 3, 8, 18)) == 1
+
+    upcoming.status = AppointmentStatus.DONE
+    s.commit()
+    assert stats.scheduled_in_week(c.id, datetime(2026, 3, 2)) == 0
+    assert stats.for_client(c.id).last_done_at == datetime(2026, 3, 4, 10)
+
+    upcoming.appointment_date_time = datetime(2026, 2, 25, 9)
+    s.delete(first)
+    s.commit()
+    visits = stats.for_client(c.id)
+    assert visits.done_count == 3
+    assert (visits.first_done_at, visits.last_done_at) == (datetime(2026, 1, 20, 10), datetime(2026, 2, 25, 9))
+
+    middle.status = AppointmentStatus.CANCELED
+    last.status = AppointmentStatus.SCHEDULED
+    s.commit()
+    assert stats.for_client(c.id).done_count == 1
+    assert stats.scheduled_in_week(c.id, datetime(2026, 2, 2)) == 1
+    assert stats.verify() == []
+
+
+def test_deleting_a_client_releases_their_live_appointments():
+    s = setup_session()
+    gone, stays = Client(full_name='A', email='a@a.com', phone='1'), Client(full_name='B', email='b@b.com', phone='2')
+    s.add_all([gone, stays])
+    s.flush()
+    for c in (gone, stays):
+        add(s, c, datetime(2026, 3, 4, 10), AppointmentStatus.SCHEDULED)
+        add(s, c, datetime(2026, 2, 3, 10), AppointmentStatus.DONE)
+    s.commit()
+
+    s.delete(gone)
+    s.commit()
+    stats = VisitStatsService(s)
+    assert s.query(Appointment).filter_by(client_id=gone.id).count() == 0
+    assert stats.scheduled_in_week(stays.id, datetime(2026, 3, 4)) == 1
+    assert stats.for_client(gone.id) is None
+    assert stats.verify() == []
+
+
+def test_rebuild_recovers_from_writes_that_bypass_the_orm():
+    s = setup_session()
+    c = Client(full_name='A', email='a@a.com', phone='123')
+    s.add(c)
+    s.commit()
+    s.execute(insert(Appointment), [
+        {'client_id': c.id, 'appointment_date_time': datetime(2026, 1, d, 10), 'service': 'Corte',
+         'status': AppointmentStatus.DONE if d < 20 else AppointmentStatus.SCHEDULED}
+        for d in (2, 9, 16, 27)
+    ])
+    stats = VisitStatsService(s)
+    problems = stats.verify()
+    assert ('week', (c.id, date(2026, 1, 26)), 1, None) in problems
+
+    stats.rebuild()
+    assert stats.verify() == []
+    assert stats.for_client(c.id).done_count == 3